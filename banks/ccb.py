@@ -2,27 +2,30 @@ import pathlib as pb
 from collections import Counter
 from corelibs.process import *
 
-def _validate_dir(dir_path: pb.Path) -> list:
-    """校验目录有效性，返回待处理文件列表"""
-      # 分析是否存在因为超过9999条而分文件保存的流水文件
+def _validate_dir(dir_path: pb.Path, allow_split: bool=False) -> list:
+    """校验目录有效性，返回待处理文件列表；allow_split为假时不允许存在因为超过9999条而分文件保存的流水文件"""
     if not dir_path.is_dir():
         raise Exception("传入的路径不是目录，请传入目录路径，或使用单文件分析") 
     _file_names = list(dir_path.glob('*.xlsx')) # 找到目录中所有的excel文件（不含子目录）
+    if allow_split: # 分开保存的同账户流水文件按配置中的split_files合并处理
+        return _file_names
      # 检查是否存在超过9999条的数据（文件名第二字段的数字一样）
     _d, _c = Counter(map(lambda x: x.name.split('_')[1], _file_names)).most_common(1)[0]
     if _c > 1: 
-        raise Exception(f'目录中包含分开保存的同账户流水文件，需要手动合并，文件名第二字段为{_d}')
+        raise Exception(f'目录中包含分开保存的同账户流水文件，需要手动合并或使用第二版处理，文件名第二字段为{_d}')
     return _file_names
 
-def process_dir_ccb_branch_v1(dir_path: pb.Path, output_dir: pb.Path, doc_No: str=None) -> None:
-    """分析建设银行网点结果目录第一版，不分账户流水混合处理，无法根据账户信息更新流水中的账号字段"""
+def process_dir_ccb_branch_v1(dir_path: pb.Path, output_dir: pb.Path, doc_No: str=None, **kwargs) -> None:
+    """分析建设银行网点结果目录第一版，不分账户流水混合处理，无法根据账户信息更新流水中的账号字段；
+    其他参数（如jobs、incremental、writer_workers）传给process_files_1by1"""
     #验证目录有效性
     _files = _validate_dir(dir_path)
-    return process_files_1by1(_files, output_dir, doc_No)
+    return process_files_1by1(_files, output_dir, doc_No, **kwargs)
 
-def process_dir_ccb_branch_v2(dir_path: pb.Path, output_dir: pb.Path, doc_No: str=None) -> None:
-    """分析建设银行网点结果目录第二版，根据目录特点依次处理账户和流水文件，并根据账户信息更新流水中的账号字段"""
+def process_dir_ccb_branch_v2(dir_path: pb.Path, output_dir: pb.Path, doc_No: str=None, **kwargs) -> None:
+    """分析建设银行网点结果目录第二版，根据目录特点依次处理账户和流水文件，并根据账户信息更新流水中的账号字段；
+    超过9999条分文件保存的同账户流水自动合并处理。其他参数（如jobs、on_error、incremental、writer_workers）传给process_files_accs_then_stats"""
     # 验证目录有效性
-    _files = _validate_dir(dir_path)
-    return process_files_accs_then_stats(_files, output_dir, doc_No)
+    _files = _validate_dir(dir_path, allow_split=True)
+    return process_files_accs_then_stats(_files, output_dir, doc_No, **kwargs)
     
\ No newline at end of file
@@ -8,9 +8,10 @@ def _validate_dir(dir_path: pb.Path) -> list:
     _file_names = list(filter(lambda f: not f.stem.endswith('关联子账户信息'), dir_path.glob('*.xlsx')))
     return _file_names
 
-def process_dir_yangdi(dir_path: pb.Path, output_dir: pb.Path, doc_No: str=None) -> None:
-    """分析央地协查结果目录，依次处理账户和流水文件，并根据账户信息更新流水中的账号字段"""
+def process_dir_yangdi(dir_path: pb.Path, output_dir: pb.Path, doc_No: str=None, **kwargs) -> None:
+    """分析央地协查结果目录，依次处理账户和流水文件，并根据账户信息更新流水中的账号字段；
+    其他参数（如jobs、on_error、incremental、writer_workers）传给process_files_accs_then_stats"""
     # 验证目录有效性
     _files = _validate_dir(dir_path)
-    return process_files_accs_then_stats(_files, output_dir, doc_No)
+    return process_files_accs_then_stats(_files, output_dir, doc_No, **kwargs)
     
\ No newline at end of file
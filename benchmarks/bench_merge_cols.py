@@ -0,0 +1,38 @@
+"""对比_merge_N_cols向量化实现与原逐行apply实现的耗时，并验证两者结果一致。
+用法（在项目根目录下运行）：python -m benchmarks.bench_merge_cols [行数]"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from corelibs.data import _merge_N_cols
+
+
+
+def _merge_N_cols_apply(df: pd.DataFrame, new_col: str, cols: list) -> pd.DataFrame:
+    """原逐行apply实现，作为对照"""
+    _df = df[cols].fillna('')
+    df[new_col] = _df.apply(lambda r: ' '.join(
+        filter(lambda a: a != '', dict.fromkeys(r[cols]))), axis=1)
+    df[new_col] = df[new_col].replace('', np.nan)
+    return df
+
+def make_df(rows: int, seed: int=0) -> pd.DataFrame:
+    """生成模拟央地协查客户电话列：四列电话，含空值和重复值"""
+    _rng = np.random.default_rng(seed)
+    _phones = np.array([f'1380000{i:04d}' for i in range(50)] + [None] * 20, dtype=object)
+    return pd.DataFrame({x: _rng.choice(_phones, rows) for x in ['联系手机', '住宅电话', '联系电话', '单位电话']})
+
+def main(rows: int=200000) -> None:
+    _cols = ['联系手机', '住宅电话', '联系电话', '单位电话']
+    _df = make_df(rows)
+    _t = time.perf_counter()
+    _old = _merge_N_cols_apply(_df.copy(), '电话', _cols)
+    _t_old = time.perf_counter() - _t
+    _t = time.perf_counter()
+    _new = _merge_N_cols(_df.copy(), '电话', _cols)
+    _t_new = time.perf_counter() - _t
+    pd.testing.assert_series_equal(_old['电话'], _new['电话'])
+    print(f'{rows}行：apply {_t_old:.3f}s，向量化 {_t_new:.3f}s，加速{_t_old / _t_new:.1f}倍，结果一致')
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
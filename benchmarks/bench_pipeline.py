@@ -0,0 +1,148 @@
+"""流水处理各环节的基准测试：用benchmarks.synth生成的模拟文件，分别计时read_header、parse_sheet_general、
+fill_stat_cols_by_acc、save_statements以及process_dir_yangdi、process_dir_ccb_branch_v2端到端处理，
+报告耗时、每秒行数（read_header为每秒文件数）和峰值内存。每个环节在单独的子进程中运行，峰值内存互不影响；
+准备数据（如解析账户文件）不计入耗时，但计入峰值内存，因此同时报告准备完成时的内存作为基线。
+用法（在项目根目录下运行）：
+python -m benchmarks.bench_pipeline [--rows 行数] [--banks 银行配置名 ...] [--jobs 进程数] [--json 结果文件] [--keep 目录]
+表头为xls格式的银行（天津银行、工商银行网点）需要安装xlwt生成模拟文件，未安装时这些银行报告为生成出错，其他银行照常测试"""
+import argparse
+import contextlib
+import io
+import json
+import pathlib
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from corelibs.config import load_conf, get_conf_data, set_conf_data, get_conf_obj
+from benchmarks.synth import make_case
+
+
+
+_BANKS = ['央地协查', '建设银行网点', '天津银行', '工商银行网点']
+_END_TO_END = {'央地协查': 'process_dir_yangdi', '建设银行网点': 'process_dir_ccb_branch_v2'}
+
+def _peak_rss(children: bool=False) -> int:
+    """返回本进程（或已结束子进程中最大）的峰值常驻内存字节数，无法获取时返回None"""
+    try:
+        import resource
+    except ImportError: # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return None if children else getattr(psutil.Process().memory_info(), 'peak_wset', None)
+    _rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return _rss if sys.platform == 'darwin' else _rss * 1024
+
+def _stage_read_header(case: dict, bank_name: str, output_dir: pathlib.Path):
+    from corelibs.header import read_header
+    _files = [x for _list in case['files'].values() for x in _list]
+    return len(_files), lambda: [read_header(x) for x in _files]
+
+def _stage_parse_sheet_general(case: dict, bank_name: str, output_dir: pathlib.Path):
+    from corelibs.data import parse_sheet_general
+    _file = case['files']['流水'][0]
+    return case['rows'], lambda: parse_sheet_general(_file, get_conf_obj(bank_name, '流水'))
+
+def _stage_fill_stat_cols_by_acc(case: dict, bank_name: str, output_dir: pathlib.Path):
+    from corelibs.data import parse_sheet_general
+    from corelibs.process import fill_stat_cols_by_acc
+    _conf = get_conf_obj(bank_name, '流水')
+    if not _conf.acc_rel_cols:
+        return None, None
+    _df_acc = parse_sheet_general(case['files']['账户'][0], get_conf_obj(bank_name, '账户'))
+    _df_stat = parse_sheet_general(case['files']['流水'][0], _conf)
+    return len(_df_stat), lambda: fill_stat_cols_by_acc(_df_stat, _df_acc, _conf.acc_rel_cols)
+
+def _stage_save_statements(case: dict, bank_name: str, output_dir: pathlib.Path):
+    from corelibs.data import parse_sheet_general
+    from corelibs.process import parse_statement_file, split_statements
+    from corelibs.storage import save_statements
+    _df_acc = parse_sheet_general(case['files']['账户'][0], get_conf_obj(bank_name, '账户'))
+    _df_list = split_statements(parse_statement_file(case['files']['流水'][0], bank_name, '流水', df_acc=_df_acc))
+    return sum(map(len, _df_list)), lambda: save_statements(_df_list, output_dir, bank_name, '流水')
+
+def _stage_end_to_end(case: dict, bank_name: str, output_dir: pathlib.Path):
+    if (_func_name := _END_TO_END.get(bank_name)) is None:
+        return None, None
+    import banks.yangdi, banks.ccb
+    _func = getattr(banks.yangdi if bank_name == '央地协查' else banks.ccb, _func_name)
+    get_conf_data()['base_config']['on_error'] = 'continue' # 基准测试不等待输入
+    return case['rows'] + case['acc_rows'], lambda: _func(case['dir'], output_dir)
+
+_STAGES = {
+    'read_header': _stage_read_header,
+    'parse_sheet_general': _stage_parse_sheet_general,
+    'fill_stat_cols_by_acc': _stage_fill_stat_cols_by_acc,
+    'save_statements': _stage_save_statements,
+    'end_to_end': _stage_end_to_end,
+}
+
+def _run_stage(conf_data: dict, stage: str, case: dict, bank_name: str, jobs: int) -> dict:
+    """子进程任务：准备数据后计时运行一个环节，返回结果记录；环节不适用于该银行时返回None"""
+    set_conf_data(conf_data)
+    get_conf_data()['base_config']['jobs'] = jobs
+    with tempfile.TemporaryDirectory() as _out, contextlib.redirect_stdout(io.StringIO()), \
+         contextlib.redirect_stderr(io.StringIO()): # 屏蔽处理过程中的打印和进度条
+        _rows, _func = _STAGES[stage](case, bank_name, pathlib.Path(_out))
+        if _func is None:
+            return None
+        _base = _peak_rss()
+        _t = time.perf_counter()
+        _func()
+        _seconds = time.perf_counter() - _t
+    _peak = max(filter(None, [_peak_rss(), _peak_rss(children=True)]), default=None)
+    return {'bank': bank_name, 'stage': stage, 'rows': _rows, 'seconds': round(_seconds, 4),
+            'rows_per_sec': round(_rows / _seconds) if _seconds else None, 'base_rss': _base, 'peak_rss': _peak}
+
+def _fmt_mb(value: int) -> str:
+    return '-' if value is None else f'{value / 2 ** 20:.0f}MB'
+
+def main(argv: list=None) -> list:
+    _parser = argparse.ArgumentParser(description='流水处理各环节基准测试')
+    _parser.add_argument('--rows', type=int, default=20000, help='每个流水文件的行数（xls最多65535行）')
+    _parser.add_argument('--acc-rows', type=int, default=200, help='每个账户文件的行数')
+    _parser.add_argument('--banks', nargs='+', default=_BANKS, help='参与测试的银行配置名')
+    _parser.add_argument('--stages', nargs='+', default=list(_STAGES), choices=list(_STAGES))
+    _parser.add_argument('--jobs', type=int, default=1, help='端到端处理的并行进程数')
+    _parser.add_argument('--json', type=pathlib.Path, help='将结果保存为json文件，便于对比不同版本')
+    _parser.add_argument('--keep', type=pathlib.Path, help='在该目录生成并保留模拟文件，默认使用临时目录')
+    _args = _parser.parse_args(argv)
+
+    _conf_data = load_conf()
+    _results = []
+    print(f"{'银行':<8}{'环节':<22}{'行数':>8} {'耗时':>9} {'每秒行数':>8}  {'基线内存':>5} {'峰值内存':>5}")
+    with tempfile.TemporaryDirectory() as _tmp:
+        _root = _args.keep or pathlib.Path(_tmp)
+        for _bank in _args.banks:
+            try: # 某个银行无法生成模拟文件（如缺少xlwt）时只跳过该银行
+                _files = make_case(_root.joinpath(_bank), _bank, _args.rows, _args.acc_rows)
+            except Exception as e:
+                _results.append({'bank': _bank, 'stage': 'make_case', 'error': repr(e)})
+                print(f"{_bank:<8}{'make_case':<24}出错：{e!r}")
+                continue
+            _case = {'dir': next(iter(_files.values()))[0].parent, 'files': _files,
+                     'rows': _args.rows, 'acc_rows': _args.acc_rows}
+            for _stage in _args.stages:
+                with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as _pool: # 每个环节使用新进程
+                    try:
+                        _result = _pool.submit(_run_stage, _conf_data, _stage, _case, _bank, _args.jobs).result()
+                    except Exception as e:
+                        _result = {'bank': _bank, 'stage': _stage, 'error': repr(e)}
+                if _result is None:
+                    continue
+                _results.append(_result)
+                if 'error' in _result:
+                    print(f"{_bank:<8}{_stage:<24}出错：{_result['error']}")
+                else:
+                    print(f"{_bank:<8}{_stage:<24}{_result['rows']:>9} {_result['seconds']:>10.3f}s "
+                          f"{_result['rows_per_sec'] or 0:>11} {_fmt_mb(_result['base_rss']):>9} "
+                          f"{_fmt_mb(_result['peak_rss']):>9}")
+    if _args.json:
+        _args.json.write_text(json.dumps(_results, ensure_ascii=False, indent=2), encoding='utf-8')
+    return _results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""生成模拟银行查询结果，供基准测试使用。
+表头取自config.yaml.d中各类型配置后的表头注释，并用header_hash校验，同时据此确定文件为xlsx还是xls；
+各列取值规则由操作配置（Conf_tpl）推出：日期时间列按配置的格式生成，数值列、借贷标志列、账号列等生成可解析的值，
+因此新增银行配置后无需修改本模块。生成xls文件需要安装xlwt。"""
+import ast
+import pathlib
+import re
+import numpy as np
+import pandas as pd
+import openpyxl as op
+from hashlib import md5
+from corelibs.config import get_conf_obj, get_header_hash
+
+
+
+_BANK_LINE = re.compile(r'^(\S[^:#]*):') # 顶格的银行配置名
+_TYPE_LINE = re.compile(r'^\s+(\S+):\s*#\s*([\[(].*[\])])\s*$') # 类型配置及其后的表头注释
+_DEFAULT_DT_FORMAT = '%Y-%m-%d %H:%M:%S' # 未配置格式的日期时间列
+_XLS_MAX_ROWS = 65535
+
+def read_headers(conf_dir: str='./config.yaml.d') -> dict:
+    """从配置文件的表头注释中读取原始表头，返回{(银行配置名, 类型): 表头列表}"""
+    _headers = {}
+    for _file in pathlib.Path(conf_dir).glob('[!#]*.yaml'):
+        _bank = None
+        for _line in _file.read_text(encoding='utf-8').splitlines():
+            if (_m := _BANK_LINE.match(_line)):
+                _bank = _m.group(1).strip()
+            elif _bank and (_m := _TYPE_LINE.match(_line)):
+                _headers[(_bank, _m.group(1))] = list(ast.literal_eval(_m.group(2)))
+    return _headers
+
+def lookup_header(header: list) -> tuple:
+    """在header_hash中查找表头：xlsx表头为tuple字符串，xls表头为list字符串。
+    返回(文件后缀, 银行配置名及类型列表)，均未登记时返回(None, None)"""
+    _hash = get_header_hash()
+    for _suffix, _str in (('.xlsx', str(tuple(header))), ('.xls', str(list(header)))):
+        if (_conf_name := _hash.get(md5(_str.encode()).hexdigest())) is not None:
+            return _suffix, _conf_name
+    return None, None
+
+def make_rows(bank_name: str, file_type: str, header: list, rows: int, accounts: list,
+              person: tuple, seed: int=0) -> pd.DataFrame:
+    """按操作配置生成一张表的数据：accounts为本方账号池，person为(姓名, 证件号码)"""
+    _conf = get_conf_obj(bank_name, file_type)
+    _rng = np.random.default_rng(seed)
+    _idx = np.arange(rows)
+    _dt_formats = {_col: _fmt or _DEFAULT_DT_FORMAT for _col, _fmt in _conf.datetime_cols}
+    _times = pd.Series(pd.Timestamp('2022-01-01') + pd.to_timedelta(_idx * 37, unit='min'))
+    _accs = np.array(accounts, dtype=object)
+    _data = {}
+    for _col in header:
+        _target = _conf.col_name_map.get(_col, _col)
+        if _conf.cdid and _col == _conf.cdid['CD_col']:
+            _data[_col] = _rng.choice([_conf.cdid['C'], _conf.cdid['D']], rows)
+        elif _col in _dt_formats:
+            _data[_col] = _times.dt.strftime(_dt_formats[_col]).to_numpy()
+        elif _col in _conf.digi_cols or (_conf.cdid and _col == _conf.cdid['trans_col']):
+            _data[_col] = np.round(_rng.uniform(1, 100000, rows), 2)
+        elif '对方' in _col and ('账号' in _col or '帐户' in _col):
+            _data[_col] = _rng.choice([f'6200{i:012d}' for i in range(200)], rows)
+        elif '账号' in _col or '卡号' in _col:
+            _data[_col] = _accs[_idx % len(_accs)]
+        elif _target == '姓名' or _col in ('姓名', '客户名称', '账户名称', '开户名称', '我方中文名称'):
+            _data[_col] = np.full(rows, person[0], dtype=object)
+        elif '证件号码' in _col or _col == '身份证号':
+            _data[_col] = np.full(rows, person[1], dtype=object)
+        elif _col in _conf.verify_cols:
+            _data[_col] = np.array([f'{_col}{i % 10}' for i in range(rows)], dtype=object)
+        else: # 其他列取少量重复值并混入空值
+            _data[_col] = _rng.choice(np.array([None] + [f'{_col}{i}' for i in range(10)], dtype=object), rows,
+                                      p=[0.2] + [0.08] * 10)
+    return pd.DataFrame(_data, columns=header)
+
+def write_workbook(df: pd.DataFrame, file_path: pathlib.Path) -> None:
+    """按后缀写入xlsx或xls文件，空值写为空单元格"""
+    _rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    if file_path.suffix == '.xlsx':
+        _book = op.Workbook(write_only=True)
+        _sheet = _book.create_sheet()
+        _sheet.append(list(df.columns))
+        for _row in _rows:
+            _sheet.append(_row)
+        _book.save(file_path)
+    else:
+        import xlwt # 仅生成xls时需要
+        if len(df) > _XLS_MAX_ROWS:
+            raise Exception(f"xls文件最多{_XLS_MAX_ROWS}行：{len(df)}")
+        _book = xlwt.Workbook()
+        _sheet = _book.add_sheet('Sheet1')
+        for _j, _v in enumerate(df.columns):
+            _sheet.write(0, _j, _v)
+        for _i, _row in enumerate(_rows, 1):
+            for _j, _v in enumerate(_row):
+                if _v is not None:
+                    _sheet.write(_i, _j, _v)
+        _book.save(str(file_path))
+
+def make_case(root: pathlib.Path, bank_name: str, stat_rows: int, acc_rows: int=20,
+              labels: tuple=('光大银行',), person: tuple=('张三', '120101199001011234'), seed: int=0) -> dict:
+    """在root下生成一个人员目录（目录名为“姓名_证件号码”），内含该银行配置每种表头各一个文件。
+    多种类型共用表头时只生成一个文件，按header_hash中列出的第一种类型的配置生成数据。
+    文件名为“银行-类型_序号_1”，兼容央地协查从文件名取银行名和建设银行网点按序号检查分拆文件的规则。
+    labels为文件名中的银行名，每个银行名生成一套文件。返回{类型: [文件路径, ...]}"""
+    _headers = read_headers()
+    _dir = pathlib.Path(root).joinpath('_'.join(person))
+    _dir.mkdir(parents=True, exist_ok=True)
+    _files = {}
+    _seq = 0
+    for _label in labels:
+        _prefix = int(md5(_label.encode()).hexdigest()[:4], 16)
+        _accs = [f'{_prefix:05d}{i:07d}' for i in range(max(acc_rows // 2, 1))]
+        _written = set()
+        for (_bank, _type), _header in _headers.items():
+            if _bank != bank_name or str(_header) in _written:
+                continue
+            _suffix, _conf_name = lookup_header(_header)
+            if _suffix is None:
+                raise Exception(f"{_bank}:{_type}的表头注释与header_hash不一致")
+            _written.add(str(_header))
+            _type = _conf_name[1]
+            _seq += 1
+            _rows = stat_rows if _type == '流水' else acc_rows
+            _df = make_rows(_bank, _type, _header, _rows, _accs, person, seed + _seq)
+            _file = _dir.joinpath(f'{_label}-{_type}_{_seq}_1{_suffix}')
+            write_workbook(_df, _file)
+            _files.setdefault(_type, []).append(_file)
+    return _files
@@ -0,0 +1,119 @@
+"""批量处理命令行入口，无需交互，适合计划任务在夜间处理多个案件目录：
+python -m corelibs run --bank yangdi 目录1 目录2 ... --out 输出目录 [--jobs 进程数] [--doc-no 文书号] [--writer-workers 写入进程数]
+每个文件保存后立即记入输出目录中的处理清单（见corelibs.manifest），中途崩溃或中断后用同样的命令重新运行，
+已完成的文件自动跳过，从下一个未完成的文件继续。
+结束时在输出目录的“0运行报告”子目录中保存本次批量处理的汇总（时间_batch.json），并以退出码表示结果：
+0全部成功，1部分文件出错，3有目录无法处理或被中止（2为命令行参数错误）
+只识别文件类型而不解析数据（检查新收到的查询结果能否识别）：
+python -m corelibs classify 目录1 目录2 ... [--cache 缓存目录]
+该命令不导入pandas，配置未变化时读取编译后的配置缓存，启动很快；有无法识别的文件时退出码为1"""
+import argparse
+import json
+import pathlib
+import sys
+import warnings
+from datetime import datetime
+from corelibs.config import load_conf
+from corelibs.report import REPORT_DIR
+
+
+
+EXIT_OK = 0
+EXIT_FILE_ERRORS = 1
+EXIT_DIR_FAILED = 3
+
+def _get_banks() -> dict:
+    """返回可处理的目录类型：{名称: (处理函数, 是否支持on_error参数)}"""
+    from banks.yangdi import process_dir_yangdi
+    from banks.ccb import process_dir_ccb_branch_v1, process_dir_ccb_branch_v2
+    return {'yangdi': (process_dir_yangdi, True),
+            'ccb': (process_dir_ccb_branch_v2, True),
+            'ccb_v1': (process_dir_ccb_branch_v1, False)}
+
+def _parser() -> argparse.ArgumentParser:
+    _parser = argparse.ArgumentParser(prog='python -m corelibs', description='银行查询结果批量处理')
+    _sub = _parser.add_subparsers(dest='command', required=True)
+    _run = _sub.add_parser('run', help='依次处理多个案件目录')
+    _run.add_argument('dirs', nargs='+', type=pathlib.Path, help='案件目录')
+    _run.add_argument('--bank', required=True, choices=['yangdi', 'ccb', 'ccb_v1'],
+                      help='目录类型：yangdi央地协查，ccb建设银行网点，ccb_v1建设银行网点（不关联账户信息）')
+    _run.add_argument('--out', required=True, type=pathlib.Path, help='输出目录')
+    _run.add_argument('--jobs', type=int, default=None, help='并行解析的进程数，默认取配置项，0为使用全部CPU')
+    _run.add_argument('--doc-no', default=None, help='查询文书号')
+    _run.add_argument('--conf', default='./config.yaml.d', help='配置目录')
+    _run.add_argument('--on-error', default='continue', choices=['continue', 'abort'],
+                      help='目录中有出错文件时继续处理其他文件还是中止该目录')
+    _run.add_argument('--full', action='store_true', help='忽略处理清单，全部文件重新处理')
+    _run.add_argument('--writer-workers', type=int, default=2, help='写入输出文件的进程数，0为在主进程中同步写入')
+    _cls = _sub.add_parser('classify', help='只识别目录中各excel文件的类型，不解析数据')
+    _cls.add_argument('dirs', nargs='+', type=pathlib.Path, help='案件目录')
+    _cls.add_argument('--conf', default='./config.yaml.d', help='配置目录')
+    _cls.add_argument('--cache', default=None, type=pathlib.Path, help='表头识别结果的缓存目录，默认不缓存')
+    return _parser
+
+def run(dirs: list, bank: str, output_dir: pathlib.Path, jobs: int=None, doc_No: str=None,
+        on_error: str='continue', full: bool=False, writer_workers: int=2) -> int:
+    """依次处理多个案件目录，单个目录出错不影响其他目录，返回退出码；
+    命令行批量处理默认开启增量处理（full为真时全部重新处理）并在写入进程中写入输出文件"""
+    _func, _has_on_error = _get_banks()[bank]
+    _kwargs = {'jobs': jobs, 'incremental': not full, 'writer_workers': writer_workers}
+    if _has_on_error:
+        _kwargs['on_error'] = on_error
+    output_dir.mkdir(parents=True, exist_ok=True)
+    _started = datetime.now()
+    _summary = {}
+    for _dir in dirs:
+        print(f'==== {_dir} ====')
+        try:
+            _result = _func(_dir, output_dir, doc_No, **_kwargs)
+        except Exception as e:
+            print(_msg := f'目录处理失败：{e}')
+            _summary[str(_dir)] = {'status': 'failed', 'message': _msg, 'errors': {}}
+            continue
+        if _result is None:
+            _summary[str(_dir)] = {'status': 'aborted', 'message': '存在出错文件，已中止', 'errors': {}}
+            continue
+        _errors = _result if isinstance(_result, dict) else _result[1]
+        _summary[str(_dir)] = {'status': 'errors' if _errors else 'ok', 
+                               'message': f'{len(_errors)}个文件出错' if _errors else '完成',
+                               'errors': {str(_f): _m for _f, _m in _errors.items()}}
+    _statuses = {x['status'] for x in _summary.values()}
+    if _statuses & {'failed', 'aborted'}:
+        _code = EXIT_DIR_FAILED
+    elif 'errors' in _statuses:
+        _code = EXIT_FILE_ERRORS
+    else:
+        _code = EXIT_OK
+    _dir = output_dir.joinpath(REPORT_DIR)
+    _dir.mkdir(parents=True, exist_ok=True)
+    _path = _dir.joinpath(f'{_started:%Y%m%d-%H%M%S}_batch.json')
+    _data = {'started': _started.isoformat(timespec='seconds'),
+             'finished': datetime.now().isoformat(timespec='seconds'),
+             'bank': bank, 'exit_code': _code, 'dirs': _summary}
+    _path.write_text(json.dumps(_data, ensure_ascii=False, indent=2), encoding='utf-8')
+    print('\n'.join([f'共{len(_summary)}个目录，批量处理汇总：{_path}'] +
+                    [f'{_d} => {_s["message"]}' for _d, _s in _summary.items()]))
+    return _code
+
+def classify(dirs: list, cache_dir: pathlib.Path=None) -> int:
+    """识别多个目录（不含子目录）中各excel文件的类型，返回退出码"""
+    from corelibs.classify import classify_files_by_category
+    _files = [_f for _dir in dirs for _f in sorted(_dir.glob('*.xls*'))]
+    _file_cate, _err_file_dict = classify_files_by_category(_files, cache_dir)
+    print('\n'.join([f'共{len(_files)}个文件，{len(_err_file_dict)}个无法识别'] +
+                    [f'{_bank}:{_type} {len(_v)}个文件' for _bank, _types in _file_cate.items() 
+                     for _type, _v in _types.items()]))
+    return EXIT_FILE_ERRORS if _err_file_dict else EXIT_OK
+
+def main(argv: list=None) -> int:
+    _args = _parser().parse_args(argv)
+    warnings.filterwarnings('ignore', message="Workbook contains no default style, apply openpyxl's default",
+                            category=UserWarning)
+    load_conf(_args.conf)
+    if _args.command == 'classify':
+        return classify(_args.dirs, _args.cache)
+    return run(_args.dirs, _args.bank, _args.out, _args.jobs, _args.doc_no, _args.on_error, _args.full, 
+               _args.writer_workers)
+
+if __name__ == '__main__':
+    sys.exit(main())
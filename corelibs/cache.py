@@ -0,0 +1,55 @@
+import json
+import pathlib
+
+
+
+class Header_cache:
+    """表头识别缓存：以文件路径、大小和修改时间为键保存文件各工作表前若干行的候选表头md5值，存储为输出目录中的json文件。
+    缓存表头md5而非识别结果，识别结果每次按当前header_hash查找，因此修改配置后无需重新读取文件"""
+
+    # 表头读取方式变化时修改版本号，使旧缓存失效
+    VERSION = 4
+    FILE_NAME = '.header_cache.json'
+
+    def __init__(self, cache_dir: pathlib.Path=None):
+        self._path = None if cache_dir is None else pathlib.Path(cache_dir).joinpath(self.FILE_NAME)
+        self._data = {}
+        self._dirty = False
+        if self._path is not None and self._path.exists():
+            try:
+                with open(self._path, 'r', encoding='utf-8') as f:
+                    _d = json.load(f)
+                if _d.get('version') == self.VERSION:
+                    self._data = _d.get('files', {})
+            except (ValueError, OSError): # 缓存损坏时忽略，重新生成
+                self._data = {}
+
+    def get(self, file: pathlib.Path, nrows: int=1) -> list[tuple[str, list[list[str]]]]:
+        """返回缓存的各工作表(表名, 前nrows行候选表头md5值)，文件大小或修改时间变化、或缓存时读取的行数不足时返回None"""
+        _entry = self._data.get(_file_key(file))
+        if _entry is not None and _entry[:2] == _file_stat(file) and _entry[2] >= nrows:
+            return [(_name, _md5s[:nrows]) for _name, _md5s in _entry[3]]
+        return None
+
+    def set(self, file: pathlib.Path, sheets: list[tuple[str, list[list[str]]]], nrows: int=1) -> None:
+        """记录文件各工作表前nrows行的候选表头md5值（工作表不足nrows行时为全部行）"""
+        self._data[_file_key(file)] = [*_file_stat(file), nrows, [list(x) for x in sheets]]
+        self._dirty = True
+
+    def save(self) -> None:
+        """将缓存写入文件（先写临时文件再替换，避免中断时损坏缓存）"""
+        if self._path is None or not self._dirty:
+            return
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        _tmp = self._path.with_suffix('.tmp')
+        with open(_tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'files': self._data}, f, ensure_ascii=False)
+        _tmp.replace(self._path)
+        self._dirty = False
+
+def _file_key(file: pathlib.Path) -> str:
+    return str(pathlib.Path(file).resolve())
+
+def _file_stat(file: pathlib.Path) -> list:
+    _stat = pathlib.Path(file).stat()
+    return [_stat.st_size, _stat.st_mtime_ns]
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+
+
+# 余额连续性允许的误差
+_TOLERANCE = 0.005
+# 运行报告中未通过行的明细包含的列
+ISSUE_FIELDS = ['文件', '账号', '日期', '时间', '出账金额', '入账金额', '余额', '校验', '说明']
+
+def check_statements(df: pd.DataFrame, checks: tuple, date_min=None, date_max=None) -> pd.DataFrame:
+    """按配置的校验项（见配置项checks）检查已按日期、时间排序的流水，返回未通过的行：索引与df相同，列为校验项和说明，
+    同一行未通过多项时有多行；全部为分组和整列运算，不逐行循环。
+    balance：同一账户（有币种列时按账号和币种）相邻两笔之间，上一笔余额-出账金额+入账金额应等于本笔余额；
+    in_out：出账、入账金额不能同时有值，也不能同时为空或0；
+    sign：出账、入账金额不能为负数，导出带符号金额（同时有借贷标志列）的银行不配置该项；
+    date：日期不能为空，也不能早于date_min或晚于date_max（默认为当天）"""
+    _issues = []
+    if 'balance' in checks:
+        _issues.append(_check_balance(df))
+    if 'in_out' in checks:
+        _issues.append(_check_in_out(df))
+    if 'sign' in checks:
+        _issues.append(_check_sign(df))
+    if 'date' in checks:
+        _issues.append(_check_date(df, date_min, date_max))
+    return pd.concat(_issues) if _issues else pd.DataFrame(columns=['校验', '说明'])
+
+def summarize_issues(issues: pd.DataFrame) -> dict:
+    """返回各校验项未通过的行数"""
+    return {k: int(v) for k, v in issues['校验'].value_counts(sort=False).items()}
+
+def issue_records(df: pd.DataFrame, issues: pd.DataFrame, file: str, limit: int=100) -> list[dict]:
+    """返回前limit个未通过行的明细（字段见ISSUE_FIELDS），用于写入运行报告；行数很多时只保留部分明细，数量见summarize_issues"""
+    _issues = issues.iloc[:limit]
+    _rows = df.loc[:, ~df.columns.duplicated()].reindex(columns=ISSUE_FIELDS[1:7]).loc[_issues.index]
+    if pd.api.types.is_datetime64_any_dtype(_rows['日期'].dtype):
+        _rows['日期'] = _rows['日期'].dt.strftime('%Y-%m-%d')
+    if pd.api.types.is_timedelta64_dtype(_rows['时间'].dtype):
+        _rows['时间'] = (pd.Timestamp(0) + _rows['时间']).dt.strftime('%H:%M:%S')
+    _rows = _rows.astype(object).where(_rows.notna(), None).assign(文件=file, 校验=_issues['校验'].to_numpy(), 
+                                                                   说明=_issues['说明'].to_numpy())
+    return [{k: v if v is None or isinstance(v, (int, float)) else str(v) for k, v in x.items()} 
+            for x in _rows[ISSUE_FIELDS].to_dict('records')]
+
+def _issue_frame(mask: np.ndarray, index: pd.Index, name: str, notes: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame({'校验': name, '说明': notes[mask]}, index=index[mask])
+
+def _col(df: pd.DataFrame, col: str) -> pd.Series:
+    """返回列，重复列名时取第一列"""
+    _s = df[col]
+    return _s.iloc[:, 0] if isinstance(_s, pd.DataFrame) else _s
+
+def _amounts(df: pd.DataFrame, col: str) -> np.ndarray:
+    return pd.to_numeric(_col(df, col), errors='coerce').fillna(0).to_numpy(dtype=float)
+
+def _check_balance(df: pd.DataFrame) -> pd.DataFrame:
+    _keys = [_col(df, x) for x in ('账号', '币种') if x in df.columns]
+    _out, _in = _amounts(df, '出账金额'), _amounts(df, '入账金额')
+    _balance = pd.to_numeric(_col(df, '余额'), errors='coerce')
+    _prev = _balance.groupby(_keys, sort=False, observed=True, dropna=False).shift()
+    _diff = (_prev.to_numpy(dtype=float) - _out + _in) - _balance.to_numpy(dtype=float)
+    _mask = np.abs(np.nan_to_num(_diff, nan=0.0)) > _TOLERANCE # 首笔和余额为空的行无法判断，视为通过
+    _notes = np.char.add('余额与上一笔相差', np.round(-_diff, 2).astype(str))
+    return _issue_frame(_mask, df.index, 'balance', _notes)
+
+def _check_in_out(df: pd.DataFrame) -> pd.DataFrame:
+    _out, _in = _amounts(df, '出账金额'), _amounts(df, '入账金额')
+    _notes = np.select([(_out != 0) & (_in != 0), (_out == 0) & (_in == 0)],
+                       ['出账、入账金额同时有值', '出账、入账金额均为空或0'], '')
+    return _issue_frame(_notes != '', df.index, 'in_out', _notes)
+
+def _check_sign(df: pd.DataFrame) -> pd.DataFrame:
+    _out, _in = _amounts(df, '出账金额'), _amounts(df, '入账金额')
+    _mask = (_out < 0) | (_in < 0)
+    return _issue_frame(_mask, df.index, 'sign', np.full(len(df), '金额为负数'))
+
+def _check_date(df: pd.DataFrame, date_min=None, date_max=None) -> pd.DataFrame:
+    _date = pd.to_datetime(_col(df, '日期'), errors='coerce')
+    _min = pd.Timestamp(date_min) if date_min else pd.Timestamp.min
+    _max = pd.Timestamp(date_max) if date_max else pd.Timestamp.now().normalize()
+    _notes = np.select([_date.isna().to_numpy(), (_date < _min).to_numpy(), (_date > _max).to_numpy()],
+                       ['日期为空', f'日期早于{_min:%Y-%m-%d}', f'日期晚于{_max:%Y-%m-%d}'], '')
+    return _issue_frame(_notes != '', df.index, 'date', _notes)
@@ -0,0 +1,87 @@
+"""文件类型识别：只读取各工作表的前若干行，不依赖pandas；openpyxl、xlrd等只在需要时才导入，
+只识别文件类型（如python -m corelibs classify）时启动很快"""
+import pathlib
+from typing import TYPE_CHECKING
+from corelibs.config import get_header_scan_rows, get_header_hash
+from corelibs.header import sheets_head_md5s, match_header
+from corelibs.cache import Header_cache
+from corelibs.report import stage
+if TYPE_CHECKING:
+    from corelibs.workbook import Workbook_handle
+
+
+
+def classify_files_by_category(files_list: list, cache_dir: pathlib.Path=None, 
+                               layouts: dict=None) -> tuple[dict, dict]:
+    """将文件列表按照配置分组，返回分组后的字典和无法识别的文件字典。文件的每个工作表分别识别，
+    包含多种类型工作表的文件分入各类型。
+    如提供cache_dir，则表头识别结果缓存在该目录中，未变化的文件再次识别时无需重新打开；
+    如提供layouts字典，则在其中记录各文件各类型数据所在的工作表和表头行号（见get_file_layout）"""
+    _file_cate = {} # 保存识别后的文件类型
+    _err_file_dict = {} # 保存解析出错的文件和原因
+    from tqdm.auto import tqdm
+    _cache = Header_cache(cache_dir)
+    try:
+        for _file in tqdm(files_list, desc='识别文件类型'):
+            print(f'{_file.name} => ', end='')
+            try:
+                with stage('header', _file):
+                    _conf_name, _layout = get_file_layout(_file, cache=_cache)
+            except Exception as e:
+                print(_msg := str(e))
+                _err_file_dict[_file] = _msg
+                continue
+            if _conf_name is None: # 如果未成功识别
+                print(_msg := '未找到对应配置，跳过')
+                _err_file_dict[_file] = _msg
+            else:
+                print(f'{":".join(_conf_name)}' + _describe_layout(_layout))
+                if layouts is not None:
+                    layouts[_file] = _layout
+                for x in _conf_name[1:]:
+                    _file_cate.setdefault(_conf_name[0], {}).setdefault(x, []).append(_file)
+    finally:
+        _cache.save()
+    return _file_cate, _err_file_dict
+
+def get_file_type(file: pathlib.Path, book: 'Workbook_handle'=None, cache: Header_cache=None) -> list:
+    """根据文件表头找到该文件类型,亦即解析文件配置入口；传入工作簿句柄时直接从句柄读取表头，
+    传入表头缓存时优先使用缓存的表头md5值"""
+    return get_file_type_and_header(file, book, cache)[0]
+
+def get_file_type_and_header(file: pathlib.Path, book: 'Workbook_handle'=None, cache: Header_cache=None) -> tuple[list, int]:
+    """返回(配置, 首个识别出的数据表的表头行号)，未找到时返回(None, None)；各工作表的情况见get_file_layout"""
+    _conf_name, _layout = get_file_layout(file, book, cache)
+    return _conf_name, None if _conf_name is None else next(iter(_layout.values()))[0][1]
+
+def get_file_layout(file: pathlib.Path, book: 'Workbook_handle'=None, cache: Header_cache=None) -> tuple[list, dict]:
+    """分别识别工作簿中的每个工作表：在各表前若干行（配置项header_scan_rows）中查找已登记的表头，
+    返回(配置, {类型: [(工作表序号, 表头行号), ...]})，配置为[银行, 类型, ...]，未识别的工作表（如说明页）忽略，
+    全部工作表都未识别时返回(None, {})；同一文件中的工作表属于不同银行配置时报错。
+    整个工作簿只打开一次，xlsx文件只解析各表需要的行，不载入整个工作表"""
+    _nrows = get_header_scan_rows()
+    if cache is None or (_sheets := cache.get(file, _nrows)) is None:
+        _sheets = sheets_head_md5s(file, _nrows, book) # 读取各工作表前若干行的候选表头md5值
+        if cache is not None:
+            cache.set(file, _sheets, _nrows)
+    _bank, _layout = None, {}
+    for i, (_name, _md5s) in enumerate(_sheets):
+        _conf_name, _header = match_header(_md5s, get_header_hash()) # 根据表头md5值找到相应的配置
+        if _conf_name is None:
+            continue
+        if _bank is None:
+            _bank = _conf_name[0]
+        elif _conf_name[0] != _bank:
+            raise Exception(f"工作表{_name}属于{_conf_name[0]}配置，与其他工作表的{_bank}配置不同")
+        for x in _conf_name[1:]:
+            _layout.setdefault(x, []).append((i, _header))
+    if _bank is None:
+        return None, {}
+    return [_bank, *_layout], _layout
+
+def _describe_layout(layout: dict) -> str:
+    """数据不在首个工作表、表头不在第0行或同一类型分布在多个工作表时，返回各类型数据位置的说明"""
+    if all(x == [(0, 0)] for x in layout.values()):
+        return ''
+    return '（' + '，'.join(f'{k}在' + '、'.join(f'第{s}表第{h}行' for s, h in v) for k, v in layout.items()) + '）'
+
@@ -1,32 +1,113 @@
 
-import yaml, pathlib
+import pathlib, json, pickle
+from hashlib import md5
 from collections import namedtuple
 
 #定义操作序列数据结构
 Conf_tpl = namedtuple('Conf_tpl', """from_file from_dir new_cols verify_cols
                                     col_name_map merge_cols date_cols
                                     time_cols digi_cols cdid fill_cols
-                                    cols_new_order acc_rel_cols""")
+                                    cols_new_order acc_rel_cols src_cols drop_cols
+                                    datetime_cols fmt_cache category_cols dedup_cols
+                                    split_files checks""")
+
+# 配置中不代表输出列的选项键
+_OPTION_KEYS = ('other_cols', 'dedup_cols', 'split_files', 'checks')
+# 可配置的流水校验项及其需要的输出列：balance余额连续，in_out出账、入账金额一致，sign金额非负，date日期范围（见corelibs.check）
+_CHECK_COLS = {'balance': ['账号', '出账金额', '入账金额', '余额'], 'in_out': ['出账金额', '入账金额'], 
+               'sign': ['出账金额', '入账金额'], 'date': ['日期']}
+
+# 编译后的配置缓存文件（保存在配置目录中）及其格式版本；缓存键中还包含本模块源码的md5值，修改编译代码后缓存自动失效
+_COMPILED_FILE = '.compiled.pickle'
+_COMPILED_VERSION = 1
 
 #定义配置数据变量
 _CONF_DATA: dict = {}
 _CONF_TPL_CACHE: dict[str:Conf_tpl] = {}
+_CONF_VERSIONS: dict = {} # 各银行配置版本的缓存
 
 # 加载全局配置文件
-def load_conf(conf_dir: str='./config.yaml.d') -> dict:
+def load_conf(conf_dir: str='./config.yaml.d', use_compiled: bool=True) -> dict:
+    """加载配置目录中的全部配置文件并合并，同时生成全部银行全部类型的操作配置，配置有误时在此报错。
+    合并后的配置和操作配置编译后缓存在配置目录中，配置文件（文件名、大小、修改时间）和本模块源码均未变化时直接读取缓存，
+    不再解析yaml和生成操作配置；缓存无法写入时（如配置目录只读）忽略"""
     global _CONF_DATA
     global _CONF_TPL_CACHE
     _dir = pathlib.Path(conf_dir)
+    _files = sorted(_dir.glob('[!#]*.yaml'))
+    _sig = [_COMPILED_VERSION, _code_md5(), Conf_tpl._fields, 
+            [(x.name, x.stat().st_size, x.stat().st_mtime_ns) for x in _files]]
+    _compiled = _dir.joinpath(_COMPILED_FILE)
+    if use_compiled and (_cached := _read_compiled(_compiled, _sig)) is not None:
+        _CONF_DATA, _CONF_TPL_CACHE = _cached
+        _CONF_VERSIONS.clear()
+        return _CONF_DATA
+    import yaml # 只在配置变化后才需要解析yaml
     _result = {}
-    for _file in _dir.glob('[!#]*.yaml'):
+    for _file in _files:
         with open(_file, 'r', encoding='utf-8') as f:
-            _d = yaml.safe_load(f)
-            _result = {k: {**_result.get(k, {}), **_d.get(k, {})} 
-                       for k in set(_result).union(set(_d))}
-    _CONF_DATA =  _result
-    _CONF_TPL_CACHE = {}
+            for k, v in yaml.safe_load(f).items():
+                _result.setdefault(k, {}).update(v)
+    set_conf_data(_result)
+    _CONF_TPL_CACHE = _compile_conf()
+    if use_compiled:
+        _write_compiled(_compiled, _sig, (_CONF_DATA, _CONF_TPL_CACHE))
     return _result
 
+def _compile_conf() -> dict:
+    """生成并校验全部银行全部类型的操作配置，返回操作配置缓存（键为银行名+类型）；
+    同时检查header_hash中的每种类型都有对应的配置"""
+    _tpls = {}
+    for _bank, _types in _CONF_DATA.items():
+        if _bank in ('base_config', 'header_hash'):
+            continue
+        for _type, _conf in _types.items():
+            if not isinstance(_conf, dict):
+                continue
+            try:
+                _tpls[_bank + _type] = creat_conf_obj(_conf)
+            except Exception as e:
+                raise Exception(f"{_bank}:{_type}配置有误：{e}") from e
+    for _md5, _conf_name in _CONF_DATA.get('header_hash', {}).items():
+        if (_missing := [x for x in _conf_name[1:] if _conf_name[0] + x not in _tpls]):
+            raise Exception(f"header_hash中{_md5}对应的{_conf_name[0]}没有{_missing}配置")
+    return _tpls
+
+def _code_md5() -> str:
+    """返回本模块源码的md5值，用作编译缓存键的一部分"""
+    return md5(pathlib.Path(__file__).read_bytes()).hexdigest()
+
+def _read_compiled(path: pathlib.Path, sig: list) -> tuple:
+    """读取编译后的配置缓存，缓存不存在、损坏或与配置文件不一致时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            _sig, _data = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, AttributeError, ImportError, pickle.UnpicklingError):
+        return None
+    return _data if _sig == sig else None
+
+def _write_compiled(path: pathlib.Path, sig: list, data: tuple) -> None:
+    """写入编译后的配置缓存（先写临时文件再替换），无法写入时忽略"""
+    _tmp = path.with_suffix('.tmp')
+    try:
+        with open(_tmp, 'wb') as f:
+            pickle.dump((sig, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+        _tmp.replace(path)
+    except OSError:
+        _tmp.unlink(missing_ok=True)
+
+def get_conf_data() -> dict:
+    """返回全部配置数据"""
+    return _CONF_DATA
+
+def set_conf_data(conf_data: dict, conf_tpls: dict=None) -> None:
+    """直接设置配置数据，并设置（未提供时清空）操作配置缓存，用于在子进程中使用主进程加载和生成的配置"""
+    global _CONF_DATA
+    global _CONF_TPL_CACHE
+    _CONF_DATA = conf_data
+    _CONF_TPL_CACHE = dict(conf_tpls or {})
+    _CONF_VERSIONS.clear()
+
 def get_output_format() -> str:
     """返回配置项：输出格式"""
     return _CONF_DATA['base_config']['output_format']
@@ -35,6 +116,67 @@ def get_output_dirs(type: str) -> str:
     """返回配置项：各类型信息输出子目录"""
     return _CONF_DATA['base_config']['output_dirs'][type]
 
+def get_jobs() -> int:
+    """返回配置项：并行解析文件的进程数，0代表使用全部CPU"""
+    return _CONF_DATA['base_config'].get('jobs', 1)
+
+def get_on_error() -> str:
+    """返回配置项：批量处理出错时的策略，ask询问/continue继续/abort退出"""
+    return _CONF_DATA['base_config'].get('on_error', 'ask')
+
+def get_chunk_rows() -> int:
+    """返回配置项：流水文件分块处理的行数，0代表不分块"""
+    return _CONF_DATA['base_config'].get('chunk_rows', 0)
+
+def get_writer_workers() -> int:
+    """返回配置项：写入输出文件的进程数，0代表在主进程中同步写入"""
+    return _CONF_DATA['base_config'].get('writer_workers', 0)
+
+def get_writer_queue() -> int:
+    """返回配置项：排队等待写入的文件数上限，0代表写入进程数的2倍"""
+    return _CONF_DATA['base_config'].get('writer_queue', 0)
+
+def get_run_report() -> bool:
+    """返回配置项：批量处理结束后是否保存运行报告"""
+    return _CONF_DATA['base_config'].get('run_report', True)
+
+def get_profile() -> str:
+    """返回配置项：需要进行cProfile分析的文件名通配符，空值代表不分析"""
+    return _CONF_DATA['base_config'].get('profile', '')
+
+def get_compact_general() -> bool:
+    """返回配置项：批量处理结束后是否将非流水数据的分区合并为每个银行一个文件"""
+    return _CONF_DATA['base_config'].get('compact_general', True)
+
+def get_incremental() -> bool:
+    """返回配置项：批量处理时是否跳过已处理且未变化的文件"""
+    return _CONF_DATA['base_config'].get('incremental', False)
+
+def get_conf_version(bank_name: str) -> str:
+    """返回银行配置版本：该银行配置及输出格式、输出目录的md5值，配置变化后已处理的文件需要重新处理"""
+    if (_version := _CONF_VERSIONS.get(bank_name)) is None:
+        _base = _CONF_DATA['base_config']
+        _data = [_CONF_DATA.get(bank_name), _base['output_format'], _base['output_dirs']]
+        _version = _CONF_VERSIONS[bank_name] = md5(json.dumps(_data, ensure_ascii=False, sort_keys=True, 
+                                                              default=str).encode()).hexdigest()
+    return _version
+
+def get_category_cols() -> list:
+    """返回配置项：取值种类很少、解析后保存为分类类型的列"""
+    return _CONF_DATA['base_config'].get('category_cols', [])
+
+def get_analysis_store() -> bool:
+    """返回配置项：保存流水时是否同时写入输出目录中的流水库（SQLite），用于跨人员、跨银行查询"""
+    return _CONF_DATA['base_config'].get('analysis_store', False)
+
+def get_check_date_range() -> list:
+    """返回配置项：流水日期校验的[最早日期, 最晚日期]，空值表示不限最早日期、最晚为当天"""
+    return _CONF_DATA['base_config'].get('check_date_range') or [None, None]
+
+def get_header_scan_rows() -> int:
+    """返回配置项：识别文件类型时在前多少行中查找表头（部分银行导出文件在表头之前有标题行）"""
+    return _CONF_DATA['base_config'].get('header_scan_rows', 1)
+
 def get_header_hash() -> dict:
     """返回配置项：表头字典"""
     return _CONF_DATA['header_hash']
@@ -45,7 +187,6 @@ def get_conf_cache() -> dict:
 
 def get_conf_obj(bank_name: str, acc_or_stat: str, usecache: bool = True) -> Conf_tpl: # type: ignore
     """先在缓存中查找操作配置，如缓存中没有则转换配置并存入缓存"""
-    global _CONF_TPL_CACHE
     if usecache:
         _key_str = bank_name + acc_or_stat
         _conf_obj = _CONF_TPL_CACHE.get(_key_str, None)
@@ -96,7 +237,7 @@ def creat_conf_obj(conf_data: dict) -> Conf_tpl: # type: ignore
             else:
                 raise Exception(f"字典类型长度错误，检查配置列：{_key}") 
         elif type(_val) == list: 
-            if _key != 'other_cols': # 进行扩展操作，具体参见示例配置文档
+            if _key not in _OPTION_KEYS: # 进行扩展操作，具体参见示例配置文档
                 match _val[0]:
                     case 'date': # 加入转换日期格式列字典
                         _date_cols[_key] = _val[1:]
@@ -126,9 +267,41 @@ def creat_conf_obj(conf_data: dict) -> Conf_tpl: # type: ignore
             raise Exception(f"配置内容类型不支持，检查配置列：{_key}") 
 
     # 构造新列次序的列表
-    _cols_new_order = list(conf_data.keys())
-    _cols_new_order.remove('other_cols')
+    _cols_new_order = [x for x in conf_data.keys() if x not in _OPTION_KEYS]
     _cols_new_order.extend(conf_data.get('other_cols', []))
+    # 去重键：判断重复行时比较的输出列，未配置时比较全部列
+    _dedup_cols = tuple(conf_data.get('dedup_cols') or [])
+    if (_missing := [x for x in _dedup_cols if x not in _cols_new_order]):
+        raise Exception(f"dedup_cols中的列不在输出列中：{_missing}")
+    # 拆分保存的文件：[分隔符, 位置]，文件名按分隔符分割后该位置的值相同的文件合并处理
+    if (_split_files := conf_data.get('split_files')) is not None:
+        if type(_split_files) != list or len(_split_files) != 2 or type(_split_files[1]) != int:
+            raise Exception(f"split_files应为[分隔符, 位置]：{_split_files}")
+        _split_files = tuple(_split_files)
+    # 流水校验项：保存流水时按这些项目检查，未通过的行记入运行报告，不影响保存
+    _checks = tuple(conf_data.get('checks') or [])
+    if (_unknown := [x for x in _checks if x not in _CHECK_COLS]):
+        raise Exception(f"checks中的校验项不支持：{_unknown}，可选{list(_CHECK_COLS)}")
+    if (_missing := [y for x in _checks for y in _CHECK_COLS[x] if y not in _cols_new_order]):
+        raise Exception(f"checks中的校验项缺少需要的输出列：{list(dict.fromkeys(_missing))}")
+
+    # 编译执行计划：各项操作用到的原始列，读取文件时只读取这些列
+    _src_cols = set(_cols_new_order).union(_verify_cols, _digi_cols, _col_name_map, *_merge_cols.values(),
+                                           [x[0] for x in _date_cols.values()], [x[0] for x in _time_cols.values()], 
+                                           [_cdid['CD_col'], _cdid['trans_col']] if _cdid else [], _fill_cols, 
+                                           *[[x[0], x[2]] for x in _fill_cols.values()])
+    _src_cols.difference_update(_new_cols, _from_dir, _from_file) # 由配置生成的列不需要从文件中读取
+    # 只作为操作输入、不出现在输出中的列，在全部操作完成后、改名和重排前删除
+    _drop_cols = _src_cols.difference(_cols_new_order, _col_name_map)
+    # 合并日期列和时间列的转换：同一原始列（及格式）只解析一次，值为[日期列列表, 时间列列表]
+    _datetime_cols = {}
+    for _cols, _i in ((_date_cols, 0), (_time_cols, 1)):
+        for _key, _val in _cols.items():
+            _datetime_cols.setdefault((_val[0], _val[1] if len(_val) > 1 else None), [[], []])[_i].append(_key)
+
+    # 取值种类很少的输出列保存为分类类型，数值、日期和时间列除外
+    _category_cols = tuple(dict.fromkeys(x for x in _cols_new_order if x in get_category_cols() and x not in _digi_cols
+                                         and x not in _date_cols and x not in _time_cols))
 
     # 返回列处理逻辑对象        
     return Conf_tpl(_from_file,
@@ -143,5 +316,13 @@ def creat_conf_obj(conf_data: dict) -> Conf_tpl: # type: ignore
                     _cdid, 
                     _fill_cols,
                     _cols_new_order,
-                    _acc_rel_cols
+                    _acc_rel_cols,
+                    frozenset(_src_cols),
+                    frozenset(_drop_cols),
+                    _datetime_cols,
+                    {}, # 未配置格式的日期时间列推断出的格式缓存，键为原始列名
+                    _category_cols,
+                    _dedup_cols,
+                    _split_files,
+                    _checks
                     )
@@ -1,25 +1,65 @@
 import pathlib
 import pandas as pd
 import numpy as np
-from typing import Callable
+from typing import Callable, Iterator
+from contextlib import nullcontext
 from corelibs.config import Conf_tpl
+from corelibs.workbook import Workbook_handle
+from corelibs.report import stage
+from corelibs.dedup import drop_duplicate_rows
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError: # pandas 2.2之前的版本
+    from pandas._libs.tslibs.parsing import guess_datetime_format
 
 
 
 def parse_sheet_general(file_path: pathlib.Path, conf_data: Conf_tpl, 
-                        prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, sheet=0, header=0) -> pd.DataFrame:
-    """分析一般数据sheet：支持sheet中仅含单表，返回dataframe"""
+                        prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, sheet=0, header=0,
+                        book: Workbook_handle=None) -> pd.DataFrame:
+    """分析一般数据sheet：支持sheet中仅含单表，返回dataframe。
+    如传入已打开的工作簿句柄则直接从中读取（此时忽略sheet参数），避免重复打开和解析文件；
+    只读取配置中用到的原始列，其他列不进入内存；传入prefunc时读取全部列，前处理可能用到配置之外的列"""
+    _usecols = None if prefunc else conf_data.src_cols
     # 读取工作表内容
-    df = pd.read_excel(file_path, sheet_name=sheet, header=header, skiprows=0, dtype=str)
-    # 根据传入的函数对读取的dataframe进行前处理
-    if prefunc:
-        df = prefunc(df)
-    # 处理数据信息
-    df = _process_df_by_conf(file_path, conf_data, df)
+    with stage('read', file_path) as _rec:
+        if book is None:
+            with Workbook_handle(file_path, sheet) as _book:
+                df = _book.read_df(header, _usecols)
+        else:
+            df = book.read_df(header, _usecols)
+        _rec['rows'] = len(df)
+    with stage('process', file_path) as _rec:
+        # 根据传入的函数对读取的dataframe进行前处理
+        if prefunc:
+            df = prefunc(df)
+        # 处理数据信息
+        df = _process_df_by_conf(file_path, conf_data, df)
+        _rec['rows'] = len(df)
     return df
     # 根据配置处理数据信息
     return _process_df_by_conf(file_path, conf_data, df)
 
+def parse_sheet_chunks(file_path: pathlib.Path, conf_data: Conf_tpl, 
+                       prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, sheet=0, header=0,
+                       book: Workbook_handle=None, chunksize: int=100000) -> Iterator[pd.DataFrame]:
+    """分块分析数据sheet：每次读取chunksize行并按配置处理后产出，用于处理超出内存的大文件。
+    每块单独去重，跨块的重复行需由调用方处理；prefunc对每一块分别调用，传入prefunc时读取全部列"""
+    with Workbook_handle(file_path, sheet) if book is None else nullcontext(book) as _book:
+        _chunks = _book.iter_dfs(header, None if prefunc else conf_data.src_cols, chunksize)
+        while True:
+            with stage('read', file_path) as _rec:
+                if (df := next(_chunks, None)) is not None:
+                    _rec['rows'] = len(df)
+            if df is None:
+                break
+            with stage('process', file_path) as _rec:
+                if prefunc:
+                    df = prefunc(df)
+                df = _process_df_by_conf(file_path, conf_data, df)
+                _rec['rows'] = len(df)
+            yield df
+
 def _process_df_by_conf(file_path: pathlib.Path, conf_data: Conf_tpl, df: pd.DataFrame) -> pd.DataFrame:
     """根据配置处理dataframe"""
     # 列数据处理
@@ -33,26 +73,61 @@ def _process_df_by_conf(file_path: pathlib.Path, conf_data: Conf_tpl, df: pd.Dat
         df[_k] = _get_str_from_file(file_path, _v[0], _v[1])
     for _k, _v in conf_data.merge_cols.items(): # 执行列合并
         _merge_N_cols(df, _k, _v)
-    for _k, _v in conf_data.date_cols.items(): # 执行日期列数据转换
-        _format = 'mixed' if len(_v) == 1 else _v[1]
-        df[_k] = pd.to_datetime(df[_v[0]], format=_format).dt.date
-    for _k, _v in conf_data.time_cols.items(): # 执行时间列数据转换
-        _format = 'mixed' if len(_v) == 1 else _v[1]
-        df[_k] = pd.to_datetime(df[_v[0]], format=_format).dt.time
+    for (_col, _format), (_date_keys, _time_keys) in conf_data.datetime_cols.items(): # 执行日期、时间列数据转换
+        _dt = _to_datetime(df[_col], _format, conf_data.fmt_cache) # 同一原始列只解析一次
+        _day = _dt.dt.normalize()
+        for _k in _date_keys: # 日期列保存为datetime64
+            df[_k] = _day
+        for _k in _time_keys: # 时间列保存为当日时间偏移（timedelta64）
+            df[_k] = _dt - _day
     for _k, _v in conf_data.digi_cols.items(): # 执行数据列数据转换
         df[_k] = pd.to_numeric(df[_k])
     if conf_data.cdid: # 执行借贷列分列
         _CD_to_InOut(df, conf_data.cdid)
     for _k, _v in conf_data.fill_cols.items(): # 执行列条件填充
         _fill_col(df, _v[2], _k, _v[0], _v[1])
+    # 删除只作为操作输入的列
+    df.drop(columns=[x for x in df.columns if x in conf_data.drop_cols], inplace=True)
     # 执行修改列名
     df.rename(columns=conf_data.col_name_map, inplace=True, errors='raise')
-    # 执行列序重排
-    df = df.reindex(columns=conf_data.cols_new_order, copy=False)
-    # 行去重
-    df.drop_duplicates(inplace=True)
+    # 执行列序重排，列序已符合要求时不再重新分配内存
+    if list(df.columns) != conf_data.cols_new_order:
+        df = df.reindex(columns=conf_data.cols_new_order, copy=False)
+    # 取值种类很少的列转换为分类类型，节约内存并加快去重和分组
+    to_category(df, conf_data.category_cols)
+    # 行去重：按配置的去重键（默认全部列）计算行哈希，记录的行数为去除的重复行数
+    with stage('dedup', file_path) as _rec:
+        df, _rec['rows'] = drop_duplicate_rows(df, conf_data.dedup_cols)
+    return df
+
+def to_category(df: pd.DataFrame, cols) -> pd.DataFrame:
+    """将cols中的列转换为分类类型（已是分类类型的跳过），重复列名的各列分别转换"""
+    for i, (_col, _dtype) in enumerate(df.dtypes.items()):
+        if _col in cols and not isinstance(_dtype, pd.CategoricalDtype):
+            df.isetitem(i, df.iloc[:, i].astype('category'))
     return df
 
+def _to_datetime(s: pd.Series, format: str, fmt_cache: dict) -> pd.Series:
+    """将字符串列转换为datetime64。未配置格式时根据首个值推断格式并缓存，
+    之后的文件直接按缓存的格式解析，缓存格式不适用时重新推断，无法推断时才逐个元素解析"""
+    if format is not None:
+        return pd.to_datetime(s, format=format)
+    if (_format := fmt_cache.get(s.name)) is not None:
+        try:
+            return pd.to_datetime(s, format=_format)
+        except (ValueError, TypeError):
+            pass
+    _first = s.dropna()
+    if len(_first) and (_format := guess_datetime_format(str(_first.iat[0]))) is not None:
+        try:
+            _dt = pd.to_datetime(s, format=_format)
+        except (ValueError, TypeError):
+            pass
+        else:
+            fmt_cache[s.name] = _format
+            return _dt
+    return pd.to_datetime(s, format='mixed')
+
 def _verify_data(df: pd.DataFrame, cols: dict) -> list:
     """验证给定dataframe的相关列是否完整：存在空值返回列名，验证通过返回0"""
     _err_cols = []
@@ -68,20 +143,27 @@ def _merge_2_cols(df: pd.DataFrame, new_col: str, col1: str, col2: str) -> pd.Da
     _cond = _df1 == _df2 # 保存判断条件：两列内容相等的行为true
     df[new_col] = (_df1 + ' ' + _df2).str.strip() # 两列相加并保存为新列
     df.loc[_cond, new_col] = _df2 # 恢复两列内容相同的行
-    df[new_col].replace('', np.nan, inplace=True) # 保持和读取文件后的内容一致(便于去重操作)
+    df[new_col] = df[new_col].replace('', np.nan) # 保持和读取文件后的内容一致(便于去重操作)
     return df
 
 def _merge_N_cols(df: pd.DataFrame, new_col: str, cols: list) -> pd.DataFrame:
-    """合并多个dataframe字符串列为一个新列，并去除重复元素"""
+    """合并多个dataframe字符串列为一个新列，并去除重复元素（保留首次出现的次序）"""
     if (l := len(cols)) < 2:
         raise Exception(r'merge_N_cols参数cols应该大于1')
     elif l == 2:
         _merge_2_cols(df, new_col, cols[0], cols[1])
     elif l > 2:
-        _df = df[cols].fillna('')
-        df[new_col] = _df.apply(lambda r: ' '.join(
-            filter(lambda a: a != '', dict.fromkeys(r[cols]))), axis=1)
-        df[new_col].replace('', np.nan, inplace=True) # 保持和读取文件后的内容一致(便于去重操作)
+        # 逐列向量化处理：某列的值非空且与之前各列的值都不同时才拼接到结果中
+        _vals = [df[x].fillna('').to_numpy(dtype=object) for x in cols]
+        _result = _vals[0].copy()
+        for i in range(1, l):
+            _keep = _vals[i] != ''
+            for j in range(i):
+                _keep &= _vals[i] != _vals[j]
+            _sep = np.where(_result != '', ' ', '')
+            _result = np.where(_keep, _result + _sep + _vals[i], _result)
+        _result[_result == ''] = np.nan # 保持和读取文件后的内容一致(便于去重操作)
+        df[new_col] = _result
     return df
 
 def _split_2col(df: pd.DataFrame, col: str, delimiter: str, new_col1: str, new_col2: str) -> pd.DataFrame:
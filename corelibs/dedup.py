@@ -0,0 +1,92 @@
+import pathlib
+import numpy as np
+import pandas as pd
+
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """计算dataframe每一行的64位哈希值（不含索引），用于行去重。
+    整数列按浮点数计算，同一数值无论被推断为整数还是浮点类型，哈希值都相同"""
+    if (_ints := [i for i, x in enumerate(df.dtypes) if pd.api.types.is_integer_dtype(x)]):
+        df = df.copy(deep=False)
+        for i in _ints:
+            df.isetitem(i, df.iloc[:, i].astype('float64'))
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def key_hashes(df: pd.DataFrame, cols=()) -> np.ndarray:
+    """按去重键列计算每一行的64位哈希值，cols为空时使用全部列"""
+    return row_hashes(df[list(dict.fromkeys(cols))] if cols else df)
+
+def drop_duplicate_rows(df: pd.DataFrame, cols=()) -> tuple[pd.DataFrame, int]:
+    """按去重键列的行哈希去除重复行（保留首次出现的行），返回去重后的dataframe和去除的行数。
+    只需对每行计算一个64位整数再判断重复，比drop_duplicates逐列比较对象字符串省时省内存"""
+    _dup = pd.Series(key_hashes(df, cols)).duplicated().to_numpy()
+    return (df[~_dup], int(_dup.sum())) if _dup.any() else (df, 0)
+
+class Hash_index:
+    """行哈希索引：按来源（如分区文件）分别保存已写入行的哈希值，每个来源一个npy文件。
+    新增来源只写入该来源自身的哈希文件，删除来源只删除其哈希文件，代价与该来源行数成正比"""
+
+    SUFFIX = '.hash.npy'
+    KEY_FILE = '.key' # 记录计算哈希所用的去重键，键变化后需要重建索引
+
+    def __init__(self, index_dir: pathlib.Path):
+        self._dir = pathlib.Path(index_dir)
+        self._sources = {} # 来源名 => 哈希数组
+        self._sorted = None # 全部哈希值排序后的数组，用于快速查找
+        self.reload()
+
+    def reload(self) -> None:
+        """从目录中重新读取全部来源的哈希文件"""
+        self._sources = {x.name[:-len(self.SUFFIX)]: np.load(x, allow_pickle=False)
+                         for x in self._dir.glob(f'*{self.SUFFIX}')} if self._dir.exists() else {}
+        self._sorted = None
+
+    def is_stale(self) -> bool:
+        """目录中的哈希文件与内存中的来源不一致时（如输出目录被手动修改）返回真"""
+        _names = {x.name[:-len(self.SUFFIX)] for x in self._dir.glob(f'*{self.SUFFIX}')} if self._dir.exists() else set()
+        return _names != set(self._sources)
+
+    @property
+    def key(self) -> str:
+        """返回建立索引时的去重键，未记录时返回None"""
+        _file = self._dir.joinpath(self.KEY_FILE)
+        return _file.read_text(encoding='utf-8') if _file.exists() else None
+
+    def set_key(self, key: str) -> None:
+        """记录去重键"""
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._dir.joinpath(self.KEY_FILE).write_text(key, encoding='utf-8')
+
+    def clear(self) -> None:
+        """删除全部来源"""
+        for _source in self.sources():
+            self.remove(_source)
+
+    def sources(self) -> list:
+        """返回全部来源名"""
+        return list(self._sources)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """返回布尔数组：各哈希值是否已存在于索引中"""
+        if not self._sources:
+            return np.zeros(len(hashes), dtype=bool)
+        if self._sorted is None:
+            self._sorted = np.unique(np.concatenate(list(self._sources.values())))
+        _pos = np.searchsorted(self._sorted, hashes)
+        _pos[_pos == len(self._sorted)] = 0
+        return self._sorted[_pos] == hashes
+
+    def add(self, source: str, hashes: np.ndarray) -> None:
+        """登记一个来源的哈希值并写入该来源的哈希文件"""
+        self._dir.mkdir(parents=True, exist_ok=True)
+        _hashes = np.asarray(hashes, dtype=np.uint64)
+        np.save(self._dir.joinpath(source + self.SUFFIX), _hashes, allow_pickle=False)
+        self._sources[source] = _hashes
+        self._sorted = None
+
+    def remove(self, source: str) -> None:
+        """删除一个来源及其哈希文件"""
+        self._dir.joinpath(source + self.SUFFIX).unlink(missing_ok=True)
+        if self._sources.pop(source, None) is not None:
+            self._sorted = None
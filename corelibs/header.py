@@ -1,41 +1,283 @@
 import pathlib
-import openpyxl as op, xlrd as xl
-from itertools import islice
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from hashlib import md5
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from corelibs.workbook import Workbook_handle
+
 
 
 def read_header(file_path: pathlib.Path, sheet=None, header: int=0) -> str:
     """读取文件表头，用于识别文件来源，目前支持xls和xlsx文件"""
-    if (_suff := file_path.suffix) == '.xlsx':
-        return _read_header_xlsx(file_path, sheet, header)
-    elif _suff == '.xls':
-        return _read_header_xls(file_path, sheet, header)
-    else:
+    if file_path.suffix not in ('.xlsx', '.xls'):
         return ''
+    _rows = read_head_rows(file_path, sheet, header + 1)
+    if len(_rows) <= header:
+        raise Exception(f"表头行{header}超出工作表范围")
+    return _raw_header(_rows[header], file_path.suffix == '.xls')
+
+def read_head_rows(file_path: pathlib.Path, sheet=None, nrows: int=1) -> list:
+    """读取工作表前nrows行的原始值，内容与Workbook_handle读出的行一致（xls只取值）。
+    xlsx直接流式解析工作表XML，读完第nrows行即停止，共享字符串也只解析到这些行用到的最大序号，
+    不必像openpyxl那样先载入全部共享字符串；公式单元格取缓存的计算结果，日期格式的数值转换为日期时间；
+    文件结构不符合预期时改用Workbook_handle读取。
+    xls由xlrd读取，仍需解析整个工作表"""
+    if file_path.suffix == '.xlsx':
+        try:
+            return _read_head_rows_xlsx(file_path, sheet, nrows)
+        except (KeyError, ValueError, IndexError, StopIteration, zipfile.BadZipFile, ET.ParseError):
+            pass
+    from corelibs.workbook import Workbook_handle # 只在需要时导入openpyxl、xlrd和pandas
+    with Workbook_handle(file_path, sheet) as _book:
+        return _book.head_rows(nrows)
+
+def read_sheets_head_rows(file_path: pathlib.Path, nrows: int=1) -> list[tuple[str, list]]:
+    """依次返回工作簿中每个工作表的(表名, 前nrows行原始值)，整个工作簿只打开一次。
+    xlsx各工作表共用一次共享字符串解析（只解析到这些行用到的最大序号）；文件结构不符合预期时改用Workbook_handle读取"""
+    if file_path.suffix == '.xlsx':
+        try:
+            return _read_sheets_head_rows_xlsx(file_path, nrows)
+        except (KeyError, ValueError, IndexError, StopIteration, zipfile.BadZipFile, ET.ParseError):
+            pass
+    from corelibs.workbook import Workbook_handle # 只在需要时导入openpyxl、xlrd和pandas
+    with Workbook_handle(file_path) as _book:
+        return _book.sheets_head_rows(nrows)
+
+def header_md5s(row: list, xls: bool=False) -> list[str]:
+    """返回一行作为表头时的候选md5值：首个为原始格式（与read_header一致，xlsx为tuple字符串，xls为list字符串），
+    其后为规范化格式，即去除单元格首尾空白和行尾空单元格后的tuple和list字符串，
+    使行尾有多余空单元格、表头文字带空白的文件，以及同一表头的xlsx和xls版本都能匹配已登记的表头"""
+    _cells = ['' if x is None else x.strip() if isinstance(x, str) else x for x in row]
+    while _cells and _cells[-1] == '':
+        _cells.pop()
+    _strs = dict.fromkeys([_raw_header(row, xls), str(tuple(_cells)), str(list(_cells))])
+    return [md5(x.encode()).hexdigest() for x in _strs]
+
+def head_md5s(file_path: pathlib.Path, nrows: int=1, book: 'Workbook_handle'=None) -> list[list[str]]:
+    """返回前nrows行各自的候选md5值列表，不支持的文件类型按原规则视为空表头；传入工作簿句柄时从句柄读取"""
+    if file_path.suffix not in ('.xlsx', '.xls'):
+        return [[md5(b'').hexdigest()]]
+    _rows = read_head_rows(file_path, nrows=nrows) if book is None else book.head_rows(nrows)
+    return [header_md5s(x, file_path.suffix == '.xls') for x in _rows]
+
+def sheets_head_md5s(file_path: pathlib.Path, nrows: int=1, 
+                     book: 'Workbook_handle'=None) -> list[tuple[str, list[list[str]]]]:
+    """依次返回每个工作表的(表名, 前nrows行各自的候选md5值列表)，不支持的文件类型视为只有一个表头为空的工作表；
+    传入工作簿句柄时从句柄读取"""
+    if file_path.suffix not in ('.xlsx', '.xls'):
+        return [('', [[md5(b'').hexdigest()]])]
+    _sheets = read_sheets_head_rows(file_path, nrows) if book is None else book.sheets_head_rows(nrows)
+    return [(_name, [header_md5s(x, file_path.suffix == '.xls') for x in _rows]) for _name, _rows in _sheets]
+
+def match_header(md5_rows: list[list[str]], header_hash: dict) -> tuple[list, int]:
+    """依次用各行的候选md5值在header_hash中查找，返回(配置, 表头行号)，均未找到时返回(None, None)。
+    部分银行导出文件在表头之前有标题行，因此表头不一定在第0行"""
+    for i, _md5s in enumerate(md5_rows):
+        for _md5 in _md5s:
+            if (_conf_name := header_hash.get(_md5)) is not None:
+                return _conf_name, i
+    return None, None
+
+def _raw_header(row: list, xls: bool) -> str:
+    """原read_header的表头字符串格式：xlsx为tuple，xls为list"""
+    return str(list(row)) if xls else str(tuple(row))
+
+def _local(tag: str) -> str:
+    """去掉XML标签的命名空间，兼容transitional和strict两种格式"""
+    return tag.rsplit('}', 1)[-1]
+
+def _rel_targets(book: zipfile.ZipFile, part: str) -> dict:
+    """返回包内某个部件的关系：{关系id: (类型, 目标部件路径)}"""
+    _dir, _name = posixpath.split(part)
+    _rels = posixpath.join(_dir, '_rels', _name + '.rels')
+    _result = {}
+    for _rel in ET.fromstring(book.read(_rels)):
+        _target = _rel.get('Target')
+        _target = _target.lstrip('/') if _target.startswith('/') else posixpath.normpath(posixpath.join(_dir, _target))
+        _result[_rel.get('Id')] = (_rel.get('Type', ''), _target)
+    return _result
+
+def _sheet_parts(book: zipfile.ZipFile) -> tuple[dict, ET.Element, list]:
+    """返回工作簿部件的关系、workbook.xml根元素，以及按次序排列的[(表名, 工作表部件路径), ...]"""
+    _rels = _rel_targets(book, 'xl/workbook.xml')
+    _wb = ET.fromstring(book.read('xl/workbook.xml'))
+    _sheets = [(x.get('name'), _rels[next(v for k, v in x.attrib.items() if _local(k) == 'id')][1])
+               for x in _wb.iter() if _local(x.tag) == 'sheet']
+    return _rels, _wb, _sheets
+
+def _resolve_cells(book: zipfile.ZipFile, rels: dict, wb: ET.Element, sheets_rows: list) -> list:
+    """将多个工作表的行中尚未转换的单元格替换为值：共享字符串序号替换为字符串，共享字符串表只解析一次；
+    带样式的数值和ISO格式的日期按openpyxl的规则转换（见_date_converter）"""
+    _cells = [x for _rows in sheets_rows for _row in _rows for x in _row if isinstance(x, (_Shared, _Styled, _Iso))]
+    if not _cells:
+        return [[list(x) for x in _rows] for _rows in sheets_rows]
+    _strings, _convert = [], None
+    if (_indexes := [x.index for x in _cells if isinstance(x, _Shared)]):
+        _sst_part = next(v for t, v in rels.values() if t.endswith('/sharedStrings'))
+        _strings = _read_shared_strings(book, _sst_part, max(_indexes))
+    if any(not isinstance(x, _Shared) for x in _cells):
+        _convert = _date_converter(book, rels, wb)
+
+    def _value(cell):
+        if isinstance(cell, _Shared):
+            return _strings[cell.index]
+        return _convert(cell) if isinstance(cell, (_Styled, _Iso)) else cell
+    return [[[_value(x) for x in _row] for _row in _rows] for _rows in sheets_rows]
+
+def _date_converter(book: zipfile.ZipFile, rels: dict, wb: ET.Element):
+    """返回转换带样式数值和ISO格式日期的函数，与openpyxl读取时一致：样式的数字格式为日期格式时，
+    数值按工作簿的纪元（1900或1904）转换为日期时间，时长格式转换为timedelta。只在用到时导入openpyxl"""
+    from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+    from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
+    _pr = next((x for x in wb.iter() if _local(x.tag) == 'workbookPr'), None)
+    _epoch = CALENDAR_MAC_1904 if _pr is not None and _pr.get('date1904') in ('1', 'true') else CALENDAR_WINDOWS_1900
+    _dates, _deltas = set(), set() # 日期格式、时长格式的样式序号
+    if (_part := next((v for t, v in rels.values() if t.endswith('/styles')), None)) is not None:
+        _root = ET.fromstring(book.read(_part))
+        _custom = {int(x.get('numFmtId')): x.get('formatCode') for x in _root.iter() if _local(x.tag) == 'numFmt'}
+        _xfs = next((x for x in _root if _local(x.tag) == 'cellXfs'), ())
+        for i, _xf in enumerate(x for x in _xfs if _local(x.tag) == 'xf'):
+            _id = int(_xf.get('numFmtId', 0))
+            _fmt = _custom[_id] if _id in _custom else BUILTIN_FORMATS.get(_id)
+            if is_date_format(_fmt):
+                _dates.add(i)
+            if is_timedelta_format(_fmt):
+                _deltas.add(i)
+
+    def _convert(cell):
+        if isinstance(cell, _Iso):
+            return from_ISO8601(cell.text)
+        if cell.style not in _dates:
+            return cell.value
+        try:
+            return from_excel(cell.value, _epoch, timedelta=cell.style in _deltas)
+        except (OverflowError, ValueError): # 超出日期范围，openpyxl视为错误
+            return '#VALUE!'
+    return _convert
+
+def _read_sheets_head_rows_xlsx(file_path: pathlib.Path, nrows: int) -> list:
+    with zipfile.ZipFile(file_path) as _book:
+        _rels, _wb, _sheets = _sheet_parts(_book)
+        _rows = _resolve_cells(_book, _rels, _wb, [_read_sheet_rows(_book, x, nrows) for _, x in _sheets])
+        return [(_name, x) for (_name, _), x in zip(_sheets, _rows)]
+
+def _read_head_rows_xlsx(file_path: pathlib.Path, sheet, nrows: int) -> list:
+    with zipfile.ZipFile(file_path) as _book:
+        _rels, _wb, _sheets = _sheet_parts(_book)
+        if sheet is None:
+            _view = next((x for x in _wb.iter() if _local(x.tag) == 'workbookView'), None)
+            _part = _sheets[int(_view.get('activeTab', 0)) if _view is not None else 0][1]
+        elif type(sheet) == int:
+            _part = _sheets[sheet][1]
+        elif type(sheet) == str:
+            _part = dict(_sheets)[sheet]
+        else:
+            raise Exception(f"sheet参数只能为int或str")
+        return _resolve_cells(_book, _rels, _wb, [_read_sheet_rows(_book, _part, nrows)])[0]
+
+class _Shared:
+    """尚未解析的共享字符串序号"""
+    __slots__ = ('index',)
+
+    def __init__(self, index: int):
+        self.index = index
+
+class _Styled:
+    """尚未按样式转换的数值"""
+    __slots__ = ('value', 'style')
+
+    def __init__(self, value, style: int):
+        self.value = value
+        self.style = style
+
+class _Iso:
+    """尚未转换的ISO格式日期时间（t为d的单元格）"""
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+def _read_sheet_rows(book: zipfile.ZipFile, part: str, nrows: int) -> list:
+    """流式解析工作表XML的前nrows行，与openpyxl只读模式（reset_dimensions后）的values一致：
+    中间缺失的行为空行，行内缺失的单元格为None，每行到该行最后一个单元格为止"""
+    _rows = []
+    with book.open(part) as f:
+        for _event, _elem in ET.iterparse(f, events=('end',)):
+            _tag = _local(_elem.tag)
+            if _tag == 'sheetData':
+                break
+            if _tag != 'row':
+                continue
+            _idx = int(_elem.get('r', len(_rows) + 1))
+            _rows.extend([()] * (min(_idx - 1, nrows) - len(_rows))) # 缺失的行
+            if len(_rows) >= nrows:
+                break
+            _cells = {}
+            for _c in _elem:
+                if _local(_c.tag) != 'c':
+                    continue
+                _col = _col_index(_c.get('r')) if _c.get('r') else (max(_cells, default=0) + 1)
+                _cells[_col] = _cell_value(_c)
+            _rows.append(tuple(_cells.get(i) for i in range(1, max(_cells, default=0) + 1)))
+            _elem.clear()
+            if len(_rows) >= nrows:
+                break
+    return _rows
+
+def _col_index(ref: str) -> int:
+    """单元格引用（如AB12）转换为列序号（从1开始）"""
+    _col = 0
+    for _ch in ref:
+        if not _ch.isalpha():
+            break
+        _col = _col * 26 + ord(_ch.upper()) - 64
+    return _col
+
+def _cell_value(cell: ET.Element):
+    """按openpyxl（data_only）的规则转换单元格的值：公式单元格取缓存的计算结果，
+    共享字符串先返回序号，带样式的数值和ISO格式日期先返回待转换的对象"""
+    _type = cell.get('t', 'n')
+    _v = next((x.text for x in cell if _local(x.tag) == 'v'), None)
+    if _type == 'inlineStr':
+        _is = next((x for x in cell if _local(x.tag) == 'is'), None)
+        return None if _is is None else _rich_text(_is)
+    if not _v:
+        return None
+    match _type:
+        case 'n':
+            _num = float(_v) if '.' in _v or 'E' in _v or 'e' in _v else int(_v)
+            return _Styled(_num, int(_style)) if (_style := cell.get('s')) else _num
+        case 's':
+            return _Shared(int(_v))
+        case 'b':
+            return bool(int(_v))
+        case 'd':
+            return _Iso(_v)
+        case _: # str、e
+            return _v
 
-def _read_header_xlsx(file_path: pathlib.Path, sheet=None, header: int=0) -> str:
-    """读取文件表头，用于识别文件来源"""
-    _work_book = op.load_workbook(file_path, read_only=True)
-    if sheet is None:
-        _sheet = _work_book.active
-    elif type(sheet) == int:
-        _sheet = _work_book[_work_book.sheetnames[sheet]]
-    elif type(sheet) == str:
-        _sheet = _work_book[sheet]
-    else:
-        raise Exception(f"sheet参数只能为int或str") 
-    _sheet.calculate_dimension(force=True)
-    _sheet.reset_dimensions()
-    return str(next(islice(_sheet.values, header, header+1)))
-
-def _read_header_xls(file_path: pathlib.Path, sheet=None, header: int=0) -> str:
-    _work_book = xl.open_workbook(file_path, on_demand=True)
-    if sheet is None:
-        _sheet = _work_book.sheet_by_index(0)
-    elif type(sheet) == int:
-        _sheet = _work_book.sheet_by_index(sheet)
-    elif type(sheet) == str:
-        _sheet = _work_book.sheet_by_name(sheet)
-    else:
-        raise Exception(f"sheet参数只能为int或str") 
-    return str(_sheet.row_values(header))
+def _rich_text(elem: ET.Element) -> str:
+    """字符串内容：直接的t和各r中的t依次相连，不含注音"""
+    _parts = []
+    for x in elem:
+        match _local(x.tag):
+            case 't':
+                _parts.append(x.text or '')
+            case 'r':
+                _parts.extend(y.text or '' for y in x if _local(y.tag) == 't')
+    return ''.join(_parts)
 
+def _read_shared_strings(book: zipfile.ZipFile, part: str, last: int) -> list:
+    """流式解析共享字符串表，读到序号last为止"""
+    _strings = []
+    with book.open(part) as f:
+        for _event, _elem in ET.iterparse(f, events=('end',)):
+            if _local(_elem.tag) != 'si':
+                continue
+            _strings.append(_rich_text(_elem).replace('x005F_', ''))
+            _elem.clear()
+            if len(_strings) > last:
+                break
+    return _strings
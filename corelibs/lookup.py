@@ -0,0 +1,37 @@
+import pandas as pd
+
+
+
+class Acc_index:
+    """账户信息索引：按流水配置中的acc关联列，把合并后的账户信息预先整理为“关联键 => 取值”的映射，
+    每个银行只建立一次，各流水文件用向量化的map查找，代替逐文件drop_duplicates和pd.merge。
+    同一关联键对应多个不同取值的视为冲突，冲突的键不参与填充（保留流水原值），冲突明细保存在conflicts中"""
+
+    def __init__(self, df_acc: pd.DataFrame, acc_rel_cols: dict):
+        self.maps = {} # {(账户键列, 账户取值列): 以键为索引的取值Series}
+        self.conflicts = {} # {(账户键列, 账户取值列): 冲突的键和取值}
+        for _v in acc_rel_cols.values():
+            _key, _val = _v[0], _v[1]
+            if (_key, _val) in self.maps:
+                continue
+            _pairs = df_acc[[_key, _val]].dropna().drop_duplicates() # 取值为空的不参与查找，也不视为冲突
+            _dup = _pairs[_key].duplicated(keep=False)
+            if _dup.any():
+                self.conflicts[(_key, _val)] = _pairs[_dup].sort_values(_key, ignore_index=True)
+                _pairs = _pairs[~_dup]
+            self.maps[(_key, _val)] = pd.Series(_pairs[_val].to_numpy(), index=_pairs[_key].to_numpy())
+
+    def fill(self, df_stat: pd.DataFrame, acc_rel_cols: dict) -> pd.DataFrame:
+        """按配置填充流水列：以流水的键列查找账户取值，找不到的保留流水键列的值"""
+        for _k, _v in acc_rel_cols.items():
+            _src = df_stat[_v[2]]
+            if isinstance(_src.dtype, pd.CategoricalDtype): # 按取值查找并保留原值，分类类型由调用方恢复
+                _src = _src.astype(object)
+            df_stat[_k] = _src.map(self.maps[(_v[0], _v[1])]).combine_first(_src)
+        return df_stat
+
+    def describe_conflicts(self) -> list[str]:
+        """返回冲突情况的文字说明，每种关联一条"""
+        return [f'账户信息中{len(_df[_key].unique())}个{_key}对应多个{_val}，未用于填充：'
+                f'{",".join(map(str, _df[_key].unique()[:5]))}{"等" if _df[_key].nunique() > 5 else ""}'
+                for (_key, _val), _df in self.conflicts.items()]
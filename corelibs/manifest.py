@@ -0,0 +1,115 @@
+import json
+import pathlib
+from hashlib import md5
+from corelibs.config import get_conf_version
+from corelibs.storage import remove_outputs
+
+
+
+class Run_manifest:
+    """已处理文件清单：以文件路径为键记录文件内容md5、所属银行、该银行配置版本、应解析的类型以及各类型生成的输出文件，
+    存储为输出目录中的json文件。再次处理同一目录时跳过内容和配置均未变化且全部类型都已保存的文件；
+    内容或配置变化、或上次未完整保存的文件，先删除其原有输出再重新处理，因此重复运行不会产生重复输出"""
+
+    # 清单格式变化时修改版本号，使旧清单失效
+    VERSION = 1
+    FILE_NAME = '.manifest.json'
+
+    def __init__(self, output_dir: pathlib.Path, enabled: bool=True):
+        self.output_dir = pathlib.Path(output_dir)
+        self.enabled = enabled
+        self._path = self.output_dir.joinpath(self.FILE_NAME)
+        self._data = {}
+        if self.enabled and self._path.exists():
+            try:
+                with open(self._path, 'r', encoding='utf-8') as f:
+                    _d = json.load(f)
+                if _d.get('version') == self.VERSION:
+                    self._data = _d.get('files', {})
+            except (ValueError, OSError): # 清单损坏时忽略，全部重新处理
+                self._data = {}
+
+    def is_done(self, file: pathlib.Path) -> bool:
+        """文件已完整处理且此后文件内容和所属银行配置均未变化时返回真"""
+        _entry = self._data.get(_file_key(file))
+        if _entry is None or not set(_entry['types']).issubset(_entry['done']):
+            return False
+        return _entry['md5'] == self._content_md5(file, _entry) and _entry['conf'] == get_conf_version(_entry['bank'])
+
+    def prepare(self, files_list: list, groups: list=None) -> tuple[list, set]:
+        """返回需要处理的文件列表；其中曾经处理过的文件先删除原有输出并移出清单。
+        groups为共用同一输出的文件组（如拼接保存的同一账户拆分流水），组内任一文件需要处理时全组一并重新处理。
+        同时返回被删除了分区的(银行, 类型)集合，调用方据此重新合并分区"""
+        if not self.enabled:
+            return list(files_list), set()
+        _todo = {x for x in files_list if not self.is_done(x)}
+        for _group in groups or []:
+            if _todo.intersection(_group):
+                _todo.update(_group)
+        _files, _removed = [], set()
+        for _file in files_list:
+            if _file not in _todo:
+                continue
+            _files.append(_file)
+            if (_entry := self._data.pop(_file_key(_file), None)) is not None:
+                for _type, _outputs in _entry['outputs'].items():
+                    if remove_outputs(self.output_dir, _outputs) and _type != '流水':
+                        _removed.add((_entry['bank'], _type))
+        if len(_files) < len(files_list):
+            print(f'{len(files_list) - len(_files)}个文件已处理且未变化，跳过')
+        self.save()
+        return _files, _removed
+
+    def record(self, file: pathlib.Path, bank_name: str, types: list, file_type: str, outputs: list, 
+               done: bool=True) -> None:
+        """记录文件某一类型数据生成的输出文件，并立即写入清单；types为该文件应解析的全部类型。
+        保存中途出错时以done=False记录已写入的部分，下次处理前将其删除"""
+        if not self.enabled:
+            return
+        _key = _file_key(file)
+        _entry = self._data.get(_key)
+        if _entry is None or _entry['bank'] != bank_name:
+            _stat = pathlib.Path(file).stat()
+            _entry = self._data[_key] = {'size': _stat.st_size, 'mtime': _stat.st_mtime_ns, 'md5': _file_md5(file),
+                                         'bank': bank_name, 'conf': get_conf_version(bank_name),
+                                         'outputs': {}, 'done': []}
+        _entry['types'] = list(types)
+        _entry['outputs'][file_type] = [_relative(x, self.output_dir) for x in outputs]
+        if done and file_type not in _entry['done']:
+            _entry['done'].append(file_type)
+        self.save()
+
+    def save(self) -> None:
+        """将清单写入文件（先写临时文件再替换，避免中断时损坏清单）"""
+        if not self.enabled:
+            return
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        _tmp = self._path.with_suffix('.tmp')
+        with open(_tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'files': self._data}, f, ensure_ascii=False)
+        _tmp.replace(self._path)
+
+    @staticmethod
+    def _content_md5(file: pathlib.Path, entry: dict) -> str:
+        """返回文件内容md5：大小和修改时间与记录相同时直接使用记录值，否则重新计算"""
+        _stat = pathlib.Path(file).stat()
+        if [_stat.st_size, _stat.st_mtime_ns] == [entry['size'], entry['mtime']]:
+            return entry['md5']
+        return _file_md5(file)
+
+def _file_key(file: pathlib.Path) -> str:
+    return str(pathlib.Path(file).resolve())
+
+def _file_md5(file: pathlib.Path) -> str:
+    _md5 = md5()
+    with open(file, 'rb') as f:
+        while _block := f.read(1 << 20):
+            _md5.update(_block)
+    return _md5.hexdigest()
+
+def _relative(path: pathlib.Path, output_dir: pathlib.Path) -> str:
+    """输出文件保存为相对输出目录的路径，输出目录整体移动后清单仍然有效"""
+    try:
+        return str(pathlib.Path(path).relative_to(output_dir))
+    except ValueError:
+        return str(path)
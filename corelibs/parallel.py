@@ -0,0 +1,67 @@
+import os
+from collections import deque
+from itertools import islice
+from typing import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from tqdm.auto import tqdm
+from corelibs.config import get_conf_data, get_conf_cache, set_conf_data
+from corelibs.report import collect, add_records
+
+
+
+# 任务共享数据，在每个工作进程中只传递一次（如合并后的账户信息）
+_WORKER_STATE: dict = {}
+
+def get_worker_state() -> dict:
+    """返回当前进程中的任务共享数据"""
+    return _WORKER_STATE
+
+def _init_worker(conf_data: dict, conf_tpls: dict, state: dict) -> None:
+    """工作进程初始化：载入主进程的配置、已生成的操作配置和任务共享数据"""
+    set_conf_data(conf_data, conf_tpls)
+    _WORKER_STATE.clear()
+    _WORKER_STATE.update(state)
+
+def _call_job(func: Callable, item) -> tuple:
+    """工作进程中执行任务并收集各环节耗时记录，与结果一并返回主进程"""
+    with collect() as _records:
+        _result = func(item)
+    return _result, _records
+
+def run_jobs(func: Callable, items: list, jobs: int=1, desc: str='', state: dict=None) -> Iterator[tuple]:
+    """对每个item执行func(item)，按items原有次序逐个产出(item, 结果, 异常)。
+    jobs大于1时在进程池中执行（func和item须可pickle），最多同时提交jobs*2个任务以限制内存占用；
+    结果的保存由调用方在主进程中完成，保证只有一个写入者；工作进程中的耗时记录汇总到主进程的运行报告中"""
+    _state = state or {}
+    if jobs == 0:
+        jobs = os.cpu_count()
+    if jobs <= 1 or len(items) <= 1:
+        _WORKER_STATE.clear()
+        _WORKER_STATE.update(_state)
+        try:
+            for _item in tqdm(items, desc=desc):
+                try:
+                    _result = func(_item)
+                except Exception as e:
+                    yield _item, None, e
+                else:
+                    yield _item, _result, None
+        finally:
+            _WORKER_STATE.clear()
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, 
+                             initargs=(get_conf_data(), get_conf_cache(), _state)) as _executor, \
+         tqdm(total=len(items), desc=desc) as _bar:
+        _items = iter(items)
+        _pending = deque((x, _executor.submit(_call_job, func, x)) for x in islice(_items, jobs * 2))
+        while _pending:
+            _item, _future = _pending.popleft()
+            _exc = _future.exception()
+            _pending.extend((x, _executor.submit(_call_job, func, x)) for x in islice(_items, 1))
+            _bar.update()
+            if _exc:
+                yield _item, None, _exc
+                continue
+            _result, _records = _future.result()
+            add_records(_records)
+            yield _item, _result, None
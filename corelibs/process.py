@@ -1,168 +1,470 @@
 import pathlib
-from typing import Callable
-from tqdm.auto import tqdm
+from typing import Callable, Iterator
 from corelibs.config import *
-from corelibs.data import parse_sheet_general
-from corelibs.header import read_header
+from corelibs.data import parse_sheet_general, parse_sheet_chunks, to_category
+from corelibs.workbook import Workbook_handle
+import corelibs.classify
+from corelibs.classify import classify_files_by_category, get_file_layout
+from corelibs.parallel import run_jobs, get_worker_state
+from corelibs.report import Run_report, stage, profile
+from corelibs.lookup import Acc_index
+from corelibs.manifest import Run_manifest
 from corelibs.storage import *
-from hashlib import md5
 import pandas as pd
 
 
 
+# 原在本模块中定义，保留供from corelibs.process import *的调用方使用
+get_file_type = corelibs.classify.get_file_type
+
 def process_general_file(file: pathlib.Path, output_dir: pathlib.Path, bank_name: str, 
-                         file_type: str, header=0) -> pd.DataFrame:
-    """根据配置处理单个普通文件，并保存到特定目录"""
+                         file_type: str, header=0, book: Workbook_handle=None, sources: list=None) -> pd.DataFrame:
+    """根据配置处理单个普通文件，并保存到特定目录；sources见parse_sources"""
     _conf_obj = get_conf_obj(bank_name, file_type)
-    _df = parse_sheet_general(file, _conf_obj, prefunc=None, header=header)
+    _df = parse_sources(file, _conf_obj, book=book, header=header, sources=sources)
     save_general(_df, output_dir, bank_name, file_type)
     return _df
 
 def process_statment_file_general(file: pathlib.Path, output_dir: pathlib.Path, bank_name: str, file_type: str, doc_No: str=None, 
-                                  prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, df_acc: pd.DataFrame=None) -> pd.DataFrame:
-    """根据配置处理单个流水文件， 如果提供账户信息则按照配置更新流水信息，并保存到指定目录"""
+                                  prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, df_acc: pd.DataFrame=None,
+                                  book: Workbook_handle=None, chunksize: int=0, header: int=0, 
+                                  sources: list=None) -> pd.DataFrame:
+    """根据配置处理单个流水文件， 如果提供账户信息则按照配置更新流水信息，并保存到指定目录。
+    chunksize大于0时分块处理，各账户流水暂存到磁盘后逐个保存，此时不返回数据；sources见parse_sources"""
+    if chunksize > 0:
+        _spool = parse_statement_file_chunked(file, output_dir, bank_name, file_type, prefunc, df_acc, book, 
+                                              chunksize, header, sources)
+        _save_parsed(_spool, output_dir, bank_name, file_type, doc_No)
+        return None
+    _df = parse_statement_file(file, bank_name, file_type, prefunc, df_acc, book, header, sources)
+    save_statements(split_statements(_df), output_dir, bank_name, file_type, doc_No)
+    return _df
+
+def parse_statement_file(file: pathlib.Path, bank_name: str, file_type: str, 
+                         prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, df_acc: pd.DataFrame=None,
+                         book: Workbook_handle=None, header: int=0, sources: list=None) -> pd.DataFrame:
+    """根据配置解析单个流水文件，如果提供账户信息则按照配置更新流水信息，返回dataframe；sources见parse_sources"""
     _conf_obj = get_conf_obj(bank_name, file_type)
-    _df_stat = parse_sheet_general(file, _conf_obj, prefunc)
+    _df_stat = parse_sources(file, _conf_obj, prefunc, book, header, sources)
     if _conf_obj.acc_rel_cols and df_acc is not None:
-        _df = fill_stat_cols_by_acc(_df_stat, df_acc, _conf_obj.acc_rel_cols)
-    else:
-        _df = _df_stat
-    _grouped = _df.groupby('账号')
-    _df_list = [x.reset_index(drop=True) for _ , x in _grouped]
-    save_statements(_df_list, output_dir, bank_name, file_type, doc_No)
-    return _df
+        with stage('fill_acc', file) as _rec:
+            _df_stat = to_category(fill_stat_cols_by_acc(_df_stat, df_acc, _conf_obj.acc_rel_cols), 
+                                   _conf_obj.category_cols)
+            _rec['rows'] = len(_df_stat)
+    return _df_stat
+
+def parse_statement_file_chunked(file: pathlib.Path, output_dir: pathlib.Path, bank_name: str, file_type: str, 
+                                 prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, df_acc: pd.DataFrame=None,
+                                 book: Workbook_handle=None, chunksize: int=100000, header: int=0, 
+                                 sources: list=None) -> Statement_spool:
+    """分块解析单个流水文件：每块按配置处理并用账户信息丰富后按账号暂存到输出目录下，返回暂存对象。
+    内存占用只与chunksize和单个账户的流水量有关，与文件大小无关；sources见parse_sources，各数据表的块暂存到同一对象中"""
+    _conf_obj = get_conf_obj(bank_name, file_type)
+    if _conf_obj.acc_rel_cols and isinstance(df_acc, pd.DataFrame): # 各块共用同一个索引
+        df_acc = Acc_index(df_acc, _conf_obj.acc_rel_cols)
+    _spool = Statement_spool(output_dir)
+    try:
+        for _file, _header, _book in _iter_sources(file, sources, header, book):
+            for _df_stat in parse_sheet_chunks(_file, _conf_obj, prefunc, header=_header, book=_book, 
+                                               chunksize=chunksize):
+                if _conf_obj.acc_rel_cols and df_acc is not None:
+                    with stage('fill_acc', _file) as _rec:
+                        _df_stat = to_category(fill_stat_cols_by_acc(_df_stat, df_acc, _conf_obj.acc_rel_cols), 
+                                               _conf_obj.category_cols)
+                        _rec['rows'] = len(_df_stat)
+                with stage('spool', _file) as _rec:
+                    _spool.add(_df_stat)
+                    _rec['rows'] = len(_df_stat)
+    except:
+        _spool.cleanup()
+        raise
+    return _spool
+
+def parse_sources(file: pathlib.Path, conf_obj: Conf_tpl, prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, 
+                  book: Workbook_handle=None, header: int=0, sources: list=None) -> pd.DataFrame:
+    """按配置解析数据表，返回dataframe。sources为[(文件, 工作表, 表头行号), ...]时依次解析这些工作表并合并，
+    可以是同一工作簿中的多个工作表，也可以是拆分保存的多个文件，同一文件的工作表共用一次打开；
+    不给出时解析file默认工作表中以第header行为表头的数据表"""
+    _dfs = [parse_sheet_general(_file, conf_obj, prefunc, header=_header, book=_book)
+            for _file, _header, _book in _iter_sources(file, sources, header, book)]
+    return _dfs[0] if len(_dfs) == 1 else concat_frames(_dfs, ignore_index=True)
+
+def _iter_sources(file: pathlib.Path, sources: list=None, header: int=0, 
+                  book: Workbook_handle=None) -> Iterator[tuple]:
+    """依次产出(文件, 表头行号, 已选定工作表的工作簿句柄)：相邻的同一文件的工作表共用一个句柄，
+    传入的句柄用于与其同一文件的工作表，由调用方关闭；其他句柄在此打开和关闭"""
+    _book = book
+    try:
+        for _file, _sheet, _header in sources or [(file, None, header)]:
+            if _book is None or _book.file_path != _file:
+                if _book is not book:
+                    _book.close()
+                _book = Workbook_handle(_file, _sheet)
+            yield _file, _header, _book.select(_sheet)
+    finally:
+        if _book is not None and _book is not book:
+            _book.close()
+
+def group_split_files(files_list: list, split_files: tuple=None) -> list[list]:
+    """将因条数上限被拆分保存的同一账户流水文件分为一组：文件名（不含后缀）按split_files[0]分割后
+    第split_files[1]个值相同的为一组，组内按文件名排序，各组按首个文件在files_list中的次序排列；
+    未配置split_files或文件名中没有该位置时每个文件单独一组"""
+    if not split_files:
+        return [[x] for x in files_list]
+    _delimiter, _index = split_files
+    _groups = {}
+    for _file in files_list:
+        _parts = _file.stem.split(_delimiter)
+        _groups.setdefault(_parts[_index] if -len(_parts) <= _index < len(_parts) else _file, []).append(_file)
+    return [sorted(x, key=lambda f: f.name) for x in _groups.values()]
 
-def fill_stat_cols_by_acc(df_stat: pd.DataFrame, df_acc: pd.DataFrame, acc_rel_cols: dict) -> pd.DataFrame:
-    for _k, _v in acc_rel_cols.items():
-        _df_acc = df_acc[_v[:2]].drop_duplicates()
-        df_stat = pd.merge(df_stat, _df_acc, left_on=_v[2], right_on=_v[0], how='left', 
-                           validate='m:1', copy=False, suffixes=('', '_d'))
-        _col_d = _v[1] + '_d'
-        df_stat[_k] = df_stat[_col_d].combine_first(df_stat[_v[2]])
-        # df_stat.drop(_col_d, axis=1, errors='ignore', inplace=True)
-    return df_stat
+def split_statements(df: pd.DataFrame) -> list[pd.DataFrame]:
+    """将流水按账号分组，返回每个账号一个dataframe的列表"""
+    return [x.reset_index(drop=True) for _ , x in df.groupby('账号')]
+
+def fill_stat_cols_by_acc(df_stat: pd.DataFrame, df_acc: pd.DataFrame | Acc_index, acc_rel_cols: dict) -> pd.DataFrame:
+    """根据账户信息填充流水列。批量处理时传入预先建立的账户信息索引；
+    传入dataframe时临时建立索引，关联键冲突时给出提示"""
+    if isinstance(df_acc, pd.DataFrame):
+        df_acc = Acc_index(df_acc, acc_rel_cols)
+        for _msg in df_acc.describe_conflicts():
+            print(_msg)
+    return df_acc.fill(df_stat, acc_rel_cols)
         
 def process_files_1by1(files_list: list, output_dir: pathlib.Path, doc_No: str=None, 
-                       prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None) -> dict:
+                       prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, jobs: int=None, 
+                       incremental: bool=None, writer_workers: int=None) -> dict:
     """根据配置处理多个文件，跳过出错文件，返回出错文件字典。
-    本函数依次处理每个文件，不能根据账户信息丰富流水数据。"""
-    _err_file_dict = {} # 保存解析出错的文件和原因
-    for _file in tqdm(files_list, desc='分析目录文件'):
-        print(f'{_file.name}……', end='')
-        _conf_name = get_file_type(_file)
-        if _conf_name is None:
-            print(_msg := '未找到对应配置，跳过')
-            _err_file_dict[_file] = _msg
-            continue
-        else:
+    本函数依次处理每个文件，不能根据账户信息丰富流水数据，也不合并拆分保存的同一账户流水文件（各自保存）。
+    每个文件只打开一次，表头识别和数据读取共用同一个工作簿句柄；工作簿中的每个工作表分别识别，
+    客户、账户、流水分表保存的文件一次处理全部类型，同一类型分布在多个工作表时合并解析。
+    jobs为并行解析的进程数（默认取配置项），并行时prefunc须为模块级函数；写入文件统一在主进程中完成。
+    按配置在输出目录中保存运行报告（各文件各环节耗时）。
+    incremental为真时（默认取配置项）跳过已处理且未变化的文件，变化的文件先删除原有输出再重新处理。
+    writer_workers（默认取配置项）大于0时在写入进程中写入输出文件，文件写入完成后才在处理清单中记为完成，写入失败的文件记入出错文件。"""
+    with Run_report(output_dir, get_run_report()) as _report, \
+         Output_writer(_get_writer_workers(writer_workers), get_writer_queue()) as _writer:
+        _err_file_dict = _report.errors # 保存解析出错的文件和原因
+        _manifest = Run_manifest(output_dir, get_incremental() if incremental is None else incremental)
+        _files, _removed = _manifest.prepare(files_list)
+        _saved_general = set(_removed) # 保存过（或删除过）非流水数据的银行和类型，用于最后合并分区
+        _items = [(_file, prefunc, output_dir) for _file in _files]
+        for (_file, *_), _result, _exc in run_jobs(_parse_file_job, _items, _get_jobs(jobs), '分析目录文件'):
+            print(f'{_file.name}……', end='')
+            if _exc is not None:
+                print(_msg := str(_exc))
+                _err_file_dict[_file] = _msg
+                continue
+            _conf_name, _parsed = _result
+            if _conf_name is None:
+                print(_msg := '未找到对应配置，跳过')
+                _err_file_dict[_file] = _msg
+                continue
             print(f'{_conf_name[0]}', end=':')
-            for x in _conf_name[1:]:
-                try:
-                    match x:
-                        case '客户' | '账户':
-                            process_general_file(_file, output_dir, _conf_name[0], x)
-                        case '流水':
-                            process_statment_file_general(_file, output_dir, _conf_name[0], x, doc_No, prefunc)
-                        case _:
-                            raise Exception(f"{x}暂不支持") 
-                except Exception as e:
-                    print( _msg := str(e), end=':')
-                    _err_file_dict[_file] = _conf_name[0] + _msg
-                else:
+
+            def _on_error(exc: Exception, file: pathlib.Path=_file, bank_name: str=_conf_name[0]) -> None:
+                print(f'{file.name}……' + (_msg := f'写入失败：{exc}'))
+                _err_file_dict[file] = bank_name + _msg
+
+            for x, _data, _msg in _parsed:
+                if _msg is None:
+                    try:
+                        with stage('save', _file) as _rec:
+                            _rec['rows'] = _save_recorded(_manifest, {_file: _conf_name[1:]}, _data, 
+                                                          output_dir, _conf_name[0], x, doc_No, _writer, _on_error)
+                    except Exception as e:
+                        _msg = str(e)
+                    else:
+                        if x != '流水':
+                            _saved_general.add((_conf_name[0], x))
+                if _msg is None:
                     print(f'{x}完成', end=':')
+                else:
+                    print(_msg, end=':')
+                    _err_file_dict[_file] = _conf_name[0] + _msg
             print()
-    print('\n'.join([f'{len(_err_file_dict)}个文件出错：'] + 
-                    [f'{_f.name} => {_m}' for _f, _m in _err_file_dict.items()]))    
-    return _err_file_dict
+        _writer.wait() # 合并分区前等待分区文件全部写入
+        for _bank, _type in _saved_general:
+            _compact_general(output_dir, _bank, _type)
+        print('\n'.join([f'{len(_err_file_dict)}个文件出错：'] + 
+                        [f'{_f.name} => {_m}' for _f, _m in _err_file_dict.items()]))    
+        return _err_file_dict
     
 def process_files_accs_then_stats(files_list: list, output_dir: pathlib.Path, doc_No: str=None, 
-                                  prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, df_acc: pd.DataFrame=None) -> list:
+                                  prefunc: Callable[[pd.DataFrame], pd.DataFrame]=None, df_acc: pd.DataFrame=None,
+                                  jobs: int=None, on_error: str=None, incremental: bool=None, 
+                                  writer_workers: int=None) -> list:
     """根据配置处理多个文件，跳过出错文件，返回处理文件个数和出错文件列表。
     本函数先根据文件类型将文件分类，依次处理账户文件和流水文件，因此可以根据账户信息丰富流水数据。
+    工作簿中的每个工作表分别识别，客户、账户、流水分表保存的文件按类型分别解析相应的工作表；
+    银行流水配置了split_files时，拆分保存的同一账户流水文件合并为一组解析和保存，不必手动合并。
+    jobs为并行解析的进程数，on_error为出错时的策略（ask/continue/abort），默认均取配置项；
+    并行时每个银行的全部账户文件处理完成后才开始处理流水文件，写入文件统一在主进程中完成。
+    按配置在输出目录中保存运行报告（各文件各环节耗时）。
+    incremental为真时（默认取配置项）跳过已处理且未变化的文件，变化的文件先删除原有输出再重新处理；
+    银行有需要处理的文件时，该银行的全部账户文件仍会解析以便丰富流水，但只保存需要处理的文件。
+    writer_workers（默认取配置项）大于0时在写入进程中写入输出文件，文件写入完成后才在处理清单中记为完成，写入失败的文件记入出错文件。
     返回解析好的账户信息和出错文件字典组成的列表"""
-    # 首先对文件列表根据表头类型进行分组，得到分组文件字典和出错文件字典
-    _file_cate, _err_file_dict = classify_files_by_category(files_list)
-    print(f"{len(_err_file_dict)}个文件未识别：[Y继续/非Y显示详情并退出]")
-    if _err_file_dict and input().lower() != 'y':
-        print('\n'.join([f'{_f.name} => {_m}' for _f, _m in _err_file_dict.items()]))
+    with Run_report(output_dir, get_run_report()) as _report, \
+         Output_writer(_get_writer_workers(writer_workers), get_writer_queue()) as _writer:
+        _jobs = _get_jobs(jobs)
+        _on_error = on_error or get_on_error()
+        # 首先对文件列表根据表头类型进行分组，得到分组文件字典和出错文件字典
+        _layouts = {} # 各文件各类型数据所在的工作表和表头行号
+        _file_cate, _err_file_dict = classify_files_by_category(files_list, output_dir, _layouts)
+        _report.errors = _err_file_dict
+        print(f"{len(_err_file_dict)}个文件未识别：[Y继续/非Y显示详情并退出]")
+        if not _confirm_continue(_err_file_dict, _on_error):
+            print('\n'.join([f'{_f.name} => {_m}' for _f, _m in _err_file_dict.items()]))
+            return None
+        _manifest = Run_manifest(output_dir, get_incremental() if incremental is None else incremental)
+        _file_types = {} # 每个文件应解析的全部类型
+        for _dict_files in _file_cate.values():
+            for _type, _files in _dict_files.items():
+                for _file in _files:
+                    _file_types.setdefault(_file, []).append(_type)
+        _stat_groups = {} # 各银行的流水文件分组，拆分保存的同一账户流水为一组
+        for _bank, _dict_files in _file_cate.items():
+            if '流水' in _dict_files:
+                _stat_groups[_bank] = group_split_files(_dict_files['流水'], get_conf_obj(_bank, '流水').split_files)
+        _pending = set(_manifest.prepare(list(_file_types), 
+                                         [x for _groups in _stat_groups.values() for x in _groups if len(x) > 1])[0])
+
+        def _sources(files: list, file_type: str) -> list:
+            """返回一组文件中该类型数据所在的[(文件, 工作表, 表头行号), ...]"""
+            return [(_file, _sheet, _header) for _file in files for _sheet, _header in _layouts[_file][file_type]]
+
+        def _save(bank_name: str, file_type: str, doc_No: str=None) -> Callable:
+            """返回保存函数：只保存需要处理的文件（未变化的账户文件只用于丰富流水），并为组内各文件记入处理清单"""
+            def _save_item(item: tuple, data, on_error: Callable) -> int:
+                _files = list(dict.fromkeys(x[0] for x in item[-1]))
+                if _pending.isdisjoint(_files):
+                    return 0
+                return _save_recorded(_manifest, {x: _file_types[x] for x in _files}, data, 
+                                      output_dir, bank_name, file_type, doc_No, _writer, on_error)
+            return _save_item
+
+        _df_acc = df_acc # 没有需要处理的银行时返回传入的账户信息
+        if not _pending:
+            print('没有需要处理的文件')
+            return [_df_acc, _err_file_dict]
+        # 对每一个银行首先处理所有账户文件，然后依次处理流水文件，并根据账户信息和配置填充流水文件相关列
+        for _bank, _dict_files in _file_cate.items():
+            if not any(_file in _pending for _files in _dict_files.values() for _file in _files):
+                print(f'{_bank}:没有需要处理的文件')
+                continue
+            # 先处理所有账户文件，得到该银行所有账户文件DataFrame的列表
+            _items = [(_file, _bank, '账户', _sources([_file], '账户')) for _file in _dict_files.pop('账户', [])]
+            _df_list, _err_files_tmp = _run_and_save(_parse_general_job, _items, _jobs, f'{_bank}:账户',
+                                                     _save(_bank, '账户'),
+                                                     {'output_dir': output_dir}, writer=_writer)
+            print(f"{len(_err_files_tmp)}个账户文件出错：[Y继续/非Y显示详情并退出]")
+            if not _confirm_continue(_err_files_tmp, _on_error):
+                print('\n'.join([f'{_f.name} => {_m}' for _f, _m in _err_files_tmp.items()]))
+                return None
+            _err_file_dict.update(_err_files_tmp)
+
+            # 得到全部账户信息
+            _df_acc = concat_frames(_df_list, ignore_index=True) if _df_list else None
+            if df_acc is not None:
+                _df_acc = concat_frames([_df_acc, df_acc], ignore_index=True)
+
+            # 再依次处理流水文件，账户信息预先整理为索引，作为任务共享数据在每个工作进程中只传递一次
+            _dict_files.pop('流水', None)
+            _items = [(_group[0], _bank, '流水', prefunc, _sources(_group, '流水')) 
+                      for _group in _stat_groups.get(_bank, []) if not _pending.isdisjoint(_group)]
+            if (_split := [x for x in _items if len({y[0] for y in x[-1]}) > 1]):
+                print(f'{_bank}:{len(_split)}组拆分保存的流水文件合并处理：' + 
+                      '；'.join(','.join(dict.fromkeys(y[0].name for y in x[-1])) for x in _split))
+            _acc_index = _build_acc_index(_bank, _df_acc, _report) if _items else None
+            _, _err_files_tmp = _run_and_save(_parse_statement_job, _items, _jobs, f'{_bank}:流水',
+                                              _save(_bank, '流水', doc_No),
+                                              {'df_acc': _acc_index, 'output_dir': output_dir}, keep_results=False,
+                                              writer=_writer)
+            print(f"{len(_err_files_tmp)}个流水文件出错：")
+            _err_file_dict.update(_err_files_tmp)
+
+           # 最后处理所有客户文件
+            _items = [(_file, _bank, '客户', _sources([_file], '客户')) for _file in _dict_files.pop('客户', []) 
+                      if _file in _pending]
+            _, _err_files_tmp = _run_and_save(_parse_general_job, _items, _jobs, f'{_bank}:客户',
+                                              _save(_bank, '客户'),
+                                              {'output_dir': output_dir}, keep_results=False, writer=_writer)
+            print(f"{len(_err_files_tmp)}个客户文件出错：")
+            _err_file_dict.update(_err_files_tmp)
+            for _type in ('账户', '客户'):
+                _compact_general(output_dir, _bank, _type)
+ 
+            if _dict_files:
+                print(f'{_bank}:{[f for f in _dict_files]}暂不支持')
+        print('\n'.join([f'共{len(_err_file_dict)}个文件出错：'] + [f'{_f.name} => {_m}' for _f, _m in _err_file_dict.items()]))    
+        return [_df_acc, _err_file_dict]
+
+def _build_acc_index(bank_name: str, df_acc: pd.DataFrame, report: Run_report) -> Acc_index:
+    """按银行流水配置中的关联列建立账户信息索引，关联键冲突时提示并记入运行报告；无需关联时返回None"""
+    _acc_rel_cols = get_conf_obj(bank_name, '流水').acc_rel_cols
+    if df_acc is None or not _acc_rel_cols:
         return None
-    # 对每一个银行首先处理所有账户文件，然后依次处理流水文件，并根据账户信息和配置填充流水文件相关列
-    for _bank, _dict_files in _file_cate.items():
-        _df_list = [] # 存储所有该银行账户文件DataFrame的列表
-        _err_files_tmp = {} # 该银行下的临时错误文件字典
+    with stage('acc_index') as _rec:
+        _acc_index = Acc_index(df_acc, _acc_rel_cols)
+        _rec['rows'] = len(df_acc)
+    for _msg in _acc_index.describe_conflicts():
+        print(_msg := f'{bank_name}:{_msg}')
+        report.warnings.append(_msg)
+    return _acc_index
 
-        # 先处理所有账户文件
-        for _file in tqdm(_dict_files.pop('账户', []), desc=f'{_bank}:账户'):          
-            print(f'{_file.name}……', end='')
-            try:    
-                _df_list.append(process_general_file(_file, output_dir, _bank, '账户'))
-            except Exception as e:
-                print( _msg := str(e))
-                _err_files_tmp[_file] = _msg
-                # raise e # debug
-            else:
-                print('完成')
-        print(f"{len(_err_files_tmp)}个账户文件出错：[Y继续/非Y显示详情并退出]")
-        if _err_files_tmp and input().lower() != 'y':
-            print('\n'.join([f'{_f.name} => {_m}' for _f, _m in _err_files_tmp.items()]))
-            return None
-        _err_file_dict.update(_err_files_tmp)
+def _compact_general(output_dir: pathlib.Path, bank_name: str, file_type: str) -> None:
+    """按配置将银行非流水数据的分区合并为一个文件"""
+    if get_compact_general():
+        with stage('compact'):
+            compact_general(output_dir, file_type, bank_name)
 
-        # 得到全部账户信息
-        _df_acc = pd.concat(_df_list, ignore_index=True) if _df_list else None
-        if df_acc:
-            _df_acc = pd.concat([_df_acc, df_acc], ignore_index=True)
+def _get_jobs(jobs: int=None) -> int:
+    """返回并行进程数：未指定时取配置项"""
+    return get_jobs() if jobs is None else jobs
 
-        _err_files_tmp = {} # 错误文件字典清零
-        # 再依次处理流水文件
-        for _file in tqdm(_dict_files.pop('流水', []), desc=f'{_bank}:流水'):          
-            print(f'{_file.name}……', end='')
-            try:    
-                process_statment_file_general(_file, output_dir, _bank, '流水', doc_No, prefunc, _df_acc)
+def _get_writer_workers(writer_workers: int=None) -> int:
+    """返回写入进程数：未指定时取配置项"""
+    return get_writer_workers() if writer_workers is None else writer_workers
+
+def _confirm_continue(err_file_dict: dict, on_error: str) -> bool:
+    """存在出错文件时根据策略决定是否继续：ask询问用户，continue直接继续，abort退出"""
+    if not err_file_dict:
+        return True
+    match on_error:
+        case 'ask':
+            return input().lower() == 'y'
+        case 'continue':
+            return True
+        case 'abort':
+            return False
+        case _:
+            raise Exception(f"on_error只能为ask、continue或abort：{on_error}")
+
+def _run_and_save(job: Callable, items: list, jobs: int, desc: str, 
+                  save: Callable, state: dict=None, keep_results: bool=True, 
+                  writer: Output_writer=None) -> tuple[list, dict]:
+    """并行解析文件，并在主进程中以save(item, 解析结果, 写入出错时的回调)依次保存，返回解析结果列表和出错文件字典；
+    keep_results为False时保存后即丢弃解析结果，返回空列表，避免全部结果同时驻留内存。
+    传入写入器时写入与后续文件的解析同时进行，返回前等待全部写入完成，写入失败的文件也记入出错文件字典"""
+    _results = []
+    _err_files = {}
+    for _item, _result, _exc in run_jobs(job, items, jobs, desc, state):
+        _file = _item[0]
+        print(f'{_file.name}……', end='')
+
+        def _on_error(exc: Exception, file: pathlib.Path=_file) -> None:
+            print(f'{file.name}……' + (_msg := f'写入失败：{exc}'))
+            _err_files[file] = _msg
+
+        if _exc is None:
+            try:
+                with stage('save', _file) as _rec:
+                    _rec['rows'] = save(_item, _result, _on_error)
             except Exception as e:
-                print( _msg := str(e))
-                _err_files_tmp[_file] = _msg
-            else:
-                print('完成')
-        print(f"{len(_err_files_tmp)}个流水文件出错：")
-        _err_file_dict.update(_err_files_tmp)
+                _exc = e
+        if _exc is None:
+            print('完成')
+            if keep_results:
+                _results.append(_result)
+        else:
+            print( _msg := str(_exc))
+            _err_files[_file] = _msg
+    if writer is not None:
+        writer.wait()
+    return _results, _err_files
 
-        _err_files_tmp = {} # 错误文件字典清零
-       # 最后处理所有客户文件
-        for _file in tqdm(_dict_files.pop('客户', []), desc=f'{_bank}:客户'):          
-            print(f'{_file.name}……', end='')
-            try:    
-                process_general_file(_file, output_dir, _bank, '客户')
+def _save_parsed(data, output_dir: pathlib.Path, bank_name: str, file_type: str, doc_No: str=None, 
+                 written: list=None, writer: Output_writer=None) -> int:
+    """保存解析结果：流水数据为按账号分组的列表或分块处理的暂存对象，其他数据为dataframe"""
+    if isinstance(data, Statement_spool):
+        try:
+            return save_statements(data.accounts(), output_dir, bank_name, file_type, doc_No, written, writer)
+        finally:
+            data.cleanup()
+    if file_type == '流水':
+        return save_statements(data, output_dir, bank_name, file_type, doc_No, written, writer)
+    return save_general(data, output_dir, bank_name, file_type, written=written, writer=writer)
+
+def _save_recorded(manifest: Run_manifest, files: dict, data, output_dir: pathlib.Path, 
+                   bank_name: str, file_type: str, doc_No: str=None, writer: Output_writer=None, 
+                   on_error: Callable[[Exception], None]=None) -> int:
+    """保存解析结果并在处理清单中为files（{文件: 该文件应解析的全部类型}，合并解析的多个文件共用同一输出）
+    记录生成的输出文件；保存出错时记录已写入的部分后重新抛出。
+    传入写入器时先将输出文件记为未完成，全部写入完成后才记为完成（中途中断时下次删除重新处理），
+    写入失败时保持未完成并调用on_error(异常)"""
+    _written = []
+
+    def _record(done: bool) -> None:
+        for _file, _types in files.items():
+            manifest.record(_file, bank_name, _types, file_type, _written, done)
+
+    def _on_written(exc: Exception) -> None:
+        _record(exc is None)
+        if exc is not None and on_error is not None:
+            on_error(exc)
+
+    try:
+        _rows = _save_parsed(data, output_dir, bank_name, file_type, doc_No, _written, writer)
+    except:
+        _record(False)
+        raise
+    if writer is None:
+        _record(True)
+    else:
+        _record(False)
+        writer.then(_written, _on_written)
+    return _rows
+
+def _parse_file_job(item: tuple) -> tuple:
+    """进程池任务：识别并解析单个文件的全部类型，返回(配置名, [(类型, 解析结果, 错误信息), ...])"""
+    _file, _prefunc, _output_dir = item
+    _chunk_rows = get_chunk_rows()
+    _parsed = []
+    with profile(_file, _output_dir), Workbook_handle(_file) as _book:
+        with stage('header', _file):
+            _conf_name, _layout = get_file_layout(_file, _book)
+        _shared = {tuple(x) for x in _layout.values()}
+        if len(_shared) == 1 and len(_conf_name) > 2 and len(_one := next(iter(_shared))) == 1 and \
+           not (_chunk_rows > 0 and '流水' in _conf_name[1:]):
+            # 多种类型共用同一数据表时，先读取各类型所需列的并集；流水分块解析时不整表读取，各类型分别读取
+            _sheet, _header = _one[0]
+            _book.select(_sheet).read_df(_header, frozenset().union(*[get_conf_obj(_conf_name[0], x).src_cols 
+                                                                      for x in _conf_name[1:]]))
+        for x in (_conf_name or [])[1:]:
+            _sources = [(_file, _sheet, _header) for _sheet, _header in _layout[x]]
+            try:
+                match x:
+                    case '客户' | '账户':
+                        _data = parse_sources(_file, get_conf_obj(_conf_name[0], x), book=_book, sources=_sources)
+                    case '流水' if _chunk_rows > 0:
+                        _data = parse_statement_file_chunked(_file, _output_dir, _conf_name[0], x, _prefunc, 
+                                                             book=_book, chunksize=_chunk_rows, sources=_sources)
+                    case '流水':
+                        _data = split_statements(parse_statement_file(_file, _conf_name[0], x, _prefunc, book=_book,
+                                                                      sources=_sources))
+                    case _:
+                        raise Exception(f"{x}暂不支持") 
             except Exception as e:
-                print( _msg := str(e))
-                _err_files_tmp[_file] = _msg
+                _parsed.append((x, None, str(e)))
             else:
-                print('完成')
-        print(f"{len(_err_files_tmp)}个客户文件出错：")
-        _err_file_dict.update(_err_files_tmp)
- 
-        if _dict_files:
-            print(f'{_bank}:{[f for f in _dict_files]}暂不支持')
-    print('\n'.join([f'共{len(_err_file_dict)}个文件出错：'] + [f'{_f.name} => {_m}' for _f, _m in _err_file_dict.items()]))    
-    return [_df_acc, _err_file_dict]
-
-def classify_files_by_category(files_list: list) -> tuple[dict, dict]:
-    """将文件列表按照配置分组，返回分组后的字典和无法识别的文件字典"""
-    _file_cate = {} # 保存识别后的文件类型
-    _err_file_dict = {} # 保存解析出错的文件和原因
-    for _file in tqdm(files_list, desc='识别文件类型'):
-        print(f'{_file.name} => ', end='')
-        _conf_name = get_file_type(_file)
-        if _conf_name is None: # 如果未成功识别
-            print(_msg := '未找到对应配置，跳过')
-            _err_file_dict[_file] = _msg
-        else:
-            print(f'{":".join(_conf_name)}')
-            for x in _conf_name[1:]:
-                _file_cate.setdefault(_conf_name[0], {}).setdefault(x, []).append(_file)
-    return _file_cate, _err_file_dict
-
-def get_file_type(file: pathlib.Path) -> list:
-    """根据文件表头找到该文件类型,亦即解析文件配置入口"""
-    _header = read_header(file).encode() # 读取每个文件的表头
-    return get_header_hash().get(md5(_header).hexdigest()) # 根据表头md5值找到相应的配置
+                _parsed.append((x, _data, None))
+    return _conf_name, _parsed
+
+def _parse_general_job(item: tuple) -> pd.DataFrame:
+    """进程池任务：解析单个非流水文件中该类型的数据表"""
+    _file, _bank, _type, _sources = item
+    with profile(_file, get_worker_state()['output_dir']):
+        return parse_sources(_file, get_conf_obj(_bank, _type), sources=_sources)
+
+def _parse_statement_job(item: tuple) -> list[pd.DataFrame]:
+    """进程池任务：解析单个流水文件（或拆分保存的一组流水文件）中的流水数据表，使用任务共享数据中的账户信息丰富流水，
+    返回按账号分组的列表；配置了分块行数时分块解析，返回暂存对象"""
+    _file, _bank, _type, _prefunc, _sources = item
+    _state = get_worker_state()
+    _df_acc = _state.get('df_acc')
+    with profile(_file, _state['output_dir']):
+        if (_chunk_rows := get_chunk_rows()) > 0:
+            return parse_statement_file_chunked(_file, _state['output_dir'], _bank, _type, _prefunc, _df_acc, 
+                                                chunksize=_chunk_rows, sources=_sources)
+        return split_statements(parse_statement_file(_file, _bank, _type, _prefunc, _df_acc, sources=_sources))
@@ -0,0 +1,171 @@
+import cProfile
+import csv
+import io
+import json
+import os
+import pathlib
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from fnmatch import fnmatch
+from corelibs.config import get_profile
+
+
+
+# 运行报告和性能分析结果保存在输出目录的该子目录中
+REPORT_DIR = '0运行报告'
+_RECORD_FIELDS = ['file', 'stage', 'seconds', 'rows', 'pid', 'peak_rss']
+
+# 本进程中记录的各环节耗时，收集开启时才记录
+_RECORDS: list = []
+_COLLECTING: bool = False
+
+def peak_rss() -> int:
+    """返回本进程的峰值常驻内存字节数，无法获取时返回None"""
+    try:
+        import resource
+    except ImportError: # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return getattr(psutil.Process().memory_info(), 'peak_wset', None)
+    _rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return _rss if sys.platform == 'darwin' else _rss * 1024
+
+@contextmanager
+def stage(name: str, file: pathlib.Path=None):
+    """记录一个处理环节的耗时：with stage('read', file) as rec: ... rec['rows'] = len(df)。
+    未开启收集时只产出一个不保存的记录，几乎没有开销"""
+    _record = {'file': None if file is None else str(file), 'stage': name, 'rows': None}
+    if not _COLLECTING:
+        yield _record
+        return
+    _t = time.perf_counter()
+    try:
+        yield _record
+    finally:
+        _record['seconds'] = round(time.perf_counter() - _t, 6)
+        _record['pid'] = os.getpid()
+        _record['peak_rss'] = peak_rss()
+        _RECORDS.append(_record)
+
+@contextmanager
+def collect():
+    """在本进程中开启收集，结束时产出的列表中为期间的全部记录（用于工作进程把记录带回主进程）"""
+    global _COLLECTING
+    _old, _start = _COLLECTING, len(_RECORDS)
+    _COLLECTING = True
+    _records = []
+    try:
+        yield _records
+    finally:
+        _COLLECTING = _old
+        _records.extend(_RECORDS[_start:])
+        del _RECORDS[_start:]
+
+def add_records(records: list) -> None:
+    """加入其他进程中收集的记录，本进程未开启收集时忽略"""
+    if _COLLECTING:
+        _RECORDS.extend(records)
+
+@contextmanager
+def profile(file: pathlib.Path, output_dir: pathlib.Path, enabled: bool=None):
+    """对单个文件的处理进行cProfile分析，结果保存为输出目录中的“时间_文件名.prof”及按累计耗时排序的txt。
+    enabled为None时按配置项profile（文件名通配符）决定是否分析"""
+    if enabled is None:
+        enabled = bool(get_profile()) and fnmatch(pathlib.Path(file).name, get_profile())
+    if not enabled:
+        yield
+        return
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+    try:
+        yield
+    finally:
+        _profiler.disable()
+        _dir = pathlib.Path(output_dir).joinpath(REPORT_DIR)
+        _dir.mkdir(parents=True, exist_ok=True)
+        _path = _dir.joinpath(f'{datetime.now():%Y%m%d-%H%M%S}_{pathlib.Path(file).name}.prof')
+        _profiler.dump_stats(_path)
+        _text = io.StringIO()
+        pstats.Stats(_profiler, stream=_text).sort_stats('cumulative').print_stats(40)
+        _path.with_suffix('.txt').write_text(_text.getvalue(), encoding='utf-8')
+
+class Run_report:
+    """批量处理的运行报告：收集期间各文件各环节的耗时、行数和峰值内存（含工作进程）以及流水校验结果，
+    退出时与出错文件字典（errors，由调用方在处理过程中更新）一起保存为输出目录中的json（含按环节汇总）和csv（逐条记录）"""
+
+    def __init__(self, output_dir: pathlib.Path, enabled: bool=True):
+        self.output_dir = pathlib.Path(output_dir)
+        self.enabled = enabled
+        self.errors = {}
+        self.warnings = [] # 不影响处理但需要注意的问题，如账户信息关联键冲突
+        self.records = []
+        self._collect = None
+
+    def __enter__(self):
+        self.started = datetime.now()
+        self._t = time.perf_counter()
+        if self.enabled:
+            self._collect = collect()
+            self.records = self._collect.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds = round(time.perf_counter() - self._t, 3)
+        if self._collect is not None:
+            self._collect.__exit__(*args)
+            self._collect = None
+            print(f'运行报告：{self.save()}')
+
+    def summary(self) -> dict:
+        """按环节汇总：{环节: {'count': 次数, 'seconds': 总耗时, 'rows': 总行数}}"""
+        _summary = {}
+        for _r in self.records:
+            _s = _summary.setdefault(_r['stage'], {'count': 0, 'seconds': 0.0, 'rows': 0})
+            _s['count'] += 1
+            _s['seconds'] = round(_s['seconds'] + _r['seconds'], 6)
+            _s['rows'] += _r['rows'] or 0
+        return _summary
+
+    def check_summary(self) -> dict:
+        """按校验项汇总流水校验结果：{校验项: {'files': 未通过的文件数, 'rows': 未通过的行数}}，
+        未通过行的明细（每个文件前若干行）保存在同名的_check.csv中"""
+        _summary = {}
+        for _r in self.records:
+            for _k, _v in _r.get('checks', {}).items():
+                _s = _summary.setdefault(_k, {'files': 0, 'rows': 0})
+                _s['files'] += 1
+                _s['rows'] += _v
+        return _summary
+
+    def save(self) -> pathlib.Path:
+        """保存报告，返回json文件路径；未开启时不保存，返回None"""
+        if not self.enabled:
+            return None
+        _dir = self.output_dir.joinpath(REPORT_DIR)
+        _dir.mkdir(parents=True, exist_ok=True)
+        _path = _dir.joinpath(f'{self.started:%Y%m%d-%H%M%S}.json')
+        _peak = [x for x in [peak_rss()] + [_r['peak_rss'] for _r in self.records] if x is not None]
+        _data = {'started': self.started.isoformat(timespec='seconds'),
+                 'seconds': getattr(self, 'seconds', None),
+                 'files': len({_r['file'] for _r in self.records if _r['file']}),
+                 'peak_rss': max(_peak, default=None),
+                 'errors': {str(_f): _m for _f, _m in self.errors.items()},
+                 'warnings': self.warnings,
+                 'checks': self.check_summary(),
+                 'stages': self.summary()}
+        _path.write_text(json.dumps(_data, ensure_ascii=False, indent=2), encoding='utf-8')
+        with open(_path.with_suffix('.csv'), 'w', newline='', encoding='utf-8-sig') as f:
+            _writer = csv.DictWriter(f, _RECORD_FIELDS, extrasaction='ignore')
+            _writer.writeheader()
+            _writer.writerows(self.records)
+        if (_issues := [x for _r in self.records for x in _r.get('issues', ())]):
+            with open(_path.with_name(f'{_path.stem}_check.csv'), 'w', newline='', encoding='utf-8-sig') as f:
+                _writer = csv.DictWriter(f, list(_issues[0]), extrasaction='ignore')
+                _writer.writeheader()
+                _writer.writerows(_issues)
+        return _path
@@ -1,55 +1,513 @@
 import pathlib
+import json
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import nullcontext
+from hashlib import md5
+from typing import Callable, Iterator
+from datetime import date, time, datetime
 from corelibs.config import *
+from corelibs.dedup import key_hashes, drop_duplicate_rows, Hash_index
+from corelibs.report import REPORT_DIR, stage, collect, add_records
+from corelibs.store import STORE_FILE, Statement_store, open_store
+from corelibs.check import check_statements, summarize_issues, issue_records
 
 
 
-def save_general(df: pd.DataFrame, output_dir: pathlib.Path, bank_name: str, file_type: str) -> int:
-    """保存非流水数据：在对应目录中每个银行保存一个文件，返回写入的行数"""
+def save_general(df: pd.DataFrame, output_dir: pathlib.Path, bank_name: str, file_type: str, part_name: str=None,
+                 written: list=None, writer: 'Output_writer'=None) -> int:
+    """保存非流水数据：每个银行一个分区目录，每次只把尚未保存过的行（按去重键的行哈希判断）写入一个新的分区文件，
+    代价只与本次数据量有关，返回写入的行数。分区通过compact_general合并为每个银行一个文件。
+    传入written列表时将写入的分区文件路径追加到其中；传入写入器时由写入器异步写入"""
+    _cols = get_conf_obj(bank_name, file_type).dedup_cols
+    _parts_dir = _get_parts_dir(output_dir, bank_name, file_type, _cols, df)
+    _index = _get_keyed_index(_parts_dir, _cols, lambda: _part_files(_parts_dir), df)
+    with stage('dedup') as _rec: # 记录的行数为去除的重复行数
+        _hashes = key_hashes(df, _cols)
+        _new = ~(_index.contains(_hashes) | pd.Series(_hashes).duplicated().to_numpy()) # 去除已保存的行和本次重复的行
+        _rec['rows'] = int(len(_new) - _new.sum())
+    if not _new.any():
+        return 0
+    if part_name is None:
+        part_name = _next_part_name(_index)
+    _part_file = _parts_dir.joinpath(part_name).with_suffix(_get_suffix(get_output_format()))
+    _write_output(df[_new], _part_file, get_output_format(), writer)
+    _index.add(part_name, _hashes[_new])
+    if written is not None:
+        written.append(_part_file)
+    return int(_new.sum())
+
+def compact_general(output_dir: pathlib.Path, file_type: str, bank_name: str=None, output_format: str=None) -> int:
+    """将非流水数据的分区文件合并为每个银行一个文件（可指定其他输出格式，如导出为xlsx），返回合并的文件数"""
+    _output_format = get_output_format() if output_format is None else output_format
+    _account_dir = output_dir.joinpath(get_output_dirs(file_type))
+    _count = 0
+    for _parts_dir in _account_dir.glob(f'{"*" if bank_name is None else bank_name}{_PARTS_SUFFIX}'):
+        _files = sorted(_part_files(_parts_dir), key=_part_order) # 按分区编号（即保存次序）合并
+        _merged = _account_dir.joinpath(_parts_dir.name[:-len(_PARTS_SUFFIX)]).with_suffix(_get_suffix(_output_format))
+        if not _files: # 分区已全部删除（如重新处理变化的文件时），合并文件随之删除
+            _merged.unlink(missing_ok=True)
+            continue
+        _df = concat_frames([_read_as_format(x, _get_format(x)) for x in _files], ignore_index=True, copy=False)
+        _write_as_format(_df, _merged, _output_format)
+        _count += 1
+    return _count
+
+def remove_outputs(output_dir: pathlib.Path, files: list) -> int:
+    """删除之前保存的输出文件（相对输出目录的路径），分区文件和流水文件同时从行哈希索引中移除，
+    流水文件的行同时从流水库中删除，返回实际删除的文件数。用于重新处理内容或配置变化的输入文件前清除其原有输出"""
+    if files and (_store_file := output_dir.joinpath(STORE_FILE)).exists():
+        with Statement_store(_store_file) as _store:
+            _store.remove(files)
+    _count = 0
+    for _file in map(output_dir.joinpath, files):
+        if _file.parent.name.endswith(_PARTS_SUFFIX):
+            _get_hash_index(_file.parent).remove(_file.stem)
+        elif (_hash_dir := _file.parent.joinpath(_HASH_DIR)).is_dir():
+            for _index_dir in _hash_dir.iterdir():
+                _get_hash_index(_index_dir).remove(_file.stem)
+        if _file.exists():
+            _file.unlink()
+            _count += 1
+    return _count
+
+def concat_frames(dfs: list, **kwargs) -> pd.DataFrame:
+    """合并多个dataframe并保留分类列：pd.concat在各部分类别不同时会把分类列退化为object列，
+    因此先把同名列（包括从文本格式读回的字符串列）统一为全部类别的并集再合并。其他参数传给pd.concat"""
+    dfs = list(dfs)
+    _cats = {} # 列名 => 类别并集
+    for _df in dfs:
+        for _col, _dtype in _df.dtypes.items():
+            if isinstance(_dtype, pd.CategoricalDtype):
+                _cats[_col] = _cats[_col].union(_dtype.categories) if _col in _cats else _dtype.categories
+    if not _cats:
+        return pd.concat(dfs, **kwargs)
+    for _df in dfs:
+        for i, (_col, _dtype) in enumerate(_df.dtypes.items()):
+            if _col in _cats and not isinstance(_dtype, pd.CategoricalDtype):
+                _cats[_col] = _cats[_col].union(pd.Index(_df.iloc[:, i].dropna().unique()))
+    _result = []
+    for _df in dfs:
+        _df = _df.copy(deep=False)
+        for i, _col in enumerate(_df.columns):
+            if _col in _cats:
+                _df.isetitem(i, _df.iloc[:, i].astype(pd.CategoricalDtype(_cats[_col])))
+        _result.append(_df)
+    return pd.concat(_result, **kwargs)
+
+def _get_parts_dir(output_dir: pathlib.Path, bank_name: str, file_type: str, cols, 
+                   like: pd.DataFrame) -> pathlib.Path:
+    """返回银行的分区目录，首次使用时将旧版本生成的单一文件作为第一个分区导入，cols为去重键；
+    导入的行按like（本次解析结果）的列类型计算行哈希，以便与本次及此后保存的行去重"""
     _account_dir = output_dir.joinpath(get_output_dirs(file_type)) # 默认账户文件根目录
-    _account_dir.mkdir(parents=True, exist_ok=True) # 创建未创建的目录
-    return  _save_as_format(df, _account_dir.joinpath(bank_name), get_output_format(), True)
+    _parts_dir = _account_dir.joinpath(bank_name + _PARTS_SUFFIX)
+    if not _parts_dir.exists():
+        _parts_dir.mkdir(parents=True) # 创建未创建的目录
+        _old_file = _account_dir.joinpath(bank_name).with_suffix(_get_suffix(get_output_format()))
+        if _old_file.exists():
+            _index = _get_hash_index(_parts_dir)
+            _part_name = _next_part_name(_index)
+            _old_df = _read_as_format(_old_file, get_output_format())
+            _write_as_format(_old_df, _parts_dir.joinpath(_part_name).with_suffix(_old_file.suffix), get_output_format())
+            _index.add(_part_name, key_hashes(_saved_frame(_old_df, cols, like), cols))
+            _index.set_key(_key_sig(cols))
+    return _parts_dir
+
+def _part_files(parts_dir: pathlib.Path) -> list:
+    """返回分区目录中的分区文件（不含哈希索引文件）"""
+    return [x for x in parts_dir.iterdir() if not x.name.endswith(Hash_index.SUFFIX) and not x.name.startswith('.')]
+
+def _part_order(file: pathlib.Path) -> tuple:
+    """分区文件的合并次序：按编号排列，与写入进程完成写入的先后无关；非自动编号的分区排在最后"""
+    return (0, int(file.stem), '') if file.stem.isdigit() else (1, 0, file.stem)
+
+def _get_hash_index(parts_dir: pathlib.Path) -> Hash_index:
+    """返回分区目录的行哈希索引：在进程内缓存，目录被外部修改时重新读取"""
+    _key = str(parts_dir)
+    _index = _HASH_INDEX_CACHE.get(_key)
+    if _index is None:
+        _index = _HASH_INDEX_CACHE[_key] = Hash_index(parts_dir)
+    elif _index.is_stale():
+        _index.reload()
+    return _index
+
+def _get_keyed_index(index_dir: pathlib.Path, cols, files: Callable, like: pd.DataFrame) -> Hash_index:
+    """返回按去重键cols建立的行哈希索引。索引记录的去重键与当前配置不同时（如修改了dedup_cols、首次建立索引
+    或行哈希的计算方式有变化），读取files()返回的已保存文件重建索引。
+    读回的值先转换为like（本次解析结果）的列类型再计算行哈希，与解析结果直接计算的行哈希一致"""
+    _index = _get_hash_index(index_dir)
+    if (_sig := _key_sig(cols)) != _index.key:
+        _index.clear()
+        for _file in files():
+            _index.add(_file.stem, key_hashes(_saved_frame(_read_as_format(_file, _get_format(_file)), cols, like), cols))
+        _index.set_key(_sig)
+    return _index
+
+def _saved_frame(df: pd.DataFrame, cols, like: pd.DataFrame) -> pd.DataFrame:
+    """将读回的已保存数据转换为解析结果的列和列类型：文本格式（xlsx、csv）读回的值均为字符串，
+    列式格式的类型在写入前也统一过（见_coerce_dtypes），转换后同一行的行哈希与解析结果相同。
+    去重键为全部列时按like的列，列数相同时按位置对应（read_excel会把重复列名改为“列名.1”），否则按列名对应"""
+    _cols = list(dict.fromkeys(cols)) if cols else list(like.columns)
+    if not cols and len(df.columns) == len(_cols):
+        df = df.set_axis(_cols, axis=1)
+    else: # 旧文件可能缺少部分列，列式格式不保存重复列名
+        df = df.loc[:, ~df.columns.duplicated()].reindex(columns=_cols)
+    _like = like.loc[:, ~like.columns.duplicated()]
+    _result = {}
+    for i, _col in enumerate(_cols):
+        _s = df.iloc[:, i]
+        _dtype = _like[_col].dtype if _col in _like.columns else np.dtype(object)
+        if pd.api.types.is_datetime64_any_dtype(_dtype):
+            _s = pd.to_datetime(_s, errors='coerce', format='mixed').astype(_dtype)
+        elif pd.api.types.is_timedelta64_dtype(_dtype):
+            _s = pd.to_timedelta(_s.where(_s.isna(), _s.astype(str)), errors='coerce').astype(_dtype)
+        elif pd.api.types.is_numeric_dtype(_dtype) and not pd.api.types.is_bool_dtype(_dtype):
+            _s = pd.to_numeric(_s, errors='coerce')
+        else: # 字符串列（含分类列，二者的行哈希相同）
+            _s = _s.astype(object).where(_s.notna(), np.nan)
+        _result[i] = _s
+    return pd.DataFrame(_result, index=df.index).set_axis(df.columns, axis=1)
+
+def _key_sig(cols) -> str:
+    """去重键的文字表示（全部列为*），前缀为行哈希的计算版本，计算方式变化后已有的索引随之重建"""
+    return f'{_HASH_VERSION}:' + (json.dumps(list(cols), ensure_ascii=False) if cols else '*')
+
+def _next_part_name(index: Hash_index) -> str:
+    """返回下一个自动编号的分区名"""
+    _nums = [int(x) for x in index.sources() if x.isdigit()]
+    return f'{max(_nums, default=-1) + 1:05d}'
+
+def _get_format(file_name: pathlib.Path) -> str:
+    """根据文件后缀返回输出格式"""
+    return {v: k for k, v in _FORMAT_SUFFIX.items() if k}[file_name.suffix]
     
 def save_statements(df_list: list[pd.DataFrame], output_dir: pathlib.Path, bank_name: str,  
-                    file_type: str, doc_No: str=None) -> int:
-    """保存流水数据：每个人名设立一个目录，每个账户保存一个文件，文件名为银行+账户；可以传入文书号，这样将在单独的文书号文件中做记录，返回写入的流水条数"""
+                    file_type: str, doc_No: str=None, written: list=None, writer: 'Output_writer'=None) -> int:
+    """保存流水数据：每个人名设立一个目录，每个账户保存一个文件，文件名为银行+账户；可以传入文书号，这样将在单独的文书号文件中做记录，返回写入的流水条数。
+    df_list也可以是逐个产出账户流水的迭代器（如Statement_spool.accounts()），此时逐个读出、逐个保存。
+    每个账户按去重键的行哈希去除本身重复的行，以及同一人员目录中该银行配置已保存过的行（不必读回已保存的文件），
+    全部为重复行的账户不再保存。传入written列表时将写入的文件路径追加到其中。
+    传入写入器时各账户文件由写入器异步写入，文件名、行哈希索引和查询文书记录仍在调用方进程中依次确定和更新。
+    按配置项analysis_store将保存的流水同时加入输出目录中的流水库（见corelibs.store）。
+    该银行配置了checks时，按校验项检查排序后的各账户流水，未通过的行数和部分明细记入运行报告，不影响保存；
+    校验在去除已保存行之前进行，避免与已保存流水重叠的部分被去除后相邻两笔余额不连续"""
+    _conf_obj = get_conf_obj(bank_name, file_type)
+    _cols = _conf_obj.dedup_cols
     _lines = 0
     _acc_name_set = set() # 记录本次流水包含的姓名
-    for _df in df_list:
-        _acc_name = _df['姓名'].iat[0] # 按姓名分配目录
-        _bank_dir = _df['银行'].iat[0] # 按银行分配子目录
-        _acc_name_set.add(_acc_name)
-        _statement_dir = output_dir.joinpath(get_output_dirs(file_type), _acc_name, _bank_dir) # 每个人名建立一个目录
-        _statement_dir.mkdir(parents=True, exist_ok=True) # 创建未创建的目录
-        _acc = _df['卡号'].drop_duplicates().to_list()
-        _acc_str = f'尾号{",".join([x[-5:] for x in _acc])}'
-        _file_name = '_'.join([_make_df_brief(_df), bank_name, _acc_str])
-        _df.sort_values(['日期','时间'], inplace=True)
-        _lines += _save_as_format(_df, _statement_dir.joinpath(_file_name), get_output_format(), False)
+    with open_store(output_dir) if get_analysis_store() else nullcontext() as _store:
+        for _df in df_list:
+            _acc_name = _df['姓名'].iat[0] # 按姓名分配目录
+            _bank_dir = _df['银行'].iat[0] # 按银行分配子目录
+            _acc_name_set.add(_acc_name)
+            _statement_dir = output_dir.joinpath(get_output_dirs(file_type), _acc_name, _bank_dir) # 每个人名建立一个目录
+            _statement_dir.mkdir(parents=True, exist_ok=True) # 创建未创建的目录
+            _index = _get_keyed_index(_statement_dir.joinpath(_HASH_DIR, bank_name), _cols, 
+                                      lambda: _bank_statement_files(_statement_dir, bank_name), _df)
+            _df = _df.sort_values(['日期','时间']) # 先排序再去重，校验时使用含已保存行的完整流水
+            with stage('dedup') as _rec: # 记录的行数为去除的重复行数
+                _hashes = key_hashes(_df, _cols)
+                _dup = pd.Series(_hashes).duplicated().to_numpy()
+                _new = ~(_index.contains(_hashes) | _dup)
+                _rec['rows'] = int(len(_new) - _new.sum())
+            if not _new.any():
+                continue
+            _checked = _df[~_dup] if _dup.any() else _df
+            _df = _df[_new] if not _new.all() else _df
+            _acc = _df['卡号'].drop_duplicates().to_list()
+            _acc_str = f'尾号{",".join([x[-5:] for x in _acc])}'
+            _file_name = '_'.join([_make_df_brief(_df), bank_name, _acc_str])
+            _files = []
+            _lines += _save_as_format(_df, _statement_dir.joinpath(_file_name), get_output_format(), False, _files, writer)
+            _index.add(_files[0].stem, _hashes[_new])
+            if _conf_obj.checks:
+                _check_statements(_checked, _conf_obj.checks, str(_files[0].relative_to(output_dir)))
+            if written is not None:
+                written.extend(_files)
+            if _store is not None:
+                _store.add(_df, str(_files[0].relative_to(output_dir)))
     if doc_No is not None: # 保存查询文书记录
         _text = ','.join([doc_No, bank_name, str(_acc_name_set).replace(',', '')])  + "\n"
-        with open(output_dir.joinpath('0查询文号.csv'), 'a') as f:
+        with open(output_dir.joinpath(_DOC_NO_FILE), 'a') as f:
             f.write(_text)
     return _lines
 
-def _save_as_format(df: pd.DataFrame, file_name:  pathlib.Path, output_format: str='', append=True) -> int:
-    """根据保存dataframe：excel文件和csv文件各一套，返回写入的行数"""
-# todo：在单独的目录中保存一套csv文件
-#         if append:
-#             df.to_csv(file_name.with_suffix('.csv'), mode='a', index=False)
-#         else:
-#             df.to_csv(file_name.with_suffix('.csv'), mode='w', index=False)
-    _name = file_name.with_suffix('.xlsx')
+def _check_statements(df: pd.DataFrame, checks: tuple, source: str) -> None:
+    """校验一个账户的流水，记录的行数为未通过的行数，各校验项的行数和前若干行明细随记录写入运行报告"""
+    with stage('check', source) as _rec:
+        _issues = check_statements(df, checks, *get_check_date_range())
+        _rec['rows'] = len(_issues)
+        if len(_issues):
+            _rec['checks'] = summarize_issues(_issues)
+            _rec['issues'] = issue_records(df, _issues, source)
+
+def _bank_statement_files(statement_dir: pathlib.Path, bank_name: str) -> list:
+    """返回流水目录中该银行配置保存的流水文件（文件名第二段为银行配置名）"""
+    return [x for x in statement_dir.glob(f'*{_get_suffix(get_output_format())}') if x.stem.split('_')[1:2] == [bank_name]]
+
+def rebuild_store(output_dir: pathlib.Path) -> int:
+    """根据输出目录中已保存的流水文件重建流水库（如开启analysis_store之前已处理的输出），返回加入的行数"""
+    output_dir = pathlib.Path(output_dir)
+    _stat_dir = output_dir.joinpath(get_output_dirs('流水'))
+    _rows = 0
+    with open_store(output_dir) as _store:
+        _store.clear()
+        for _file in sorted(_stat_dir.rglob(f'*{_get_suffix(get_output_format())}')):
+            if any(x.startswith('.') for x in _file.relative_to(_stat_dir).parts):
+                continue
+            _rows += _store.add(_read_as_format(_file, get_output_format()), str(_file.relative_to(output_dir)))
+    return _rows
+
+class Statement_spool:
+    """流水分账户暂存：分块处理大文件时把每块中各账号的行追加到该账号自己的暂存文件，
+    全部分块处理完后再逐个账户读出（跨块的重复行在save_statements中按行哈希去除），内存中同时只有一块数据或一个账户的数据。
+    暂存只依赖目录结构，可以在工作进程中写入、在主进程中读出"""
+
+    SPOOL_DIR = '.spool'
+
+    def __init__(self, output_dir: pathlib.Path):
+        _root = output_dir.joinpath(self.SPOOL_DIR)
+        _root.mkdir(parents=True, exist_ok=True)
+        self.path = pathlib.Path(tempfile.mkdtemp(dir=_root))
+        self._accs = {} # 账号与其暂存目录名的对应关系
+        self._chunks = 0
+
+    def add(self, df: pd.DataFrame) -> None:
+        """按账号拆分一块流水并追加到各账号的暂存文件"""
+        for _acc, _df in df.groupby('账号'):
+            _acc_dir = self.path.joinpath(self._accs.setdefault(_acc, md5(str(_acc).encode()).hexdigest()))
+            _acc_dir.mkdir(exist_ok=True)
+            _df.to_pickle(_acc_dir.joinpath(f'{self._chunks:06d}.pkl'))
+        self._chunks += 1
+
+    def accounts(self) -> Iterator[pd.DataFrame]:
+        """按账号顺序逐个产出账户的全部流水，顺序与split_statements一致"""
+        for _acc in sorted(self._accs):
+            _acc_dir = self.path.joinpath(self._accs[_acc])
+            _df = concat_frames([pd.read_pickle(x) for x in sorted(_acc_dir.iterdir())], copy=False)
+            yield _df.reset_index(drop=True)
+
+    def cleanup(self) -> None:
+        """删除暂存文件，暂存根目录已空时一并删除"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        try:
+            self.path.parent.rmdir()
+        except OSError: # 其他文件的暂存尚未保存
+            pass
+
+def _save_as_format(df: pd.DataFrame, file_name:  pathlib.Path, output_format: str='', append=True, 
+                    written: list=None, writer: 'Output_writer'=None) -> int:
+    """根据配置的输出格式保存dataframe，返回写入的行数；append为真时与已有文件合并去重，否则文件重名时在文件名后加'_'。
+    传入written列表时将实际写入的文件路径追加到其中。传入写入器时异步写入：合并前先等待同一文件尚未完成的写入，
+    判断重名时已分配给尚未写完的文件的名称也视为已存在"""
+    _suffix = _get_suffix(output_format)
+    _name = file_name.with_suffix(_suffix)
     if append:
+        if writer is not None:
+            writer.wait(_name)
         if _name.exists():
-            _old_df = pd.read_excel(_name, dtype=str)
-            df = pd.concat([_old_df, df], copy=False)
-            df.drop_duplicates(inplace=True)
+            _old_df = _read_as_format(_name, output_format)
+            df = drop_duplicate_rows(concat_frames([_old_df, df], copy=False))[0]
     else:
-        while _name.exists():
-                _name = _name.with_name(_name.stem + '_').with_suffix('.xlsx')
-    df.to_excel(_name, index=False)
+        while _name.exists() or (writer is not None and writer.reserved(_name)):
+                _name = _name.with_name(_name.stem + '_').with_suffix(_suffix)
+    _write_output(df, _name, output_format, writer)
+    if written is not None:
+        written.append(_name)
     return len(df)
+
+class Output_writer:
+    """输出写入器：在写入进程池中把dataframe序列化并写入输出文件，主进程同时继续解析和保存下一个文件。
+    文件名、行哈希索引、处理清单和查询文书记录都在主进程中确定和更新，写入进程只负责序列化和写盘，
+    因此多个写入进程并发时文件不会重名或互相覆盖。等待写入的文件超过max_pending个时write等待最早的写入完成，
+    限制排队数据占用的内存。workers为0时在调用处同步写入。
+    openpyxl的序列化为纯Python代码，受GIL限制，因此使用进程而非线程写入"""
+
+    def __init__(self, workers: int=0, max_pending: int=0):
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self._executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        self._futures = {} # 尚未确认完成的写入：文件路径 => future，按提交次序排列
+        self._errors = {} # 写入出错且尚未交给回调的文件：文件路径 => 异常
+        self._callbacks = deque() # 等待文件写入完成的回调：(文件路径列表, 回调)
+        self._reserved = set() # 已分配给异步写入的文件路径
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close(exc_type is None)
+
+    def write(self, df: pd.DataFrame, file_name: pathlib.Path, output_format: str) -> None:
+        """写入一个文件：同步模式直接写入，否则提交到写入进程池；同一文件的上一次写入完成后才提交"""
+        if self._executor is None:
+            _write_as_format(df, file_name, output_format)
+            return
+        self.wait(file_name)
+        while len(self._futures) >= self.max_pending:
+            wait([next(iter(self._futures.values()))])
+            self._collect()
+        self._reserved.add(file_name)
+        self._futures[file_name] = self._executor.submit(_write_job, (df, file_name, output_format))
+
+    def reserved(self, file_name: pathlib.Path) -> bool:
+        """文件路径已分配给本写入器的写入时返回真（文件可能尚未出现在磁盘上）"""
+        return file_name in self._reserved
+
+    def then(self, file_names: list, callback: Callable) -> None:
+        """file_names全部写入完成后，在主进程中以callback(首个写入异常或None)调用回调；
+        回调按登记次序执行，同步模式或文件均已写入时立即执行"""
+        self._callbacks.append((list(file_names), callback))
+        self._collect()
+
+    def wait(self, file_name: pathlib.Path=None) -> None:
+        """等待某个文件（不指定时为全部文件）写入完成，并执行已满足条件的回调"""
+        if file_name is None:
+            wait(list(self._futures.values()))
+        elif (_future := self._futures.get(file_name)) is not None:
+            wait([_future])
+        self._collect()
+
+    def close(self, check: bool=True) -> None:
+        """等待全部写入完成后关闭写入进程池；check为真时，有未交给回调的写入错误则抛出"""
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+        if check and self._errors:
+            raise Exception(f"{len(self._errors)}个文件写入失败：" + 
+                            '；'.join(f'{x.name} => {e}' for x, e in self._errors.items()))
+
+    def _collect(self) -> None:
+        """收集已完成的写入并汇总写入进程中的耗时记录，然后按登记次序执行文件都已写入的回调"""
+        for _name, _future in list(self._futures.items()):
+            if not _future.done():
+                continue
+            del self._futures[_name]
+            if (_exc := _future.exception()) is not None:
+                self._errors[_name] = _exc
+            else:
+                add_records(_future.result())
+        while self._callbacks and not any(x in self._futures for x in self._callbacks[0][0]):
+            _names, _callback = self._callbacks.popleft()
+            _excs = [self._errors.pop(x) for x in _names if x in self._errors]
+            _callback(_excs[0] if _excs else None)
+
+def _write_job(item: tuple) -> list:
+    """写入进程任务：按格式写入一个文件，返回写入环节的耗时记录"""
+    _df, _file_name, _output_format = item
+    with collect() as _records:
+        with stage('write', _file_name) as _rec:
+            _write_as_format(_df, _file_name, _output_format)
+            _rec['rows'] = len(_df)
+    return _records
+
+def _write_output(df: pd.DataFrame, file_name: pathlib.Path, output_format: str, writer: Output_writer=None) -> None:
+    """传入写入器时交给写入器写入，否则直接写入"""
+    if writer is None:
+        _write_as_format(df, file_name, output_format)
+    else:
+        writer.write(df, file_name, output_format)
+
+# 非流水数据分区目录的后缀
+_PARTS_SUFFIX = '.parts'
+# 行哈希的计算版本，记录在索引的去重键中（见_key_sig）
+_HASH_VERSION = 2
+# 流水目录中行哈希索引的子目录名，其下每个银行配置一个索引
+_HASH_DIR = '.hash'
+# 分区目录的行哈希索引缓存
+_HASH_INDEX_CACHE: dict = {}
+# 查询文书记录文件名
+_DOC_NO_FILE = '0查询文号.csv'
+# 输出格式与文件后缀的对应关系，空字符串为默认格式xlsx
+_FORMAT_SUFFIX = {'': '.xlsx', 'xlsx': '.xlsx', 'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+# 需要保持数值类型的金额列
+_AMOUNT_COLS = ['出账金额', '入账金额', '余额']
+
+def _get_suffix(output_format: str) -> str:
+    """返回输出格式对应的文件后缀"""
+    if (_suffix := _FORMAT_SUFFIX.get(output_format)) is None:
+        raise Exception(f"不支持的输出格式：{output_format}，可选格式为{list(_FORMAT_SUFFIX)}")
+    return _suffix
+
+def _read_as_format(file_name: pathlib.Path, output_format: str) -> pd.DataFrame:
+    """按输出格式读取已保存的文件：文本格式按字符串读取，列式格式保留原有类型"""
+    match _get_suffix(output_format):
+        case '.xlsx':
+            return pd.read_excel(file_name, dtype=str)
+        case '.csv':
+            return pd.read_csv(file_name, dtype=str, encoding='utf-8-sig')
+        case '.parquet':
+            return pd.read_parquet(file_name)
+        case '.feather':
+            return pd.read_feather(file_name)
+
+def _write_as_format(df: pd.DataFrame, file_name: pathlib.Path, output_format: str) -> None:
+    """按输出格式写入文件：csv使用带BOM的utf-8以便excel直接打开，列式格式写入前统一列类型"""
+    match _get_suffix(output_format):
+        case '.xlsx':
+            _to_text_types(df).to_excel(file_name, index=False)
+        case '.csv':
+            _to_text_types(df).to_csv(file_name, index=False, encoding='utf-8-sig')
+        case '.parquet':
+            _coerce_dtypes(df).to_parquet(file_name, index=False)
+        case '.feather':
+            _coerce_dtypes(df).reset_index(drop=True).to_feather(file_name)
+
+def _to_text_types(df: pd.DataFrame) -> pd.DataFrame:
+    """文本格式保持原有的显示方式：不含时间的datetime64列转为日期，timedelta64列转为时间"""
+    _cols = {}
+    for _col in df.select_dtypes(include=['datetime', 'timedelta']).columns.unique():
+        if isinstance(_s := df[_col], pd.DataFrame): # 跳过重复列名
+            continue
+        if pd.api.types.is_timedelta64_dtype(_s.dtype):
+            _cols[_col] = (pd.Timestamp(0) + _s).dt.time
+        elif (_s.dropna().dt.normalize() == _s.dropna()).all():
+            _cols[_col] = _s.dt.date
+    return df.assign(**_cols) if _cols else df
+
+def _coerce_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """统一列类型以便列式存储：日期列转为datetime64，可完整转换的金额列转为数值，其余object列统一为字符串。
+    列式格式要求列名唯一，重复列名（配置中新列与other_cols同名时产生）内容相同，只保留第一列"""
+    df = df.loc[:, ~df.columns.duplicated()].copy(deep=False)
+    for _col in df.columns:
+        _s = df[_col]
+        if _s.dtype != object:
+            continue
+        _first = _s.dropna()
+        _first = _first.iat[0] if len(_first) else None
+        if type(_first) == date:
+            df[_col] = pd.to_datetime(_s)
+        elif type(_first) in (time, datetime):
+            continue # pyarrow可直接保存时间和日期时间对象
+        elif _col in _AMOUNT_COLS and (_num := pd.to_numeric(_s, errors='coerce')).notna().sum() == _s.notna().sum():
+            df[_col] = _num
+        else:
+            df[_col] = _s.where(_s.isna(), _s.astype(str))
+    return df
+
+def export_output(output_dir: pathlib.Path, from_format: str=None, to_format: str='xlsx') -> int:
+    """将输出目录中某种格式的结果文件全部另存为其他格式（默认导出为xlsx），返回导出的文件数。
+    非流水数据的分区文件不在此导出，需要时使用compact_general合并导出"""
+    _from_format = get_output_format() if from_format is None else from_format
+    _from_suffix, _to_suffix = _get_suffix(_from_format), _get_suffix(to_format)
+    if _from_suffix == _to_suffix:
+        return 0
+    _count = 0
+    for _file in pathlib.Path(output_dir).rglob(f'*{_from_suffix}'):
+        if _file.name == _DOC_NO_FILE or _file.parent.name.endswith(_PARTS_SUFFIX): # 分区文件由compact_general导出
+            continue
+        if _file.parent.name == REPORT_DIR:
+            continue
+        _write_as_format(_read_as_format(_file, _from_format), _file.with_suffix(_to_suffix), to_format)
+        _count += 1
+    return _count
         
 def _make_df_brief(df: pd.DataFrame) -> str:
     """生成流水简介：内容包括流水条数和最大数额（约到整万）"""
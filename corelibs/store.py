@@ -0,0 +1,144 @@
+import pathlib
+import sqlite3
+import pandas as pd
+
+
+
+# 流水库文件名，保存在输出目录中
+STORE_FILE = '0人员流水.sqlite'
+# 流水库保存的标准流水列，各银行配置中的其他原始列只保存在流水文件中
+STORE_COLS = ['银行', '日期', '时间', '姓名', '账号', '卡号', '备注', '摘要', '币种', '出账金额', '入账金额', '余额',
+              '交易机构', '对方户名', '对方账号', '对方开户行', '对方证件号', 'IP/MAC地址']
+_AMOUNT_COLS = ['出账金额', '入账金额', '余额']
+_TABLE = '流水'
+# 来源为生成该行的流水文件（相对输出目录的路径），删除或重新生成流水文件时据此删除对应的行
+_SOURCE_COL = '来源'
+# 按人员和银行分区查询，并为常用的查询条件建立索引
+_INDEXES = {'idx_person': ['姓名', '银行'], 'idx_acc': ['账号'], 'idx_counter_acc': ['对方账号'], 'idx_date': ['日期']}
+
+class Statement_store:
+    """人员流水库：把各人员各银行的流水汇总保存在输出目录中的一个SQLite文件里，跨银行、跨人员的查询
+    （如某人全部50万以上的交易、两个人共同的交易对手）无需重新读取大量流水文件。
+    日期保存为YYYY-MM-DD、时间保存为HH:MM:SS格式的文本，可直接按字符串比较范围"""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(self.path)
+        _cols = ', '.join([f'"{x}" {"REAL" if x in _AMOUNT_COLS else "TEXT"}' for x in STORE_COLS] +
+                          [f'"{_SOURCE_COL}" TEXT'])
+        with self._con:
+            self._con.execute(f'CREATE TABLE IF NOT EXISTS "{_TABLE}" ({_cols})')
+            for _name, _idx_cols in {**_INDEXES, 'idx_source': [_SOURCE_COL]}.items():
+                self._con.execute(f'CREATE INDEX IF NOT EXISTS {_name} ON "{_TABLE}" ({_quote(_idx_cols)})')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self._con.close()
+
+    def add(self, df: pd.DataFrame, source: str) -> int:
+        """加入一个流水文件的行，source为该文件相对输出目录的路径；同一来源已有的行先删除，返回加入的行数"""
+        _df = to_store_frame(df)
+        _df[_SOURCE_COL] = source
+        with self._con:
+            self._con.execute(f'DELETE FROM "{_TABLE}" WHERE "{_SOURCE_COL}" = ?', (source,))
+            _df.to_sql(_TABLE, self._con, if_exists='append', index=False, chunksize=50000)
+        return len(_df)
+
+    def remove(self, sources: list) -> int:
+        """删除这些来源的行，返回删除的行数"""
+        with self._con:
+            return sum(self._con.execute(f'DELETE FROM "{_TABLE}" WHERE "{_SOURCE_COL}" = ?', (str(x),)).rowcount
+                       for x in sources)
+
+    def clear(self) -> None:
+        """删除全部行"""
+        with self._con:
+            self._con.execute(f'DELETE FROM "{_TABLE}"')
+
+    def query(self, name=None, bank=None, account=None, counter_account=None, start=None, end=None,
+              min_amount: float=None, max_amount: float=None, columns: list=None) -> pd.DataFrame:
+        """按条件查询流水，各条件同时满足，返回按姓名、日期、时间排序的dataframe（日期列为datetime64）。
+        name、bank、account（账号或卡号）、counter_account（对方账号）可以是单个值或值的列表；
+        start、end为日期范围（含两端），可以是字符串或日期；min_amount、max_amount按出账、入账金额中较大的一个判断；
+        columns为返回的列，默认为全部标准流水列"""
+        _where, _params = [], []
+        for _cols, _val in ((['姓名'], name), (['银行'], bank), (['账号', '卡号'], account), (['对方账号'], counter_account)):
+            if _val is None:
+                continue
+            _vals = [_val] if isinstance(_val, str) or not hasattr(_val, '__iter__') else list(_val)
+            _marks = ', '.join(['?'] * len(_vals))
+            _where.append('(' + ' OR '.join(f'"{x}" IN ({_marks})' for x in _cols) + ')')
+            _params.extend(_vals * len(_cols))
+        if start is not None:
+            _where.append('"日期" >= ?')
+            _params.append(_date_str(start))
+        if end is not None:
+            _where.append('"日期" <= ?')
+            _params.append(_date_str(end))
+        _amount = 'MAX(IFNULL("出账金额", 0), IFNULL("入账金额", 0))'
+        if min_amount is not None:
+            _where.append(f'{_amount} >= ?')
+            _params.append(min_amount)
+        if max_amount is not None:
+            _where.append(f'{_amount} <= ?')
+            _params.append(max_amount)
+        _sql = f'SELECT {_quote(columns or STORE_COLS)} FROM "{_TABLE}"'
+        if _where:
+            _sql += ' WHERE ' + ' AND '.join(_where)
+        _sql += ' ORDER BY "姓名", "日期", "时间"'
+        return _from_store_frame(pd.read_sql_query(_sql, self._con, params=_params))
+
+    def shared_counterparties(self, names: list, min_persons: int=None) -> pd.DataFrame:
+        """返回names中至少min_persons个人员（默认为全部）都有交易的对方账号，
+        每个对方账号一行，列为对方账号、对方户名（之一）、人数、交易笔数、出账合计、入账合计，按人数和笔数降序排列"""
+        names = list(names)
+        _marks = ', '.join(['?'] * len(names))
+        _sql = (f'SELECT "对方账号", MAX("对方户名") AS "对方户名", COUNT(DISTINCT "姓名") AS "人数", '
+                f'COUNT(*) AS "交易笔数", SUM("出账金额") AS "出账合计", SUM("入账金额") AS "入账合计" '
+                f'FROM "{_TABLE}" WHERE "姓名" IN ({_marks}) AND "对方账号" IS NOT NULL AND "对方账号" != \'\' '
+                f'GROUP BY "对方账号" HAVING COUNT(DISTINCT "姓名") >= ? ORDER BY "人数" DESC, "交易笔数" DESC')
+        return pd.read_sql_query(_sql, self._con, params=[*names, min_persons or len(names)])
+
+    def persons(self) -> pd.DataFrame:
+        """返回库中各人员各银行的流水条数和日期范围"""
+        _sql = (f'SELECT "姓名", "银行", COUNT(*) AS "条数", MIN("日期") AS "起始日期", MAX("日期") AS "截止日期" '
+                f'FROM "{_TABLE}" GROUP BY "姓名", "银行" ORDER BY "姓名", "银行"')
+        return pd.read_sql_query(_sql, self._con)
+
+def open_store(output_dir: pathlib.Path) -> Statement_store:
+    """打开输出目录中的流水库"""
+    return Statement_store(pathlib.Path(output_dir).joinpath(STORE_FILE))
+
+def to_store_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """转换为流水库的列和类型：只保留标准流水列（缺少的列为空，重复列名只取第一列），
+    金额列为数值，日期、时间列为文本，其他列为字符串；解析结果和从文本格式读回的流水文件都可转换"""
+    _df = df.loc[:, ~df.columns.duplicated()].reindex(columns=STORE_COLS)
+    _cols = {}
+    for _col in STORE_COLS:
+        _s = _df[_col]
+        if _col in _AMOUNT_COLS:
+            _cols[_col] = pd.to_numeric(_s, errors='coerce')
+        elif _col == '日期':
+            _cols[_col] = pd.to_datetime(_s, errors='coerce').dt.strftime('%Y-%m-%d')
+        elif _col == '时间' and pd.api.types.is_timedelta64_dtype(_s.dtype):
+            _cols[_col] = (pd.Timestamp(0) + _s).dt.strftime('%H:%M:%S')
+        else:
+            _cols[_col] = _s.astype(object).where(_s.notna(), None).map(lambda x: x if x is None else str(x))
+    return pd.DataFrame(_cols, index=_df.index)
+
+def _from_store_frame(df: pd.DataFrame) -> pd.DataFrame:
+    if '日期' in df.columns:
+        df['日期'] = pd.to_datetime(df['日期'])
+    return df
+
+def _date_str(value) -> str:
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+def _quote(cols: list) -> str:
+    return ', '.join(f'"{x}"' for x in cols)
@@ -0,0 +1,273 @@
+import math
+import pathlib
+import pandas as pd
+import numpy as np
+import openpyxl as op, xlrd as xl
+from datetime import time
+from hashlib import md5
+from itertools import chain
+from typing import Iterator
+from pandas.io.parsers import TextParser
+
+
+
+class Workbook_handle:
+    """工作簿句柄：表头识别与数据读取共用一次打开和解析，每个文件只解压、解析一遍。
+    表头之前已读取的行会被缓存，读取数据时从同一个行迭代器继续向后读取。
+    同一工作簿的多个工作表通过select切换，工作簿保持打开，不必重新解压和解析。"""
+
+    def __init__(self, file_path: pathlib.Path, sheet=None):
+        self.file_path = file_path
+        self.sheet = sheet
+        self._work_book = None # 打开的工作簿对象
+        self._rows = None # 工作表行迭代器（原始值）
+        self._head_rows = [] # 已从迭代器中读出的行
+        self._df_cache = {} # 已解析的dataframe缓存，键为表头行号，值为(读取的列集合, dataframe)
+        self._consumed = False # 行迭代器是否已读完
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        """关闭工作簿并释放缓存"""
+        if self._work_book is not None:
+            if self.file_path.suffix == '.xlsx':
+                self._work_book.close()
+            else:
+                self._work_book.release_resources()
+        self._work_book = None
+        self._rows = None
+        self._head_rows = []
+        self._df_cache = {}
+        self._consumed = False
+
+    def sheet_names(self) -> list[str]:
+        """返回全部工作表名称（按工作簿中的次序），不改变当前选定的工作表"""
+        _book = self._load_book()
+        return list(_book.sheetnames) if self.file_path.suffix == '.xlsx' else _book.sheet_names()
+
+    def select(self, sheet) -> 'Workbook_handle':
+        """选定另一个工作表（None为默认表，int为序号，str为表名）并返回句柄本身：
+        只重置行迭代器和缓存，工作簿不关闭；选定的就是当前工作表时保留已读取的内容"""
+        if sheet != self.sheet:
+            self.sheet = sheet
+            self._rows = None
+            self._head_rows = []
+            self._df_cache = {}
+            self._consumed = False
+        return self
+
+    def sheets_head_rows(self, nrows: int=1) -> list[tuple[str, list]]:
+        """依次返回每个工作表的(表名, 前nrows行原始值)，用于一次打开识别全部工作表；
+        结束时选定最后一个工作表，之后按需用select切换"""
+        _result = []
+        for i, _name in enumerate(self.sheet_names()):
+            _result.append((_name, self.select(i).head_rows(nrows)))
+        return _result
+
+    def header(self, header: int=0) -> str:
+        """返回表头字符串，格式与原read_header一致（xlsx为tuple，xls为list），不支持的文件返回空字符串"""
+        if self.file_path.suffix not in ('.xlsx', '.xls'):
+            return ''
+        _row = self._get_head_row(header)
+        if _row is None:
+            raise Exception(f"表头行{header}超出工作表范围")
+        return str(_row) if self.file_path.suffix == '.xlsx' else str([x for x, _ in _row])
+
+    def header_md5(self, header: int=0) -> str:
+        """返回表头字符串的md5值，用于在header_hash中查找配置"""
+        return md5(self.header(header).encode()).hexdigest()
+
+    def head_rows(self, nrows: int=1) -> list:
+        """返回前nrows行的原始值（xls只取值），不足nrows行时返回全部行；读出的行留在句柄中供之后读取数据时使用"""
+        _rows = []
+        for i in range(nrows):
+            if (_row := self._get_head_row(i)) is None:
+                break
+            _rows.append(list(_row) if self.file_path.suffix == '.xlsx' else [x for x, _ in _row])
+        return _rows
+
+    def read_df(self, header: int=0, usecols: frozenset=None) -> pd.DataFrame:
+        """读取表头之后的全部行，返回dataframe，内容与pd.read_excel(dtype=str)一致（列名去除首尾空白）。
+        usecols为需要的列名集合，其他列在转换单元格之前即被丢弃以节约内存；
+        同一文件按多种类型解析时，先用各类型所需列的并集读取一次，之后的读取直接从缓存中取子集"""
+        _cached_cols, _df = self._df_cache.get(header, (None, None))
+        if _df is not None and (_cached_cols is None or (usecols is not None and usecols <= _cached_cols)):
+            if usecols is not None and _cached_cols != usecols:
+                _df = _df[[x for x in _df.columns if x in usecols]]
+            return _df.copy() # 同一文件可能按多种类型解析，返回副本避免互相影响
+        if self._consumed: # 行迭代器已读完，重新打开文件
+            self.close()
+        if usecols is not None:
+            _header_row = self._get_head_row(header)
+            _rows = self._select_cols(chain(self._head_rows, self._open_rows()), _header_row, usecols)
+        else:
+            _rows = chain(self._head_rows, self._open_rows())
+        _data = _trim_data([self._convert_row(x) for x in _rows])
+        if len(_data) > header:
+            _data[header] = _strip_names(_data[header])
+        self._head_rows = []
+        self._consumed = True
+        _parser = TextParser(_data, header=header, dtype=str, skip_blank_lines=False)
+        _df = _parser.read()
+        self._df_cache[header] = (usecols, _df)
+        return _df.copy()
+
+    def iter_dfs(self, header: int=0, usecols: frozenset=None, chunksize: int=100000) -> Iterator[pd.DataFrame]:
+        """分块读取表头之后的行，每次产出不超过chunksize行的dataframe，列名和内容与read_df一致
+        （表头之外多出的无名列除外）；行迭代器只遍历一遍，内存占用只与chunksize有关"""
+        if self._consumed:
+            self.close()
+        if (_header_row := self._get_head_row(header)) is None:
+            raise Exception(f"表头行{header}超出工作表范围")
+        _rows = chain(self._head_rows[header + 1:], self._open_rows())
+        self._head_rows = []
+        self._consumed = True
+        if usecols is not None:
+            _rows = self._select_cols(_rows, _header_row, usecols)
+            _header_row = next(self._select_cols([_header_row], _header_row, usecols))
+        _names = _strip_names(self._convert_row(_header_row))
+        _chunk = []
+        _empty = 0 # 连续空行数：空行之后还有数据时才保留，文件末尾的空行丢弃
+        for _row in _rows:
+            if not (_row := self._convert_row(_row)):
+                _empty += 1
+                continue
+            _chunk.extend([[]] * _empty)
+            _empty = 0
+            _chunk.append(_row)
+            if len(_chunk) >= chunksize:
+                yield _chunk_df(_names, _chunk)
+                _chunk = []
+        if _chunk:
+            yield _chunk_df(_names, _chunk)
+
+    def _select_cols(self, rows, header_row: tuple, usecols: frozenset):
+        """只保留表头在usecols中的列"""
+        if header_row is None:
+            raise Exception(f"表头行超出工作表范围")
+        _names = _strip_names(header_row if self.file_path.suffix == '.xlsx' else [x for x, _ in header_row])
+        _idx = [i for i, x in enumerate(_names) if x in usecols]
+        _empty = None if self.file_path.suffix == '.xlsx' else ('', xl.XL_CELL_EMPTY)
+        for _row in rows:
+            _len = len(_row)
+            yield tuple(_row[i] if i < _len else _empty for i in _idx)
+
+    def _get_head_row(self, index: int) -> tuple:
+        """从行迭代器中读取到第index行为止，并缓存已读取的行"""
+        _rows = self._open_rows()
+        while len(self._head_rows) <= index:
+            if (_row := next(_rows, None)) is None:
+                return None
+            self._head_rows.append(_row)
+        return self._head_rows[index]
+
+    def _open_rows(self):
+        """打开工作簿并返回行迭代器，重复调用返回同一个迭代器"""
+        if self._rows is None:
+            if self.file_path.suffix == '.xlsx':
+                self._rows = self._open_rows_xlsx()
+            elif self.file_path.suffix == '.xls':
+                self._rows = self._open_rows_xls()
+            else:
+                raise Exception(f"不支持的文件类型：{self.file_path.suffix}")
+        return self._rows
+
+    def _load_book(self):
+        """打开工作簿，已打开时直接返回"""
+        if self._work_book is None:
+            if self.file_path.suffix == '.xlsx':
+                # 与pandas一致：公式单元格取缓存的计算结果，不载入外部链接
+                self._work_book = op.load_workbook(self.file_path, read_only=True, data_only=True, keep_links=False)
+            elif self.file_path.suffix == '.xls':
+                self._work_book = xl.open_workbook(self.file_path, on_demand=True)
+                self._datemode = self._work_book.datemode
+            else:
+                raise Exception(f"不支持的文件类型：{self.file_path.suffix}")
+        return self._work_book
+
+    def _open_rows_xlsx(self):
+        _book = self._load_book()
+        _sheet = _select_sheet(self.sheet, lambda: _book.active, lambda i: _book[_book.sheetnames[i]],
+                               lambda s: _book[s])
+        if not hasattr(_sheet, 'reset_dimensions'): # 图表工作表没有单元格
+            return iter(())
+        _sheet.reset_dimensions() # 部分银行导出文件的尺寸信息有误，按实际内容读取
+        return _sheet.values
+
+    def _open_rows_xls(self):
+        _book = self._load_book()
+        _sheet = _select_sheet(self.sheet, lambda: _book.sheet_by_index(0), _book.sheet_by_index, _book.sheet_by_name)
+        return (tuple(zip(_sheet.row_values(i), _sheet.row_types(i))) for i in range(_sheet.nrows))
+
+    def _convert_row(self, row: tuple) -> list:
+        """按pandas读取excel的规则转换单元格的值"""
+        if self.file_path.suffix == '.xlsx':
+            _row = [_convert_cell_xlsx(x) for x in row]
+        else:
+            _row = [_convert_cell_xls(x, t, self._datemode) for x, t in row]
+        while _row and _row[-1] == '': # 去除行尾空单元格
+            _row.pop()
+        return _row
+
+
+def _select_sheet(sheet, default, by_index, by_name):
+    """根据sheet参数选择工作表：None为默认表，int为序号，str为表名"""
+    if sheet is None:
+        return default()
+    elif type(sheet) == int:
+        return by_index(sheet)
+    elif type(sheet) == str:
+        return by_name(sheet)
+    else:
+        raise Exception(f"sheet参数只能为int或str")
+
+def _strip_names(row: list) -> list:
+    """去除列名首尾的空白：识别表头时按去除空白后的表头匹配（见header.header_md5s），读取数据时列名与配置一致"""
+    return [x.strip() if isinstance(x, str) else x for x in row]
+
+def _convert_cell_xlsx(value):
+    if value is None:
+        return ''
+    elif type(value) == float:
+        _val = int(value) if math.isfinite(value) else None
+        return _val if _val == value else value
+    return value
+
+def _convert_cell_xls(value, cell_type: int, datemode: int):
+    if cell_type == xl.XL_CELL_DATE:
+        try:
+            value = xl.xldate.xldate_as_datetime(value, datemode)
+        except OverflowError:
+            return value
+        if (not datemode and value.timetuple()[0:3] == (1899, 12, 31)) or (
+            datemode and value.timetuple()[0:3] == (1904, 1, 1)): # 日期为纪元日的视为时间
+            value = time(value.hour, value.minute, value.second, value.microsecond)
+    elif cell_type == xl.XL_CELL_ERROR:
+        value = np.nan
+    elif cell_type == xl.XL_CELL_BOOLEAN:
+        value = bool(value)
+    elif cell_type == xl.XL_CELL_NUMBER and math.isfinite(value):
+        _val = int(value)
+        if _val == value:
+            value = _val
+    return value
+
+def _chunk_df(names: list, chunk: list) -> pd.DataFrame:
+    """将一块数据行按表头宽度补齐或截断后转换为dataframe"""
+    _width = len(names)
+    _data = [names] + [x[:_width] + [''] * (_width - len(x)) for x in chunk]
+    return TextParser(_data, header=0, dtype=str, skip_blank_lines=False).read()
+
+def _trim_data(data: list) -> list:
+    """去除尾部空行，并将各行补齐到相同宽度"""
+    _last = len(data)
+    while _last and not data[_last - 1]:
+        _last -= 1
+    data = data[:_last]
+    if data and (_width := max(map(len, data))) > min(map(len, data)):
+        data = [x + [''] * (_width - len(x)) for x in data]
+    return data
@@ -0,0 +1,20 @@
+import pathlib
+import warnings
+import pytest
+from corelibs.config import load_conf
+
+CONF_DIR = pathlib.Path(__file__).resolve().parents[1].joinpath('config.yaml.d')
+
+@pytest.fixture(autouse=True)
+def conf():
+    """每个测试使用仓库中的配置"""
+    warnings.filterwarnings('ignore', message="Workbook contains no default style, apply openpyxl's default",
+                            category=UserWarning)
+    return load_conf(str(CONF_DIR))
+
+@pytest.fixture
+def case(tmp_path, monkeypatch):
+    """在临时目录中生成央地协查的模拟查询结果（见benchmarks.synth），返回{类型: [文件路径, ...]}"""
+    from benchmarks.synth import make_case
+    monkeypatch.chdir(CONF_DIR.parent)
+    return make_case(tmp_path.joinpath('in'), '央地协查', 50)
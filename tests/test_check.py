@@ -0,0 +1,71 @@
+import csv
+import json
+import pandas as pd
+from corelibs.check import check_statements, summarize_issues, issue_records, ISSUE_FIELDS
+from corelibs.config import get_conf_obj, get_output_dirs
+from corelibs.report import Run_report, REPORT_DIR
+from corelibs.storage import save_statements
+
+
+def _statements(rows: list, acc: str='6200001') -> pd.DataFrame:
+    """生成一个账户按时间排序的流水，rows为[(日期, 出账金额, 入账金额, 余额), ...]"""
+    _df = pd.DataFrame(rows, columns=['日期', '出账金额', '入账金额', '余额'])
+    return _df.assign(日期=pd.to_datetime(_df['日期']), 时间=pd.to_timedelta('10:00:00'), 账号=acc, 卡号=acc,
+                      姓名='张三', 银行='光大银行')
+
+def _found(issues: pd.DataFrame, check: str) -> dict:
+    """返回该校验项未通过的{行索引: 说明}"""
+    _issues = issues[issues['校验'] == check]
+    return dict(zip(_issues.index, _issues['说明']))
+
+def test_balance_breaks_per_account():
+    """余额按账户分别连续，账户的第一笔不与其他账户比较"""
+    _df = pd.concat([_statements([('2024-01-01', None, 100, 100), ('2024-01-02', 30, None, 70), 
+                                  ('2024-01-03', None, 50, 130)]),
+                     _statements([('2024-01-01', 10, 0, 500)], '6200002')], ignore_index=True)
+    assert _found(check_statements(_df, ('balance',)), 'balance') == {2: '余额与上一笔相差10.0'}
+
+def test_in_out_rules():
+    _df = _statements([('2024-01-01', 10, 20, 10), ('2024-01-02', None, 0, 10), ('2024-01-03', 5, None, 5)])
+    assert _found(check_statements(_df, ('in_out',)), 'in_out') == {0: '出账、入账金额同时有值', 
+                                                                    1: '出账、入账金额均为空或0'}
+
+def test_signed_amounts_pass_without_sign_check():
+    """带符号导出金额的银行不配置sign时，负数金额不视为错误；配置sign时报告"""
+    _df = _statements([('2024-01-01', None, 100, 100), ('2024-01-02', -30, None, 130)])
+    assert check_statements(_df, ('in_out', 'date')).empty
+    assert _found(check_statements(_df, ('in_out', 'sign')), 'sign') == {1: '金额为负数'}
+
+def test_date_range():
+    _df = _statements([('2024-01-01', 1, None, 1), (None, 1, None, 0), ('1980-05-01', 1, None, -1), 
+                       ('2099-01-01', 1, None, -2)])
+    assert _found(check_statements(_df, ('date',), '1990-01-01', '2030-12-31'), 'date') == \
+        {1: '日期为空', 2: '日期早于1990-01-01', 3: '日期晚于2030-12-31'}
+    assert list(_found(check_statements(_df, ('date',)), 'date')) == [1, 3] # 默认不限最早日期、最晚为当天
+
+def test_issue_records_and_summary():
+    _df = _statements([('2024-01-01', None, 100, 100), ('2024-01-02', 30, 20, 80), ('2024-01-03', 5, None, 60)])
+    _issues = check_statements(_df, ('balance', 'in_out'))
+    assert summarize_issues(_issues) == {'balance': 2, 'in_out': 1}
+    _records = issue_records(_df, _issues, 'a.xlsx', limit=2)
+    assert len(_records) == 2 and list(_records[0]) == ISSUE_FIELDS
+    assert _records[0] == {'文件': 'a.xlsx', '账号': '6200001', '日期': '2024-01-02', '时间': '10:00:00', 
+                           '出账金额': 30.0, '入账金额': 20.0, '余额': 80.0, '校验': 'balance', 
+                           '说明': '余额与上一笔相差-10.0'}
+
+def test_save_statements_reports_checks(tmp_path, monkeypatch):
+    """保存流水时的校验结果进入运行报告：json中按校验项汇总，明细写入_check.csv，不影响保存"""
+    from corelibs import storage
+    _conf_obj = get_conf_obj('央地协查', '流水')._replace(checks=('balance', 'in_out', 'sign', 'date'))
+    monkeypatch.setattr(storage, 'get_conf_obj', lambda *args: _conf_obj)
+    _df = _statements([('2024-01-01', None, 100, 100), ('2024-01-02', -30, None, 130), 
+                       ('2024-01-03', 5, None, 100)])
+    with Run_report(tmp_path) as _report:
+        assert save_statements([_df], tmp_path, '央地协查', '流水') == 3
+    _path = next((tmp_path / REPORT_DIR).glob('*[0-9].json'))
+    assert json.loads(_path.read_text(encoding='utf-8'))['checks'] == {'balance': {'files': 1, 'rows': 1}, 
+                                                                      'sign': {'files': 1, 'rows': 1}}
+    with open(_path.with_name(f'{_path.stem}_check.csv'), encoding='utf-8-sig') as f:
+        _rows = list(csv.DictReader(f))
+    assert [(x['校验'], x['日期']) for x in _rows] == [('balance', '2024-01-03'), ('sign', '2024-01-02')]
+    assert all(x['文件'].startswith(get_output_dirs('流水')) for x in _rows)
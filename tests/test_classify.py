@@ -0,0 +1,32 @@
+import openpyxl as op
+from benchmarks.synth import read_headers, make_rows
+from corelibs.classify import get_file_layout
+from corelibs.config import get_conf_obj
+from corelibs.process import parse_sources, parse_sheet_chunks
+from tests.conftest import CONF_DIR
+
+
+def _write_padded(path, header, df):
+    """写入表头前有标题行、表头单元格带首尾空白的文件"""
+    _book = op.Workbook()
+    _sheet = _book.active
+    _sheet.append(['账户信息查询结果'])
+    _sheet.append([f' {x} ' for x in header])
+    for _row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+        _sheet.append(_row)
+    _book.save(path)
+
+def test_padded_header_below_title_is_parsed(tmp_path, monkeypatch):
+    """识别出的表头带空白时，读取数据的列名与配置一致，不会因列名不同而出错"""
+    monkeypatch.chdir(CONF_DIR.parent)
+    _header = read_headers()[('央地协查', '账户')]
+    _df = make_rows('央地协查', '账户', _header, 20, ['001', '002'], ('张三', '120101199001011234'))
+    _file = tmp_path / '账户.xlsx'
+    _write_padded(_file, _header, _df)
+    _conf_name, _layout = get_file_layout(_file)
+    assert _conf_name[0] == '央地协查' and _layout['账户'] == [(0, 1)]
+    _conf = get_conf_obj('央地协查', '账户')
+    _parsed = parse_sources(_file, _conf, sources=[(_file, 0, 1)])
+    assert len(_parsed) == 20 and _parsed['账号'].isin(['001', '002']).all()
+    _chunks = list(parse_sheet_chunks(_file, _conf, header=1, chunksize=7))
+    assert sum(map(len, _chunks)) == 20
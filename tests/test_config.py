@@ -0,0 +1,25 @@
+import pickle
+import shutil
+from corelibs import config
+from tests.conftest import CONF_DIR
+
+
+def _cached_sig(conf_dir) -> list:
+    with open(conf_dir / config._COMPILED_FILE, 'rb') as f:
+        return pickle.load(f)[0]
+
+def test_compiled_cache_follows_code(tmp_path, monkeypatch):
+    """编译配置的代码变化后不再使用原有缓存，重新编译并更新缓存"""
+    _dir = tmp_path / 'conf'
+    shutil.copytree(CONF_DIR, _dir, ignore=shutil.ignore_patterns(config._COMPILED_FILE))
+    config.load_conf(str(_dir))
+    assert config._code_md5() in _cached_sig(_dir)
+    monkeypatch.setattr(config, '_code_md5', lambda: 'changed')
+    _compiled = []
+    _compile_conf = config._compile_conf
+    def _counted():
+        _compiled.append(1)
+        return _compile_conf()
+    monkeypatch.setattr(config, '_compile_conf', _counted)
+    config.load_conf(str(_dir))
+    assert _compiled and 'changed' in _cached_sig(_dir)
@@ -0,0 +1,33 @@
+import openpyxl as op
+import pytest
+from corelibs.config import get_conf_obj
+from corelibs.data import parse_sheet_general, parse_sheet_chunks
+
+
+@pytest.fixture
+def extra_col_file(case):
+    """在央地协查模拟流水文件末尾加一列配置中未用到的“附言”"""
+    _file = case['流水'][0]
+    _book = op.load_workbook(_file)
+    _sheet = _book.active
+    _sheet.cell(1, _sheet.max_column + 1, '附言')
+    for _row in range(2, _sheet.max_row + 1):
+        _sheet.cell(_row, _sheet.max_column, f'附言{_row}')
+    _book.save(_file)
+    return _file
+
+def _prefunc(df):
+    """前处理用配置之外的列生成数据"""
+    return df.assign(商户名称=df['附言'])
+
+def test_prefunc_sees_unconfigured_columns(extra_col_file):
+    _conf_obj = get_conf_obj('央地协查', '流水')
+    assert '附言' not in _conf_obj.src_cols
+    _df = parse_sheet_general(extra_col_file, _conf_obj, _prefunc)
+    assert _df['商户名称'].iloc[0] == '附言2'
+    _chunks = list(parse_sheet_chunks(extra_col_file, _conf_obj, _prefunc, chunksize=20))
+    assert sum(len(x) for x in _chunks) == len(_df) and _chunks[0]['商户名称'].iloc[0] == '附言2'
+
+def test_unconfigured_columns_are_pruned_without_prefunc(extra_col_file):
+    _df = parse_sheet_general(extra_col_file, get_conf_obj('央地协查', '流水'))
+    assert '附言' not in _df.columns
@@ -0,0 +1,33 @@
+import pandas as pd
+from corelibs.lookup import Acc_index
+from corelibs.process import fill_stat_cols_by_acc, _build_acc_index
+from corelibs.report import Run_report
+
+
+# 与工商银行网点流水配置相同：以流水账号查找账户信息中的姓名
+_ACC_REL_COLS = {'姓名': ['账号', '姓名', '账号']}
+
+def _acc_info() -> pd.DataFrame:
+    """账户信息中账号A对应两个不同的姓名，B只有一个（重复行和空值不算冲突）"""
+    return pd.DataFrame({'账号': ['A', 'B', 'A', 'B', 'C'], '姓名': ['张三', '王五', '李四', '王五', None]})
+
+def test_conflicting_key_is_not_filled():
+    _index = Acc_index(_acc_info(), _ACC_REL_COLS)
+    _conflicts = _index.conflicts[('账号', '姓名')]
+    assert _conflicts.to_dict('list') == {'账号': ['A', 'A'], '姓名': ['张三', '李四']}
+    _stat = pd.DataFrame({'账号': ['A', 'B', 'C', 'D']})
+    _filled = _index.fill(_stat, _ACC_REL_COLS)
+    assert _filled['姓名'].tolist() == ['A', '王五', 'C', 'D'] # 冲突和找不到的键保留流水原值
+    assert _index.describe_conflicts() == ['账户信息中1个账号对应多个姓名，未用于填充：A']
+
+def test_fill_with_frame_prints_conflicts(capsys):
+    _filled = fill_stat_cols_by_acc(pd.DataFrame({'账号': ['A', 'B']}), _acc_info(), _ACC_REL_COLS)
+    assert _filled['姓名'].tolist() == ['A', '王五']
+    assert '1个账号对应多个姓名' in capsys.readouterr().out
+
+def test_conflicts_reach_run_report(tmp_path):
+    """批量处理时关联键冲突记入运行报告的warnings"""
+    _report = Run_report(tmp_path, enabled=False)
+    _index = _build_acc_index('工商银行网点', _acc_info(), _report)
+    assert _report.warnings == ['工商银行网点:账户信息中1个账号对应多个姓名，未用于填充：A']
+    assert _index.fill(pd.DataFrame({'账号': ['A']}), _ACC_REL_COLS)['姓名'].tolist() == ['A']
@@ -0,0 +1,12 @@
+from corelibs.__main__ import main, EXIT_OK
+from tests.conftest import CONF_DIR
+
+
+def test_second_run_exits_ok(case, tmp_path):
+    """已完成的目录再次运行（如中断后用同样的命令续跑）时全部跳过，退出码为0"""
+    _argv = ['run', '--bank', 'yangdi', str(case['流水'][0].parent), '--out', str(tmp_path / 'out'), 
+             '--conf', str(CONF_DIR), '--jobs', '1']
+    assert main(_argv) == EXIT_OK
+    assert main(_argv) == EXIT_OK
+    _batches = sorted((tmp_path / 'out' / '0运行报告').glob('*_batch.json'))
+    assert _batches and '"status": "ok"' in _batches[-1].read_text(encoding='utf-8')
@@ -0,0 +1,41 @@
+from banks.yangdi import process_dir_yangdi
+
+
+def test_second_run_skips_finished_directory(case, tmp_path):
+    """同一目录再次处理时，已处理且未变化的文件全部跳过"""
+    _dir = case['流水'][0].parent
+    _out = tmp_path / 'out'
+    _df_acc, _errors = process_dir_yangdi(_dir, _out, jobs=1, on_error='continue', incremental=True)
+    assert not _errors and _df_acc is not None
+    _saved = sorted(x for x in _out.rglob('*') if x.is_file() and '0运行报告' not in x.parts
+                    and not any(y.startswith('.') for y in x.relative_to(_out).parts)) # 处理清单、缓存和索引除外
+    _mtimes = [x.stat().st_mtime_ns for x in _saved]
+    assert process_dir_yangdi(_dir, _out, jobs=1, on_error='continue', incremental=True) == [None, {}]
+    assert [x.stat().st_mtime_ns for x in _saved] == _mtimes
+
+def test_chunked_shared_sheet_is_not_read_whole(case, tmp_path, monkeypatch):
+    """多种类型共用含流水的数据表且分块解析时，不按各类型所需列的并集整表读取，流水逐块读取"""
+    from corelibs import process
+    from corelibs.config import get_conf_data, get_conf_obj
+    from corelibs.workbook import Workbook_handle
+    _file = case['流水'][0]
+    monkeypatch.setattr(process, 'get_file_layout', 
+                        lambda *args: (['央地协查', '账户', '流水'], {'账户': [(0, 0)], '流水': [(0, 0)]}))
+    get_conf_data()['base_config']['chunk_rows'] = 10
+    _read_df, _reads = Workbook_handle.read_df, []
+    def _recorded(self, header=0, usecols=None):
+        _reads.append(usecols)
+        return _read_df(self, header, usecols)
+    monkeypatch.setattr(Workbook_handle, 'read_df', _recorded)
+    _conf_name, _parsed = process._parse_file_job((_file, None, tmp_path / 'out'))
+    _stat_cols = get_conf_obj('央地协查', '流水').src_cols - get_conf_obj('央地协查', '账户').src_cols
+    assert not [x for x in _reads if x is None or x & _stat_cols]
+    _type, _spool, _err = _parsed[1]
+    assert _type == '流水' and _err is None
+    assert sum(len(x) for x in _spool.accounts()) == 50
+
+def test_get_file_type_is_exported():
+    """get_file_type原在process中定义，from corelibs.process import *的调用方仍可使用"""
+    _names = {}
+    exec('from corelibs.process import *', _names)
+    assert 'get_file_type' in _names
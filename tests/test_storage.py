@@ -0,0 +1,106 @@
+import os
+import pandas as pd
+import pytest
+from corelibs.config import get_conf_obj, get_conf_data, get_output_dirs
+from corelibs.data import parse_sheet_general
+from corelibs.process import parse_statement_file, split_statements
+from corelibs.storage import save_general, save_statements, compact_general, _read_as_format, _write_as_format, \
+    _HASH_INDEX_CACHE
+
+
+def _general_df(bank_name: str, file_type: str, names: list) -> pd.DataFrame:
+    _cols = get_conf_obj(bank_name, file_type).cols_new_order
+    return pd.DataFrame({x: [f'{x}{n}' for n in names] for x in dict.fromkeys(_cols)})
+
+def test_compact_general_follows_part_order(tmp_path):
+    """分区按编号合并，与分区文件的写入完成时间无关"""
+    for _names in (['a1', 'a2'], ['b1'], ['c1']):
+        save_general(_general_df('央地协查', '客户', _names), tmp_path, '央地协查', '客户')
+    _parts = sorted((tmp_path / '1银行客户' / '央地协查.parts').glob('*.xlsx'))
+    assert [x.stem for x in _parts] == ['00000', '00001', '00002']
+    for i, _part in enumerate(_parts): # 先编号的分区最后写完
+        os.utime(_part, ns=(10**18 - i * 10**9, 10**18 - i * 10**9))
+    assert compact_general(tmp_path, '客户', '央地协查') == 1
+    _merged = _read_as_format(tmp_path / '1银行客户' / '央地协查.xlsx', 'xlsx')
+    assert _merged['姓名'].tolist() == ['姓名a1', '姓名a2', '姓名b1', '姓名c1']
+
+def _clear_indexes(root):
+    """删除全部行哈希索引，使下次保存时从已保存的文件重建"""
+    for _file in list(root.rglob('*.hash.npy')) + list(root.rglob('.key')):
+        _file.unlink()
+
+@pytest.mark.parametrize('output_format', ['', 'csv', 'parquet'])
+def test_rebuilt_index_dedups_saved_rows(case, tmp_path, output_format):
+    """从已保存的文件重建索引后，再次保存同样的解析结果时全部视为重复行"""
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    get_conf_data()['base_config']['output_format'] = output_format
+    _out = tmp_path / 'out'
+    _df_acc = parse_sheet_general(case['账户'][0], get_conf_obj('央地协查', '账户'))
+    _df_stat = parse_statement_file(case['流水'][0], '央地协查', '流水', df_acc=_df_acc)
+    assert save_general(_df_acc, _out, '央地协查', '账户') == len(_df_acc)
+    assert save_statements(split_statements(_df_stat), _out, '央地协查', '流水') == len(_df_stat)
+    _clear_indexes(_out)
+    _HASH_INDEX_CACHE.clear()
+    assert save_general(_df_acc, _out, '央地协查', '账户') == 0
+    assert save_statements(split_statements(_df_stat), _out, '央地协查', '流水') == 0
+
+def test_legacy_general_file_is_deduped(case, tmp_path):
+    """旧版本保存的单一文件导入为第一个分区后，其中的行不再重复保存"""
+    _df_acc = parse_sheet_general(case['账户'][0], get_conf_obj('央地协查', '账户'))
+    _dir = tmp_path / '2银行账户'
+    _dir.mkdir()
+    _write_as_format(_df_acc, _dir / '央地协查.xlsx', 'xlsx')
+    assert save_general(_df_acc, tmp_path, '央地协查', '账户') == 0
+
+def _statement_df(rows: list) -> pd.DataFrame:
+    """生成一个账户的流水，rows为[(日期, 出账金额, 入账金额, 余额), ...]"""
+    _df = pd.DataFrame(rows, columns=['日期', '出账金额', '入账金额', '余额'])
+    return _df.assign(日期=pd.to_datetime(_df['日期']), 时间=pd.to_timedelta('10:00:00'), 姓名='张三', 
+                      银行='光大银行', 账号='6200001', 卡号='6200001')
+
+def test_overlapping_statements_have_no_false_breaks(tmp_path, monkeypatch):
+    """与已保存流水重叠的部分去除后余额不再连续，但校验按包含重叠部分的完整流水进行，不误报"""
+    from corelibs import storage
+    from corelibs.report import collect
+    _conf_obj = get_conf_obj('央地协查', '流水')._replace(checks=('balance',))
+    monkeypatch.setattr(storage, 'get_conf_obj', lambda *args: _conf_obj)
+    _rows = [('2024-01-01', 0, 100, 100), ('2024-01-02', 30, 0, 70), ('2024-01-03', 0, 50, 120), 
+             ('2024-01-04', 20, 0, 100)]
+    assert save_statements([_statement_df(_rows[::2])], tmp_path, '央地协查', '流水') == 2
+    with collect() as _records:
+        assert save_statements([_statement_df(_rows[::-1])], tmp_path, '央地协查', '流水') == 2
+    _checks = [x for x in _records if x['stage'] == 'check']
+    assert len(_checks) == 1 and _checks[0]['rows'] == 0
+
+def test_async_writer_reserves_colliding_names(tmp_path):
+    """写入进程尚未写完时，同名文件按已分配的名称加'_'区分；写入完成回调和查询文书记录按保存次序"""
+    from corelibs.storage import Output_writer, _DOC_NO_FILE
+    _done = []
+    with Output_writer(workers=2) as _writer:
+        for i in range(4): # 各次的行不同，但条数、最大金额和卡号相同，因此文件名相同
+            _df = _statement_df([(f'2024-0{i + 1}-01', 0, 100, 100 + i), (f'2024-0{i + 1}-02', 50, 0, 50 + i)])
+            _written = []
+            assert save_statements([_df], tmp_path, '央地协查', '流水', f'文书{i}', _written, _writer) == 2
+            _writer.then(_written, lambda exc, n=_written[0].name: _done.append((n, exc)))
+    _names = [x for x, _ in _done]
+    assert len(set(_names)) == 4 and all(exc is None for _, exc in _done)
+    assert [len(x) - len(_names[0]) for x in _names] == [0, 1, 2, 3] # 依次加'_'
+    _files = sorted((tmp_path / get_output_dirs('流水')).rglob('*.xlsx'))
+    assert sorted(x.name for x in _files) == sorted(_names)
+    assert sorted(_read_as_format(x, 'xlsx')['余额'].astype(float).min() for x in _files) == [50, 51, 52, 53]
+    _log = (tmp_path / _DOC_NO_FILE).read_text().splitlines()
+    assert [x.split(',')[0] for x in _log] == ['文书0', '文书1', '文书2', '文书3']
+
+def test_async_writer_matches_sync_output(case, tmp_path):
+    """writer_workers为2时输出的文件和查询文书记录与同步写入一致"""
+    from banks.yangdi import process_dir_yangdi
+    from corelibs.storage import _DOC_NO_FILE
+    _outputs = []
+    for _workers in (0, 2):
+        _out = tmp_path / f'out{_workers}'
+        assert process_dir_yangdi(case['流水'][0].parent, _out, '文书1', jobs=1, on_error='continue', 
+                                  writer_workers=_workers)[1] == {}
+        _files = sorted(str(x.relative_to(_out)) for x in _out.rglob('*.xlsx'))
+        _outputs.append((_files, (_out / _DOC_NO_FILE).read_text()))
+    assert _outputs[0] == _outputs[1] and _outputs[0][0]
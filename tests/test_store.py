@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+from corelibs.config import get_conf_data, get_output_dirs
+from corelibs.store import Statement_store, STORE_COLS, STORE_FILE, open_store
+
+
+def _statements(name: str, bank: str, acc: str, rows: list) -> pd.DataFrame:
+    """生成解析结果形式的流水，rows为[(日期, 时间, 出账金额, 入账金额, 对方账号, 对方户名), ...]"""
+    _df = pd.DataFrame(rows, columns=['日期', '时间', '出账金额', '入账金额', '对方账号', '对方户名'])
+    return _df.assign(日期=pd.to_datetime(_df['日期']), 时间=pd.to_timedelta(_df['时间']), 姓名=name, 
+                      银行=bank, 账号=acc, 卡号=f'{acc}9', 余额=1000.0)
+
+@pytest.fixture
+def store(tmp_path):
+    with Statement_store(tmp_path / STORE_FILE) as _store:
+        _store.add(_statements('张三', '光大银行', '001', [('2024-01-05', '09:00:00', 600000, None, 'X1', '甲公司'),
+                                                         ('2024-01-02', '10:30:00', None, 200, 'X2', '乙'),
+                                                         ('2024-02-01', '08:00:00', 50, None, None, None)]), 
+                   '3银行流水/张三/光大/a.xlsx')
+        _store.add(_statements('李四', '建设银行', '002', [('2024-01-03', '12:00:00', None, 700000, 'X1', '甲公司'),
+                                                         ('2024-03-01', '12:00:00', 10, None, 'X3', '丙')]), 
+                   '3银行流水/李四/建行/b.xlsx')
+        _store.add(_statements('王五', '光大银行', '003', [('2024-01-04', '12:00:00', 30, None, 'X1', '甲')]), 
+                   '3银行流水/王五/光大/c.xlsx')
+        yield _store
+
+def test_query_round_trip(store):
+    _df = store.query('张三')
+    assert list(_df.columns) == STORE_COLS and pd.api.types.is_datetime64_any_dtype(_df['日期'])
+    assert _df['时间'].tolist() == ['10:30:00', '09:00:00', '08:00:00'] # 按日期、时间排序
+    assert _df[['出账金额', '入账金额']].iloc[0].isna().tolist() == [True, False]
+
+def test_query_filters(store):
+    assert store.query(bank='光大银行')['姓名'].tolist() == ['张三'] * 3 + ['王五']
+    assert store.query(account='0029')['姓名'].tolist() == ['李四'] * 2 # 卡号也可匹配
+    assert store.query(counter_account=['X1', 'X3'], name=['李四'])['对方账号'].tolist() == ['X1', 'X3']
+    assert store.query(start='2024-01-03', end=pd.Timestamp('2024-01-05'))['日期'].dt.day.tolist() == [5, 3, 4]
+    _big = store.query(min_amount=500000, columns=['姓名', '出账金额', '入账金额'])
+    assert list(_big.columns) == ['姓名', '出账金额', '入账金额'] and _big['姓名'].tolist() == ['张三', '李四']
+    assert store.query(min_amount=30, max_amount=200)['姓名'].tolist() == ['张三', '张三', '王五']
+    assert store.query('张三', start='2025-01-01').empty
+
+def test_shared_counterparties(store):
+    _shared = store.shared_counterparties(['张三', '李四', '王五'])
+    assert _shared.to_dict('records') == [{'对方账号': 'X1', '对方户名': '甲公司', '人数': 3, '交易笔数': 3, 
+                                           '出账合计': 600030.0, '入账合计': 700000.0}]
+    assert store.shared_counterparties(['张三', '李四'], min_persons=1)['对方账号'].tolist() == ['X1', 'X2', 'X3']
+
+def test_persons(store):
+    assert store.persons().to_dict('records') == [
+        {'姓名': '张三', '银行': '光大银行', '条数': 3, '起始日期': '2024-01-02', '截止日期': '2024-02-01'},
+        {'姓名': '李四', '银行': '建设银行', '条数': 2, '起始日期': '2024-01-03', '截止日期': '2024-03-01'},
+        {'姓名': '王五', '银行': '光大银行', '条数': 1, '起始日期': '2024-01-04', '截止日期': '2024-01-04'}]
+
+def test_same_source_replaces_rows(store, tmp_path):
+    """同一来源再次加入时替换原有的行，不产生重复；删除来源时删除其全部行"""
+    _df = _statements('张三', '光大银行', '001', [('2024-01-05', '09:00:00', 1, None, 'X1', '甲公司')])
+    assert store.add(_df, '3银行流水/张三/光大/a.xlsx') == 1
+    assert store.query('张三')['出账金额'].tolist() == [1.0]
+    store.close()
+    with open_store(tmp_path) as _store: # 重新打开，确认已写入文件
+        assert len(_store.query()) == 4
+        assert _store.remove(['3银行流水/李四/建行/b.xlsx', '不存在']) == 2
+        assert _store.persons()['姓名'].tolist() == ['张三', '王五']
+
+def test_saved_statements_enter_store_once(case, tmp_path):
+    """开启analysis_store后重复处理同一目录，流水库中的行与保存的流水一致、不重复；重建流水库结果相同"""
+    from banks.yangdi import process_dir_yangdi
+    from corelibs.storage import rebuild_store
+    get_conf_data()['base_config']['analysis_store'] = True
+    _out = tmp_path / 'out'
+    for _ in range(2):
+        assert process_dir_yangdi(case['流水'][0].parent, _out, jobs=1, on_error='continue')[1] == {}
+    with open_store(_out) as _store:
+        _df = _store.query()
+    assert len(_df) == 50 and not _df.duplicated().any()
+    assert _df['姓名'].unique().tolist() == ['张三']
+    assert rebuild_store(_out) == 50
+    with open_store(_out) as _store:
+        assert len(_store.query()) == 50
+    assert len(list((_out / get_output_dirs('流水')).rglob('*.xlsx'))) == _df['卡号'].nunique() # 每个账户一个文件
@@ -0,0 +1,51 @@
+import datetime
+import openpyxl as op
+import pandas as pd
+from corelibs.header import read_head_rows, read_sheets_head_rows
+from corelibs.workbook import Workbook_handle
+
+
+def _write_book(path, rows):
+    _book = op.Workbook()
+    _sheet = _book.active
+    for _row in rows:
+        _sheet.append(_row)
+    _book.save(path)
+
+def test_read_df_matches_read_excel(tmp_path):
+    """公式、日期、时间单元格和中间的空行与pd.read_excel(dtype=str)读出的内容一致"""
+    _file = tmp_path / 'book.xlsx'
+    _write_book(_file, [['账号', '日期', '时间', '金额', '公式'],
+                        ['001', datetime.datetime(2022, 1, 2, 3, 4, 5), datetime.time(12, 30), 1.5, '=1+1'],
+                        [None, None, None, None, None],
+                        ['002', datetime.date(2022, 1, 3), None, 2.0, '=D2*2'],
+                        [None, None, None, None, None]])
+    with Workbook_handle(_file) as _book:
+        _df = _book.read_df()
+    pd.testing.assert_frame_equal(_df, pd.read_excel(_file, dtype=str))
+    assert _df['公式'].isna().all() # 未经Excel计算的公式没有缓存值
+
+def test_read_df_usecols(tmp_path):
+    _file = tmp_path / 'book.xlsx'
+    _write_book(_file, [['a', 'b', 'c'], ['1', '=1+1', '3']])
+    with Workbook_handle(_file) as _book:
+        _df = _book.read_df(usecols=frozenset(['a', 'b']))
+    pd.testing.assert_frame_equal(_df, pd.read_excel(_file, dtype=str, usecols=['a', 'b']))
+
+def test_fast_head_rows_match_workbook_handle(tmp_path):
+    """直接解析XML读取的前几行与Workbook_handle读出的行一致：日期、时间、公式、布尔值和空单元格"""
+    _file = tmp_path / 'book.xlsx'
+    _book = op.Workbook()
+    _book.active.append(['标题'])
+    _book.active.append(['账号', '日期', '时间', '日期时间', '公式', '布尔', None, '金额'])
+    _book.active.append(['001', datetime.date(2022, 1, 2), datetime.time(12, 30), datetime.datetime(2022, 1, 2, 3, 4, 5),
+                         '=1+1', True, None, 1.5])
+    _book.active['H3'].number_format = '0.00'
+    _book.create_sheet('说明').append([datetime.datetime(2023, 5, 6), 'x'])
+    _book.save(_file)
+    _rows = read_head_rows(_file, nrows=5)
+    with Workbook_handle(_file) as _handle:
+        assert _rows == _handle.head_rows(5)
+    assert _rows[2][1] == datetime.datetime(2022, 1, 2) and _rows[2][2] == datetime.time(12, 30)
+    with Workbook_handle(_file) as _handle:
+        assert read_sheets_head_rows(_file, 5) == _handle.sheets_head_rows(5)